@@ -16,6 +16,7 @@ gettext to internationalize messages.
 """
 __version__ = "4.6.0"
 
+import importlib
 import os
 import sys
 
@@ -41,6 +42,39 @@ except NameError:
     ModuleNotFoundError = ImportError
 
 
+# the local subcommands that may exist on the system, in the format
+# (module, class, [aliases]), where aliases is a list of shorthand names to
+# accept in place of the full subcommand. Subcommands are only imported when
+# they are used, so that e.g. `sos report -l` does not also have to import
+# the collector and its dependencies
+COMPONENTS = {
+    'report': ('sos.report', 'SoSReport', ['rep']),
+    'clean': ('sos.cleaner', 'SoSCleaner', ['cleaner', 'mask']),
+    'help': ('sos.help', 'SoSHelper', []),
+    'collect': ('sos.collector', 'SoSCollector', ['collector'])
+}
+
+
+class _SoSParser(ArgumentParser):
+    """The top-level parser, whose usage message lists every subcommand. As
+    building that message means importing every subcommand, it is only built
+    when it is shown.
+    """
+
+    def __init__(self, get_usage, **kwargs):
+        self._get_usage = get_usage
+        super().__init__(**kwargs)
+
+    @property
+    def usage(self):
+        return self._get_usage()
+
+    @usage.setter
+    def usage(self, usage):
+        # the usage message is always built by _get_usage()
+        pass
+
+
 class SoS():
     """Main entrypoint for sos from the command line
 
@@ -52,58 +86,28 @@ class SoS():
 
     def __init__(self, args):
         self.cmdline = args
-        # define the local subcommands that exist on the system
-        # first import the necessary module, then add an entry to the dict that
-        # follows the tuple format (class, [aliases]), where aliases is a list
-        # of shorthand names to accept in place of the full subcommand
-        # if no aliases are desired, pass an empty list
-        import sos.report
-        import sos.cleaner
-        import sos.help
-        self._components = {
-            'report': (sos.report.SoSReport, ['rep']),
-            'clean': (sos.cleaner.SoSCleaner, ['cleaner', 'mask']),
-            'help': (sos.help.SoSHelper, [])
-        }
-        # some distros do not want pexpect as a default dep, so try to load
-        # collector here, and if it fails add an entry that implies it is at
-        # least present on this installation
-        try:
-            import sos.collector
-            self._components['collect'] = (sos.collector.SoSCollector,
-                                           ['collector'])
-        except ModuleNotFoundError as err:
-            import sos.missing
-            if 'sos.collector' in err.msg:
-                # is not locally installed - packaged separately
-                self._components['collect'] = (sos.missing.MissingCollect, [])
-            elif 'pexpect' in err.msg:
-                # cannot be imported due to missing the pexpect dep
-                self._components['collect'] = (sos.missing.MissingPexpect, [])
-            else:
-                # we failed elsewhere, re-raise the exception
-                raise
-        # build the top-level parser
-        _com_string = ''
+        # load only the requested subcommand if one was given, otherwise all
+        # of them so that they can be listed. Each entry of the dict follows
+        # the tuple format (class, [aliases])
+        self._components = {}
+        _requested = self._get_requested_component(args)
+        for com in [_requested] if _requested else COMPONENTS:
+            self._components[com] = (self._load_component(com),
+                                     list(COMPONENTS[com][2]))
         for com in self._components:
-            aliases = self._components[com][1]
-            aliases.insert(0, com)
-            _com = ', '.join(aliases)
-            desc = self._components[com][0].desc
-            _com_string += (
-                "\t{com:<30}{desc}\n".format(com=_com, desc=desc)
-            )
-        usage_string = ("%(prog)s <component> [options]\n\n"
-                        "Available components:\n")
-        usage_string = usage_string + _com_string
+            self._components[com][1].insert(0, com)
+        # build the top-level parser
         epilog = ("See `sos <component> --help` for more information")
-        self.parser = ArgumentParser(usage=usage_string, epilog=epilog)
+        self.parser = _SoSParser(self._get_usage, epilog=epilog)
         self.parser.register('action', 'extend', SosListOption)
         # set the component subparsers
         self.subparsers = self.parser.add_subparsers(
             dest='component',
             metavar='component',
-            help='sos component to run'
+            help='sos component to run',
+            # set so that the usage message is not built to derive it
+            prog=self.parser.prog,
+            parser_class=ArgumentParser
         )
         self.subparsers.required = True
         # now build the parser for each component.
@@ -117,13 +121,64 @@ class SoS():
             )
             _com_subparser.usage = "sos %s [options]" % comp
             _com_subparser.register('action', 'extend', SosListOption)
-            self._add_common_options(_com_subparser)
+            self._add_common_options(_com_subparser,
+                                     self._components[comp][0])
             self._components[comp][0].add_parser_options(parser=_com_subparser)
             _com_subparser.set_defaults(component=comp)
         self.args = self.parser.parse_args(self.cmdline)
         self._init_component()
 
-    def _add_common_options(self, parser):
+    def _get_requested_component(self, args):
+        """Get the name of the subcommand given on the command line, if any
+        """
+        if args:
+            for com, (_, _, aliases) in COMPONENTS.items():
+                if args[0] == com or args[0] in aliases:
+                    return com
+        return None
+
+    def _load_component(self, name):
+        """Import a subcommand, returning the class that implements it
+        """
+        module, class_name, _ = COMPONENTS[name]
+        try:
+            return getattr(importlib.import_module(module), class_name)
+        except ModuleNotFoundError as err:
+            # some distros do not want pexpect as a default dep, so if the
+            # collector fails to load return a placeholder that implies it is
+            # at least present on this installation
+            if name != 'collect':
+                raise
+            import sos.missing
+            if 'sos.collector' in err.msg:
+                # is not locally installed - packaged separately
+                return sos.missing.MissingCollect
+            elif 'pexpect' in err.msg:
+                # cannot be imported due to missing the pexpect dep
+                return sos.missing.MissingPexpect
+            # we failed elsewhere, re-raise the exception
+            raise
+
+    def _get_usage(self):
+        """Build the usage message of the top-level parser, which lists every
+        available subcommand whether or not it has been loaded
+        """
+        _com_string = ''
+        for com in COMPONENTS:
+            if com in self._components:
+                _class, aliases = self._components[com]
+            else:
+                _class = self._load_component(com)
+                aliases = [com] + COMPONENTS[com][2]
+            _com = ', '.join(aliases)
+            _com_string += (
+                "\t{com:<30}{desc}\n".format(com=_com, desc=_class.desc)
+            )
+        usage_string = ("%(prog)s <component> [options]\n\n"
+                        "Available components:\n")
+        return usage_string + _com_string
+
+    def _add_common_options(self, parser, component):
         """Adds the options shared across components to the parser
         """
         global_grp = parser.add_argument_group('Global Options')
@@ -154,7 +209,7 @@ class SoS():
 
         global_grp.add_argument('-z', '--compression-type',
                                 dest="compression_type",
-                                choices=['auto', 'gzip', 'xz'],
+                                choices=component.compression_types,
                                 help="compression technology to use")
 
         # Group to make tarball encryption (via GPG/password) exclusive
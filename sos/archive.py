@@ -9,14 +9,19 @@
 # version 2 of the GNU General Public License.
 #
 # See the LICENSE file in the source distribution for further information.
+import io
 import os
 import tarfile
 import shutil
 import logging
 import codecs
 import errno
+import fcntl
+import gzip
 import stat
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from threading import Lock
 
@@ -28,11 +33,30 @@ try:
 except ImportError:
     pass
 
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 P_FILE = "file"
 P_LINK = "link"
 P_NODE = "node"
 P_DIR = "dir"
 
+# ioctl request to share the data blocks of one file with another, on file
+# systems that support reflinks
+FICLONE = 0x40049409
+# maximum amount of data to copy in the kernel with a single call
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# largest file to stream to the final archive, since a streamed file is read
+# into memory to check its size before it is written
+STREAM_MAX_SIZE = 16 * 1024 * 1024
+
 
 class Archive(object):
     """Abstract base class for archives."""
@@ -73,7 +97,7 @@ class Archive(object):
     # this is our contract to clients of the Archive class hierarchy.
     # All sub-classes need to implement these methods (or inherit concrete
     # implementations from a parent class.
-    def add_file(self, src, dest=None, force=False):
+    def add_file(self, src, dest=None, force=False, stream=False):
         raise NotImplementedError
 
     def add_string(self, content, dest, mode='w'):
@@ -133,6 +157,9 @@ class FileCacheArchive(Archive):
     _archive_root = ""
     _archive_name = ""
 
+    # number of locks to spread writes to individual paths over
+    _write_lock_count = 64
+
     def __init__(self, name, tmpdir, policy, threads, enc_opts, sysroot,
                  manifest=None):
         self._name = name
@@ -146,6 +173,13 @@ class FileCacheArchive(Archive):
         self.sysroot = sysroot or '/'
         self.manifest = manifest
         self._archive_root = os.path.join(tmpdir, name)
+        # destinations that are being written outside of the path lock
+        self._pending_paths = set()
+        # devices of source files that a copy method has failed for
+        self._no_reflink = set()
+        self._no_copy_range = set()
+        self._write_locks = [Lock() for i in range(self._write_lock_count)]
+        self._pseudo_devs = self._get_pseudo_devs()
         with self._path_lock:
             os.makedirs(self._archive_root, 0o700)
         self.log_info("initialised empty FileCacheArchive at '%s'" %
@@ -163,6 +197,38 @@ class FileCacheArchive(Archive):
             path = path[1:]
         return os.path.join(self.sysroot, path)
 
+    def _get_pseudo_devs(self):
+        """Get the devices of the /proc and /sys file systems of the host and
+        of the sysroot, where those are mounted.
+        """
+        devs = set()
+        for root in set(['/', self.sysroot]):
+            for name in ('proc', 'sys'):
+                try:
+                    _st = os.stat(os.path.join(root, name))
+                    # not mounted if on the same device as the root
+                    if _st.st_dev != os.stat(root).st_dev:
+                        devs.add(_st.st_dev)
+                except OSError:
+                    continue
+        return devs
+
+    def _is_pseudo_file(self, src, fstat=None):
+        """Check if a source file is on /proc or /sys, below the sysroot or
+        not, where the size reported for a file is unreliable and the kernel
+        copy methods do not work for many files.
+
+        :param src:     The path of the file on the host
+        :param fstat:   The stat result of the open file, if it is open
+        """
+        path = src
+        root = self.sysroot.rstrip(os.sep)
+        if root and path.startswith(root + os.sep):
+            path = path[len(root):]
+        if path.startswith(("/sys/", "/proc/")):
+            return True
+        return fstat is not None and fstat.st_dev in self._pseudo_devs
+
     def _make_leading_paths(self, src, mode=0o700):
         """Create leading path components
 
@@ -313,6 +379,13 @@ class FileCacheArchive(Archive):
         if force:
             return dest
 
+        # Path is being copied by another thread: skip
+        if dest in self._pending_paths:
+            if path_type != P_FILE:
+                raise ValueError("path '%s' exists and is not a %s"
+                                 % (dest, path_type))
+            return None
+
         # Check destination path presence and type
         if os.path.exists(dest):
             # Use lstat: we care about the current object, not the referent.
@@ -330,11 +403,25 @@ class FileCacheArchive(Archive):
             return None
         return dest
 
+    def stream_file(self, src, dest):
+        """Write a file that will not be modified after collection directly
+        to the final archive, rather than copying it to the archive root.
+
+        Archive types that do not support this should return False, so that
+        the file is copied to the archive root as normal.
+
+        :param src:     The path of the file on the host
+        :param dest:    The destination path of the file in the archive root
+        :returns:       ``True`` if the file was written to the archive, else
+                        ``False``
+        """
+        return False
+
     def _copy_attributes(self, src, dest):
         # copy file attributes, skip SELinux xattrs for /sys and /proc
         try:
             stat = os.stat(src)
-            if src.startswith("/sys/") or src.startswith("/proc/"):
+            if self._is_pseudo_file(src, stat):
                 shutil.copymode(src, dest)
                 os.utime(dest, ns=(stat.st_atime_ns, stat.st_mtime_ns))
             else:
@@ -344,71 +431,224 @@ class FileCacheArchive(Archive):
             self.log_debug("caught '%s' setting attributes of '%s'"
                            % (e, dest))
 
-    def add_file(self, src, dest=None, force=False):
-        with self._path_lock:
-            if not dest:
-                dest = src
+    def _copy_file(self, src, dest):
+        """Copy a file into the archive along with its mode, times, ownership
+        and extended attributes, using the stat result of the open source
+        file rather than looking each of these up again.
 
-            dest = self.check_path(dest, P_FILE, force=force)
-            if not dest:
+        The file data is copied in the kernel where possible. See
+        `_copy_file_data()`.
+        """
+        virtual = self._is_pseudo_file(src)
+        flags = os.O_RDONLY | os.O_CLOEXEC
+        if not virtual:
+            # do not block opening a fifo, which is rejected below
+            flags |= os.O_NONBLOCK
+        src_fd = os.open(src, flags)
+        try:
+            fstat = os.fstat(src_fd)
+            virtual = virtual or self._is_pseudo_file(src, fstat)
+            if not virtual and not stat.S_ISREG(fstat.st_mode):
+                raise shutil.SpecialFileError("'%s' is not a regular file"
+                                              % src)
+            dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                              os.O_CLOEXEC, 0o600)
+            try:
+                if virtual:
+                    # the size of virtual files is unreliable, and the kernel
+                    # copy methods do not work with many of them
+                    self._copy_file_data_user(src_fd, dest_fd)
+                else:
+                    self._copy_file_data(src_fd, dest_fd, fstat.st_dev)
+            finally:
+                self._set_attributes(dest, src_fd, dest_fd, fstat,
+                                     xattrs=not virtual)
+                os.close(dest_fd)
+        finally:
+            os.close(src_fd)
+
+    def _copy_file_data(self, src_fd, dest_fd, dev):
+        """Copy the data of a file by reflink if the archive and source file
+        systems allow it, and otherwise by copy_file_range() or sendfile(),
+        so that the data does not need to pass through user space. Methods
+        that fail for a source device are not tried again for it, and if
+        neither copy_file_range() nor sendfile() copy anything, the file is
+        read in user space in case its reported size is not its real size.
+        """
+        if dev not in self._no_reflink:
+            try:
+                fcntl.ioctl(dest_fd, FICLONE, src_fd)
                 return
+            except OSError:
+                self._no_reflink.add(dev)
+        if hasattr(os, 'copy_file_range') and dev not in self._no_copy_range:
+            try:
+                copied = 0
+                while True:
+                    _copied = os.copy_file_range(src_fd, dest_fd,
+                                                 COPY_CHUNK_SIZE)
+                    if not _copied:
+                        break
+                    copied += _copied
+                if copied:
+                    return
+            except OSError as err:
+                if err.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                     errno.EOPNOTSUPP, errno.EPERM):
+                    raise
+                self._no_copy_range.add(dev)
+        # any data already copied has advanced both file offsets, so carry
+        # on from there
+        copied = 0
+        try:
+            while True:
+                _copied = os.sendfile(dest_fd, src_fd, None, COPY_CHUNK_SIZE)
+                if not _copied:
+                    break
+                copied += _copied
+        except OSError as err:
+            if err.errno not in (errno.ENOSYS, errno.EINVAL):
+                raise
+            copied = 0
+        if not copied:
+            self._copy_file_data_user(src_fd, dest_fd)
+
+    def _copy_file_data_user(self, src_fd, dest_fd):
+        while True:
+            buf = os.read(src_fd, 1024 * 1024)
+            if not buf:
+                return
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(dest_fd, view):]
 
-            # Handle adding a file from either a string respresenting
-            # a path, or a File object open for reading.
-            if not getattr(src, "read", None):
-                # path case
-                try:
-                    shutil.copy(src, dest)
-                except OSError as e:
-                    # Filter out IO errors on virtual file systems.
-                    if src.startswith("/sys/") or src.startswith("/proc/"):
-                        pass
-                    else:
-                        self.log_info("File %s not collected: '%s'" % (src, e))
+    def _set_attributes(self, dest, src_fd, dest_fd, fstat, xattrs=True):
+        """Set the attributes of a copied file from the stat result of its
+        source, the same as `_copy_attributes()`.
+        """
+        try:
+            os.utime(dest_fd, ns=(fstat.st_atime_ns, fstat.st_mtime_ns))
+            if xattrs:
+                for name in os.listxattr(src_fd):
+                    try:
+                        os.setxattr(dest_fd, name, os.getxattr(src_fd, name))
+                    except OSError as err:
+                        if err.errno not in (errno.EPERM, errno.ENOTSUP,
+                                             errno.ENODATA, errno.EINVAL):
+                            raise
+            os.chmod(dest_fd, stat.S_IMODE(fstat.st_mode))
+            os.chown(dest_fd, fstat.st_uid, fstat.st_gid)
+        except Exception as e:
+            self.log_debug("caught '%s' setting attributes of '%s'"
+                           % (e, dest))
 
-                self._copy_attributes(src, dest)
-                file_name = "'%s'" % src
-            else:
-                # Open file case: first rewind the file to obtain
-                # everything written to it.
-                src.seek(0)
-                with open(dest, "w") as f:
-                    for line in src:
-                        f.write(line)
-                file_name = "open file"
+    def _write_lock(self, dest):
+        """Get the lock that serializes writes to a destination path, so that
+        writes to different paths may happen at the same time.
+        """
+        return self._write_locks[hash(dest) % len(self._write_locks)]
 
-            self.log_debug("added %s to FileCacheArchive '%s'" %
-                           (file_name, self._archive_root))
+    def _reserve_path(self, src, path_type, dest=None, force=False):
+        """Check a new destination path, as `check_path()` does, and reserve
+        it so that its content can be written without holding the path lock.
 
-    def add_string(self, content, dest, mode='w'):
+        The path lock is only needed while the path structure of the archive
+        changes. Data is written afterwards, under a lock for the destination
+        alone, so that threads writing to different paths do not wait on one
+        another. Any other attempt to add a reserved path without `force` is
+        skipped, the same as if the path already existed.
+
+        :returns: The absolute destination path to write to, which must be
+                  passed to `_release_path()` when done, or `None` if the
+                  path should not be written
+        """
         with self._path_lock:
-            src = dest
-
-            # add_string() is a special case: it must always take precedence
-            # over any exixting content in the archive, since it is used by
-            # the Plugin postprocessing hooks to perform regex substitution
-            # on file content.
-            dest = self.check_path(dest, P_FILE, force=True)
-
-            f = codecs.open(dest, mode, encoding='utf-8')
-            if isinstance(content, bytes):
-                content = content.decode('utf8', 'ignore')
-            f.write(content)
+            dest = self.check_path(src, path_type, dest=dest, force=force)
+            if dest and not force:
+                self._pending_paths.add(dest)
+        return dest
+
+    def _release_path(self, dest):
+        self._pending_paths.discard(dest)
+
+    def add_file(self, src, dest=None, force=False, stream=False):
+        if not dest:
+            dest = src
+
+        dest = self._reserve_path(dest, P_FILE, force=force)
+        if not dest:
+            return
+
+        try:
+            with self._write_lock(dest):
+                self._write_file(src, dest, force, stream)
+        finally:
+            self._release_path(dest)
+
+    def _write_file(self, src, dest, force, stream):
+        if stream and not force and self.stream_file(src, dest):
+            self.log_debug("streamed '%s' to archive '%s'"
+                           % (src, self._archive_name))
+            return
+
+        # Handle adding a file from either a string respresenting
+        # a path, or a File object open for reading.
+        if not getattr(src, "read", None):
+            # path case
+            try:
+                self._copy_file(src, dest)
+            except OSError as e:
+                # Filter out IO errors on virtual file systems.
+                if self._is_pseudo_file(src):
+                    pass
+                else:
+                    self.log_info("File %s not collected: '%s'" % (src, e))
+
+            file_name = "'%s'" % src
+        else:
+            # Open file case: first rewind the file to obtain
+            # everything written to it.
+            src.seek(0)
+            with open(dest, "w") as f:
+                for line in src:
+                    f.write(line)
+            file_name = "open file"
+
+        self.log_debug("added %s to FileCacheArchive '%s'" %
+                       (file_name, self._archive_root))
+
+    def add_string(self, content, dest, mode='w'):
+        src = dest
+
+        # add_string() is a special case: it must always take precedence
+        # over any exixting content in the archive, since it is used by
+        # the Plugin postprocessing hooks to perform regex substitution
+        # on file content.
+        dest = self._reserve_path(dest, P_FILE, force=True)
+
+        with self._write_lock(dest):
+            with codecs.open(dest, mode, encoding='utf-8') as f:
+                if isinstance(content, bytes):
+                    content = content.decode('utf8', 'ignore')
+                f.write(content)
             if os.path.exists(src):
                 self._copy_attributes(src, dest)
-            self.log_debug("added string at '%s' to FileCacheArchive '%s'"
-                           % (src, self._archive_root))
+        self.log_debug("added string at '%s' to FileCacheArchive '%s'"
+                       % (src, self._archive_root))
 
     def add_binary(self, content, dest):
-        with self._path_lock:
-            dest = self.check_path(dest, P_FILE)
-            if not dest:
-                return
+        dest = self._reserve_path(dest, P_FILE)
+        if not dest:
+            return
 
-            f = codecs.open(dest, 'wb', encoding=None)
-            f.write(content)
-            self.log_debug("added binary content at '%s' to archive '%s'"
-                           % (dest, self._archive_root))
+        try:
+            with self._write_lock(dest):
+                with codecs.open(dest, 'wb', encoding=None) as f:
+                    f.write(content)
+        finally:
+            self._release_path(dest)
+        self.log_debug("added binary content at '%s' to archive '%s'"
+                       % (dest, self._archive_root))
 
     def add_link(self, source, link_name):
         self.log_debug("adding symlink at '%s' -> '%s'" % (link_name, source))
@@ -545,10 +785,17 @@ class FileCacheArchive(Archive):
         run_time = end - start
         self.manifest.add_field('end_time', end)
         self.manifest.add_field('run_time', run_time)
-        self.manifest.add_field('compression', method)
+        self.manifest.add_field('compression',
+                                self.get_compression_method(method))
         self.add_string(self.manifest.get_json(indent=4),
                         os.path.join('sos_reports', 'manifest.json'))
 
+    def get_compression_method(self, method):
+        """Get the compression method that will be used to finalize the
+        archive when method is requested, for recording in the manifest
+        """
+        return method
+
     def rename_archive_root(self, cleaner):
         """Rename the archive to an obfuscated version using an initialized
         SoSCleaner instance
@@ -627,6 +874,70 @@ class FileCacheArchive(Archive):
         raise Exception(msg)
 
 
+class ParallelCompressor():
+    """A file-like object that compresses data written to it in independent
+    blocks using a pool of threads, and writes the compressed blocks to the
+    underlying file in order.
+
+    Each block is compressed into a complete xz stream, gzip member or zstd
+    frame. All of these formats allow multiple streams to be concatenated, so
+    the result is still readable by the standard tools as well as tarfile.
+
+    :param fileobj:     The file to write compressed data to
+    :type fileobj:      A binary file-like object
+
+    :param compress:    Called with each block to get its compressed form
+    :type compress:     ``callable``
+
+    :param threads:     How many blocks to compress at once
+    :type threads:      ``int``
+
+    :param block_size:  How much uncompressed data to put in each block
+    :type block_size:   ``int``
+    """
+
+    def __init__(self, fileobj, compress, threads, block_size):
+        self.fileobj = fileobj
+        self.compress = compress
+        self.block_size = block_size
+        # bound the number of blocks held in memory at any one time
+        self.max_pending = threads + 1
+        self._pool = ThreadPoolExecutor(threads)
+        self._pending = deque()
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        self._buffer.append(bytes(data))
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            self._submit_block()
+        return len(data)
+
+    def _submit_block(self):
+        block = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._pending.append(self._pool.submit(self.compress, block))
+        while len(self._pending) >= self.max_pending:
+            self._write_block()
+
+    def _write_block(self):
+        self.fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        """Compress any remaining data and wait for all blocks to be written.
+        This does not close the underlying file.
+        """
+        try:
+            if self._buffered:
+                self._submit_block()
+            while self._pending:
+                self._write_block()
+        finally:
+            self._pool.shutdown()
+
+
 class TarFileArchive(FileCacheArchive):
     """ archive class using python TarFile to create tar archives"""
 
@@ -641,6 +952,14 @@ class TarFileArchive(FileCacheArchive):
         self._archive_name = os.path.join(
             tmpdir, self.name()  # lgtm [py/init-calls-subclass]
         )
+        self._tar = None
+        self._tar_files = []
+        self._comp_mode = None
+        self._compression = None
+        self._streamed = set()
+        self._staged_paths = set()
+        # files are streamed one at a time, as the tar stream is sequential
+        self._stream_lock = Lock()
 
     def set_tarinfo_from_stat(self, tar_info, fstat, mode=None):
         tar_info.mtime = fstat.st_mtime
@@ -688,19 +1007,186 @@ class TarFileArchive(FileCacheArchive):
         # the limit of the underlying FileCacheArchive.
         return super(TarFileArchive, self).name_max()
 
-    def _build_archive(self, method):
+    def _get_compression(self, method):
+        """Resolve method to the compression that is available to use"""
+        if method == 'zstd' and zstandard is None:
+            method = 'auto'
         if method == 'auto':
             method = 'xz' if find_spec('lzma') is not None else 'gzip'
-        _comp_mode = method.strip('ip')
+        return method
+
+    def _get_compression_threads(self):
+        try:
+            threads = int(self._threads)
+        except (TypeError, ValueError):
+            threads = 1
+        return max(min(threads, os.cpu_count() or 1), 1)
+
+    def get_compression_method(self, method):
+        method = self._compression or self._get_compression(method)
+        if self._get_compression_threads() > 1:
+            method += '-parallel'
+        return method
+
+    def _get_block_compressor(self, method):
+        """Get the function used to compress each block of the archive, and
+        the size of the blocks to use for method.
+
+        Compression levels match those used for single stream archives, and
+        xz blocks are sized the same as xz itself does for multi-threaded
+        compression at that level.
+        """
+        if method == 'xz':
+            def compress(block):
+                return lzma.compress(block, preset=3)
+            return compress, 12 * 1024**2
+        if method == 'zstd':
+            def compress(block):
+                return zstandard.ZstdCompressor(level=3).compress(block)
+            return compress, 8 * 1024**2
+
+        def compress(block):
+            return gzip.compress(block, compresslevel=6)
+        return compress, 8 * 1024**2
+
+    def _open_tar(self, method):
+        """Open the final archive file as a tar stream, compressed using
+        method.
+        """
+        if method == 'zstd' and zstandard is None:
+            self.log_warn("zstd compression requested but the zstandard "
+                          "module is not available, using 'auto' instead")
+        method = self._get_compression(method)
+        _comp_mode = {'gzip': 'gz', 'zstd': 'zst'}.get(method, method)
         self._archive_name = self._archive_name + ".%s" % _comp_mode
-        # tarfile does not currently have a consistent way to define comnpress
-        # level for both xz and gzip ('preset' for xz, 'compresslevel' for gz)
-        if method == 'gzip':
-            kwargs = {'compresslevel': 6}
+        self._comp_mode = _comp_mode
+        self._compression = method
+        threads = self._get_compression_threads()
+        _fileobj = os.fdopen(
+            os.open(self._archive_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                    0o600), 'wb'
+        )
+        if method == 'zstd' or threads > 1:
+            # build the tar stream once and compress it in parallel blocks
+            self.log_debug("compressing archive with %s using %s threads"
+                           % (method, threads))
+            compress, block_size = self._get_block_compressor(method)
+            compressor = ParallelCompressor(_fileobj, compress, threads,
+                                            block_size)
+        elif method == 'xz':
+            compressor = lzma.LZMAFile(_fileobj, 'w', preset=3)
         else:
-            kwargs = {'preset': 3}
-        tar = tarfile.open(self._archive_name, mode="w:%s" % _comp_mode,
-                           **kwargs)
+            compressor = gzip.GzipFile(fileobj=_fileobj, mode='wb',
+                                       compresslevel=6)
+        # closed in reverse order once the tar stream is closed
+        self._tar_files = [_fileobj, compressor]
+        return tarfile.open(mode='w|', fileobj=compressor)
+
+    def _close_tar_files(self):
+        try:
+            while self._tar_files:
+                self._tar_files.pop().close()
+        finally:
+            for _file in self._tar_files:
+                _file.close()
+
+    def start_stream(self, method, staged_paths=None):
+        """Start writing the final archive now, so that files which will not
+        be modified after collection can be written directly to it rather
+        than being copied to the archive root first. Everything else is
+        added to the archive from the archive root when it is finalized.
+
+        :param method:          The compression method to use
+        :type method:           ``str``
+
+        :param staged_paths:    Host paths that may be modified after they
+                                are collected, along with directories whose
+                                content may be. These are always copied to
+                                the archive root.
+        :type staged_paths:     ``set``
+        """
+        self._staged_paths = set(staged_paths or [])
+        self._tar = self._open_tar(method)
+        self.log_info("streaming archive content to '%s'"
+                      % self._archive_name)
+
+    def _can_stream(self, src):
+        if getattr(src, "read", None):
+            return False
+        # the size of virtual files is unreliable, and a tar member's size is
+        # written before its content
+        if self._is_pseudo_file(src):
+            return False
+        path = src
+        while True:
+            if path in self._staged_paths:
+                return False
+            parent = os.path.dirname(path)
+            if parent == path:
+                return True
+            path = parent
+
+    def stream_file(self, src, dest):
+        if not self._tar or not self._can_stream(src):
+            return False
+        root = os.path.realpath(self._archive_root)
+        real_dest = os.path.realpath(dest)
+        if not real_dest.startswith(os.path.join(root, '')):
+            return False
+        arcname = os.path.join(self._name, os.path.relpath(real_dest, root))
+        try:
+            with open(src, 'rb') as fobj:
+                fstat = os.fstat(fobj.fileno())
+                if (not stat.S_ISREG(fstat.st_mode) or not fstat.st_size or
+                        fstat.st_size > STREAM_MAX_SIZE or
+                        self._is_pseudo_file(src, fstat)):
+                    return False
+                data = fobj.read(fstat.st_size + 1)
+                tarinfo = self._tar.gettarinfo(arcname=arcname, fileobj=fobj)
+        except OSError:
+            return False
+        if len(data) != fstat.st_size:
+            # the file changed while being read, so copy it to the archive
+            # root instead of writing a tar member of the wrong size
+            self.log_debug("size of '%s' changed while streaming it" % src)
+            return False
+        self.set_tarinfo_from_stat(tarinfo, fstat)
+        if self._with_selinux_context:
+            context = self.get_selinux_context(src)
+            if context:
+                tarinfo.pax_headers['RHT.security.selinux'] = context
+        with self._stream_lock:
+            self._tar.addfile(tarinfo, io.BytesIO(data))
+            self._streamed.add(real_dest)
+        return True
+
+    def check_path(self, src, path_type, dest=None, force=False):
+        if self._streamed:
+            _dest = dest or self.dest_path(src)
+            if os.path.realpath(_dest) in self._streamed:
+                if path_type != P_FILE:
+                    raise ValueError("path '%s' exists and is not a %s"
+                                     % (_dest, path_type))
+                if not force:
+                    # Path has already been streamed: skip
+                    return None
+                self.log_debug("'%s' was already streamed to the archive, "
+                               "adding it again" % _dest)
+        return super(TarFileArchive, self).check_path(src, path_type,
+                                                      dest=dest, force=force)
+
+    def _build_archive(self, method):
+        tar = self._tar or self._open_tar(method)
+        self._tar = None
+        try:
+            self._add_archive_content(tar)
+            tar.close()
+        finally:
+            self._close_tar_files()
+        self._suffix += ".%s" % self._comp_mode
+        return self.name()
+
+    def _add_archive_content(self, tar):
         # add commonly reviewed files first, so that they can be more easily
         # read from memory without needing to extract the whole archive
         for _content in ['version.txt', 'sos_reports', 'sos_logs']:
@@ -714,9 +1200,6 @@ class TarFileArchive(FileCacheArchive):
         # want the names used in the archive to be relative.
         tar.add(self._archive_root, arcname=self._name,
                 filter=self.copy_permissions_filter)
-        tar.close()
-        self._suffix += ".%s" % _comp_mode
-        return self.name()
 
 
 # vim: set et ts=4 sw=4 :
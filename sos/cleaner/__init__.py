@@ -11,12 +11,14 @@
 import hashlib
 import json
 import logging
+import multiprocessing
 import os
 import shutil
 import sos.cleaner.preppers
+import stat
 import tempfile
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pwd import getpwuid
 from sos import __version__
@@ -32,9 +34,61 @@ from sos.cleaner.archives.sos import (SoSReportArchive, SoSReportDirectory,
                                       SoSCollectorDirectory)
 from sos.cleaner.archives.generic import DataDirArchive, TarballArchive
 from sos.cleaner.archives.insights import InsightsArchive
+from sos.cleaner.mappings.map_store import SoSMapIndex, SoSMapStore
 from sos.utilities import get_human_readable, import_module, ImporterHelper
 from textwrap import fill
 
+# the SoSCleaner instance that file worker processes operate with. As workers
+# are forked, this is a copy of the parent's cleaner with its maps as they
+# were when the worker pool was created
+_worker_cleaner = None
+
+
+def _init_file_worker(cleaner):
+    """Initializer for the worker processes used to obfuscate the files of a
+    single archive in parallel.
+
+    Any new items a worker adds to its copy of the maps are recorded, rather
+    than being relied upon, so that the parent can add them to the real maps
+    in a consistent order.
+    """
+    global _worker_cleaner
+    _worker_cleaner = cleaner
+    cleaner.new_map_items = []
+    for idx, parser in enumerate(cleaner.parsers):
+        if isinstance(parser.mapping.dataset, SoSMapStore):
+            parser.mapping.dataset.make_private()
+        parser.mapping.get = _record_new_items(cleaner, idx, parser.mapping)
+
+
+def _record_new_items(cleaner, idx, mapping):
+    _get = mapping.get
+
+    def get(item):
+        _known = len(mapping.dataset)
+        ret = _get(item)
+        if len(mapping.dataset) != _known:
+            cleaner.new_map_items.append((idx, item))
+        return ret
+    return get
+
+
+def _obfuscate_file_in_worker(fname, short_name, arc_name):
+    """Obfuscate a file in a worker process.
+
+    :returns:   The substitution count, or None if the file was not written,
+                and any new map items found while parsing the file
+    :rtype:     ``tuple``, ``(int, list)``
+    """
+    _start = len(_worker_cleaner.new_map_items)
+    try:
+        count = _worker_cleaner.obfuscate_file(fname, short_name, arc_name)
+    except Exception as err:
+        _worker_cleaner.log_debug("Unable to parse file %s: %s"
+                                  % (short_name, err))
+        count = 0
+    return count, _worker_cleaner.new_map_items[_start:]
+
 
 class SoSCleaner(SoSComponent):
     """
@@ -85,8 +139,10 @@ class SoSCleaner(SoSComponent):
         'keywords': [],
         'keyword_file': None,
         'map_file': '/etc/sos/cleaner/default_mapping',
+        'map_index': False,
         'no_update': False,
         'keep_binary_files': False,
+        'parallel_files': False,
         'target': '',
         'usernames': []
     }
@@ -109,6 +165,10 @@ class SoSCleaner(SoSComponent):
             self.from_cmdline = False
             if not hasattr(self.opts, 'jobs'):
                 self.opts.jobs = 4
+            if not hasattr(self.opts, 'parallel_files'):
+                self.opts.parallel_files = False
+            if not hasattr(self.opts, 'map_index'):
+                self.opts.map_index = False
             self.opts.archive_type = 'auto'
             self.soslog = logging.getLogger('sos')
             self.ui_log = logging.getLogger('sos_ui')
@@ -118,6 +178,7 @@ class SoSCleaner(SoSComponent):
 
         self.validate_parser_values()
 
+        self.map_index = None
         self.cleaner_mapping = self.load_map_file()
         os.umask(0o77)
         self.in_place = in_place
@@ -146,6 +207,10 @@ class SoSCleaner(SoSComponent):
                     )
                     self.parsers.remove(_loaded)
 
+        self.map_store_path = None
+        if self.map_index:
+            self.load_map_stores()
+
         self.archive_types = [
             SoSReportDirectory,
             SoSReportArchive,
@@ -157,6 +222,9 @@ class SoSCleaner(SoSComponent):
             TarballArchive
         ]
         self.nested_archive = None
+        # items added to maps by this process while obfuscating files in a
+        # worker process, or None if not a worker
+        self.new_map_items = None
 
         self.log_info("Cleaner initialized. From cmdline: %s"
                       % self.from_cmdline)
@@ -189,18 +257,27 @@ class SoSCleaner(SoSComponent):
         """Verifies that the map file exists and has usable content.
 
         If the provided map file does not exist, or it is empty, we will print
-        a warning and continue on with cleaning building a fresh map
+        a warning and continue on with cleaning building a fresh map.
+
+        If an index of the map file is being used, then only the sections of
+        the map file that are not held in the index are returned.
         """
         _conf = {}
         default_map = '/etc/sos/cleaner/default_mapping'
         if os.path.isdir(self.opts.map_file):
             raise Exception("Requested map file %s is a directory"
                             % self.opts.map_file)
+        if self.opts.map_index:
+            self.map_index = SoSMapIndex(self.opts.map_file)
         if not os.path.exists(self.opts.map_file):
             if self.opts.map_file != default_map:
                 self.log_error(
                     "ERROR: map file %s does not exist, will not load any "
                     "obfuscation matches" % self.opts.map_file)
+        elif self.map_index and self.map_index.is_current():
+            self.log_info("Loading mappings from index %s"
+                          % self.map_index.path)
+            return self.map_index.load_sections()
         else:
             with open(self.opts.map_file, 'r') as mf:
                 try:
@@ -211,8 +288,35 @@ class SoSCleaner(SoSComponent):
                 except Exception as err:
                     self.log_error("ERROR: Could not load '%s': %s"
                                    % (self.opts.map_file, err))
+            if self.map_index and _conf:
+                try:
+                    self.log_info("Building index %s of map file"
+                                  % self.map_index.path)
+                    self.map_index.build(_conf)
+                    return self.map_index.load_sections()
+                except Exception as err:
+                    self.log_error("ERROR: Could not build map index: %s"
+                                   % err)
+                    self.map_index = None
         return _conf
 
+    def load_map_stores(self):
+        """Hold the datasets of the parsers' mappings in a copy of the map
+        index, rather than in memory. Mappings are read from the index as
+        needed, and any new mappings are only added to the index itself if
+        the map file is updated at the end of the run. The items themselves
+        are still all added to each mapping's in-memory matcher, see
+        SoSCleanerParser.generate_item_regexes().
+        """
+        self.map_store_path = os.path.join(self.tmpdir, 'cleaner_map.db')
+        if self.map_index.is_current():
+            self.map_index.copy_to(self.map_store_path)
+        for parser in self.parsers:
+            if parser.mapping.use_map_store:
+                parser.mapping.dataset = SoSMapStore(
+                    self.map_store_path, parser.map_file_key
+                )
+
     def print_disclaimer(self):
         """When we are directly running `sos clean`, rather than hooking into
         SoSCleaner via report or collect, print a disclaimer banner
@@ -264,6 +368,10 @@ third party.
                                      'elements are not obfuscated'))
         clean_grp.add_argument('-j', '--jobs', default=4, type=int,
                                help='Number of concurrent archives to clean')
+        clean_grp.add_argument('--parallel-files', default=False,
+                               action='store_true', dest='parallel_files',
+                               help=('Obfuscate the files within each archive '
+                                     'using --jobs worker processes'))
         clean_grp.add_argument('--keywords', action='extend', default=[],
                                dest='keywords',
                                help='List of keywords to obfuscate')
@@ -274,6 +382,11 @@ third party.
                                default='/etc/sos/cleaner/default_mapping',
                                help=('Provide a previously generated mapping '
                                      'file for obfuscation'))
+        clean_grp.add_argument('--map-index', dest='map_index', default=False,
+                               action='store_true',
+                               help=('Keep an index of the --map-file '
+                                     'alongside it, to look up mappings '
+                                     'without loading the map file'))
         clean_grp.add_argument('--no-update', dest='no_update', default=False,
                                action='store_true',
                                help='Do not update the --map-file with new '
@@ -315,7 +428,10 @@ third party.
             return
         self.report_paths.append(_arc)
         if _arc.is_nested:
-            self.report_paths.extend(_arc.get_nested_archives())
+            try:
+                self.report_paths.extend(_arc.get_nested_archives())
+            except Exception as err:
+                self._exit(1, "%s, aborting\n" % err)
             # We need to preserve the top level archive until all
             # nested archives are processed
             self.report_paths.remove(_arc)
@@ -501,6 +617,14 @@ third party.
             except Exception as err:
                 self.log_error("Could not update mapping config file: %s"
                                % err)
+                return
+            if self.map_index:
+                try:
+                    self.map_index.update_from(self.map_store_path, _map)
+                    self.log_debug("Updated map index %s"
+                                   % self.map_index.path)
+                except Exception as err:
+                    self.log_error("Could not update map index: %s" % err)
 
     def write_cleaner_log(self, archive=False):
         """When invoked via the command line, the logging from SoSCleaner will
@@ -556,9 +680,16 @@ third party.
                     "WARNING: binary files that potentially contain sensitive "
                     "information will NOT be removed from the final archive\n"
                 )
-            pool = ThreadPoolExecutor(self.opts.jobs)
-            pool.map(self.obfuscate_report, self.report_paths, chunksize=1)
-            pool.shutdown(wait=True)
+            if self.opts.parallel_files:
+                # each archive uses all of the worker processes, and we want
+                # to avoid forking while other threads are running
+                for report in self.report_paths:
+                    self.obfuscate_report(report)
+            else:
+                pool = ThreadPoolExecutor(self.opts.jobs)
+                pool.map(self.obfuscate_report, self.report_paths,
+                         chunksize=1)
+                pool.shutdown(wait=True)
             # finally, obfuscate the nested archive if one exists
             if self.nested_archive:
                 self._replace_obfuscated_archives()
@@ -673,6 +804,7 @@ third party.
                 archive.extract()
             archive.report_msg("Beginning obfuscation...")
 
+            files = []
             for fname in archive.get_file_list():
                 short_name = fname.split(archive.archive_name + '/')[1]
                 if archive.should_skip_file(short_name):
@@ -681,14 +813,13 @@ third party.
                         archive.should_remove_file(short_name)):
                     archive.remove_file(short_name)
                     continue
-                try:
-                    count = self.obfuscate_file(fname, short_name,
-                                                archive.archive_name)
-                    if count:
-                        archive.update_sub_count(short_name, count)
-                except Exception as err:
-                    self.log_debug("Unable to parse file %s: %s"
-                                   % (short_name, err))
+                files.append((fname, short_name))
+
+            if self.opts.parallel_files and self.opts.jobs > 1:
+                self.obfuscate_files_in_workers(archive, files)
+            else:
+                for fname, short_name in files:
+                    self.obfuscate_archive_file(archive, fname, short_name)
 
             try:
                 self.obfuscate_directory_names(archive)
@@ -735,14 +866,98 @@ third party.
             self.ui_log.info("Exception while processing %s: %s"
                              % (archive.archive_name, err))
 
+    def obfuscate_archive_file(self, archive, fname, short_name):
+        """Obfuscate a single file within an archive, and record the number
+        of substitutions made for that archive.
+        """
+        try:
+            count = self.obfuscate_file(fname, short_name,
+                                        archive.archive_name)
+            if count:
+                archive.update_sub_count(short_name, count)
+        except Exception as err:
+            self.log_debug("Unable to parse file %s: %s"
+                           % (short_name, err))
+
+    def obfuscate_files_in_workers(self, archive, files):
+        """Obfuscate the files of an archive using up to self.opts.jobs
+        worker processes.
+
+        Workers are forked with a copy of the maps, and only write a file if
+        it could be obfuscated using items that were already in those maps.
+        Once a worker finds a new item, it keeps parsing files to discover new
+        items but leaves them to be obfuscated later. Those new items are then
+        added to the real maps in the order of the files and lines they were
+        found in, so that obfuscated names are generated in the same order as
+        they would be when obfuscating files one at a time. Remaining files
+        are then handed to a new set of workers using the updated maps, and
+        anything still left over is obfuscated in this process.
+
+        :param archive: The archive being obfuscated
+        :type archive:  ``SoSObfuscationArchive``
+
+        :param files:   The (path, archive relative name) of each file to
+                        obfuscate, in order
+        :type files:    ``list`` of ``tuple``
+        """
+        self.log_info("Obfuscating %s files using %s worker processes"
+                      % (len(files), self.opts.jobs),
+                      caller=archive.archive_name)
+        for _round in range(2):
+            if not files:
+                return
+            files = self._run_file_workers(archive, files)
+            self.log_debug("%s files left after worker round %s"
+                           % (len(files), _round + 1),
+                           caller=archive.archive_name)
+        for fname, short_name in files:
+            self.obfuscate_archive_file(archive, fname, short_name)
+
+    def _run_file_workers(self, archive, files):
+        """Hand the given files to a new pool of worker processes, and add
+        any new items they found to the maps.
+
+        :returns:   The files that workers could not write
+        :rtype:     ``list``
+        """
+        chunksize = max(1, len(files) // (self.opts.jobs * 8))
+        pool = ProcessPoolExecutor(
+            self.opts.jobs,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_file_worker,
+            initargs=(self,)
+        )
+        try:
+            results = list(pool.map(
+                _obfuscate_file_in_worker,
+                [f[0] for f in files],
+                [f[1] for f in files],
+                [archive.archive_name] * len(files),
+                chunksize=chunksize
+            ))
+        finally:
+            pool.shutdown(wait=True)
+        remaining = []
+        for (fname, short_name), (count, new_items) in zip(files, results):
+            for idx, item in new_items:
+                self.parsers[idx].mapping.get(item)
+            if count is None:
+                remaining.append((fname, short_name))
+            elif count:
+                archive.update_sub_count(short_name, count)
+        return remaining
+
     def obfuscate_file(self, filename, short_name=None, arc_name=None):
         """Obfuscate and individual file, line by line.
 
-        Lines processed, even if no substitutions occur, are then written to a
-        temp file without our own tmpdir. Once the file has been completely
-        iterated through, if there have been substitutions then the temp file
-        overwrites the original file. If there are no substitutions, then the
-        original file is left in place.
+        The file is read in large blocks, and each block is first checked for
+        anything that any of the parsers may match. Blocks without any such
+        candidates are passed over without parsing individual lines. Nothing
+        is written until a line is actually changed, at which point a temp
+        file alongside the original is started with the unchanged content
+        read so far. Once the file has been completely iterated through, the
+        temp file replaces the original file. If nothing was changed, then the
+        original file is left in place without having been written.
 
         Positional arguments:
 
@@ -760,26 +975,29 @@ third party.
             # at some other point.
             self.log_debug("Obfuscating %s" % short_name or filename,
                            caller=arc_name)
-            tfile = tempfile.NamedTemporaryFile(mode='w', dir=self.tmpdir)
             _parsers = [
                 _p for _p in self.parsers if not
                 any(
                     _skip.match(short_name) for _skip in _p.skip_patterns
                 )
             ]
-            with open(filename, 'r', errors='replace') as fname:
-                for line in fname:
-                    try:
-                        line, count = self.obfuscate_line(line, _parsers)
-                        subs += count
-                        tfile.write(line)
-                    except Exception as err:
-                        self.log_debug("Unable to obfuscate %s: %s"
-                                       % (short_name, err), caller=arc_name)
-            tfile.seek(0)
-            if subs:
-                shutil.copyfile(tfile.name, filename)
-            tfile.close()
+            tfile = None
+            try:
+                subs, tfile = self._obfuscate_file_content(
+                    filename, _parsers, short_name, arc_name
+                )
+                if tfile and not self.new_map_items:
+                    tfile.close()
+                    os.replace(tfile.name, filename)
+                    tfile = None
+            finally:
+                if tfile:
+                    tfile.close()
+                    os.remove(tfile.name)
+            if self.new_map_items:
+                # we are a worker process that has added to its copy of the
+                # maps, so this file may not be consistent with other files
+                return None
 
         _ob_short_name = self.obfuscate_string(short_name.split('/')[-1])
         _ob_filename = short_name.replace(short_name.split('/')[-1],
@@ -805,6 +1023,77 @@ third party.
 
         return subs
 
+    def _obfuscate_file_content(self, filename, parsers, short_name=None,
+                                arc_name=None):
+        """Stream the content of a file through the given parsers.
+
+        :returns:   The number of substitutions made, and the temp file that
+                    holds the obfuscated content if any line was changed
+        :rtype:     ``tuple``, ``(int, NamedTemporaryFile)``
+        """
+        read_size = 1024**2  # Parse 1MiB of content at a time.
+        subs = 0
+        tfile = None
+        # bytes read so far that did not need to be changed
+        unchanged = 0
+        with open(filename, 'rb') as fname:
+            while True:
+                lines = fname.readlines(read_size)
+                if not lines:
+                    break
+                block = b''.join(lines)
+                if not any(_p.may_match(block.decode('utf-8', 'replace'))
+                           for _p in parsers):
+                    if tfile:
+                        tfile.write(block)
+                    else:
+                        unchanged += len(block)
+                    continue
+                for line in lines:
+                    _line = line.decode('utf-8', 'replace')
+                    try:
+                        _ob_line, count = self.obfuscate_line(_line, parsers)
+                        subs += count
+                    except Exception as err:
+                        self.log_debug("Unable to obfuscate %s: %s"
+                                       % (short_name, err), caller=arc_name)
+                        _ob_line = _line
+                    if _ob_line != _line and tfile is None:
+                        tfile = self._start_obfuscated_file(filename,
+                                                            unchanged)
+                    if tfile:
+                        tfile.write(_ob_line.encode('utf-8')
+                                    if _ob_line != _line else line)
+                    else:
+                        unchanged += len(line)
+        return subs, tfile
+
+    def _start_obfuscated_file(self, filename, length):
+        """Create a temp file next to filename to write obfuscated content
+        to, that starts with the first length bytes of the original file and
+        keeps the original's permissions and ownership.
+        """
+        tfile = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(filename), delete=False
+        )
+        try:
+            with open(filename, 'rb') as orig:
+                while length > 0:
+                    data = orig.read(min(length, 1024**2))
+                    if not data:
+                        break
+                    tfile.write(data)
+                    length -= len(data)
+            fstat = os.stat(filename)
+            os.chmod(tfile.name, stat.S_IMODE(fstat.st_mode))
+            if os.getuid() == 0:
+                os.chown(tfile.name, fstat.st_uid, fstat.st_gid)
+        except Exception:
+            tfile.close()
+            os.remove(tfile.name)
+            raise
+        return tfile
+
     def obfuscate_symlinks(self, archive):
         """Iterate over symlinks in the archive and obfuscate their names.
         The content of the link target will have already been cleaned, and this
@@ -12,6 +12,7 @@
 from sos.cleaner.archives import SoSObfuscationArchive
 
 import os
+import re
 import tarfile
 
 
@@ -69,8 +70,14 @@ class SoSCollectorArchive(SoSObfuscationArchive):
         archives = []
         for fname in os.listdir(_path):
             arc_name = os.path.join(_path, fname)
-            if 'sosreport-' in fname and tarfile.is_tarfile(arc_name):
+            if 'sosreport-' not in fname:
+                continue
+            if tarfile.is_tarfile(arc_name):
                 archives.append(SoSReportArchive(arc_name, self.tmpdir))
+            elif re.search(r'\.tar(\.\w+)?$', fname):
+                # a report we cannot read would otherwise be left in the
+                # final archive without being obfuscated
+                raise Exception("Unable to read nested report %s" % fname)
         return archives
 
 
@@ -10,6 +10,8 @@
 
 import re
 
+from sos.cleaner.mappings.map_store import SoSMapStore
+from sos.cleaner.mappings.matcher import SoSItemMatcher
 from threading import Lock
 
 
@@ -25,11 +27,15 @@ class SoSMap():
     # used for filename obfuscations in parser.parse_string_for_keys()
     skip_keys = []
     compile_regexes = True
+    # regex patterns to use for specific characters when matching known items
+    item_char_patterns = {}
+    # the dataset is written to the map file as-is, and so can be held in a
+    # SoSMapStore when using an index of the map file
+    use_map_store = True
 
     def __init__(self):
         self.dataset = {}
-        self._regexes_made = set()
-        self.compiled_regexes = []
+        self.matcher = SoSItemMatcher(char_patterns=self.item_char_patterns)
         self.lock = Lock()
 
     def ignore_item(self, item):
@@ -59,42 +65,15 @@ class SoSMap():
             return self.dataset[item]
 
     def add_regex_item(self, item):
-        """Add an item to the regexes dict and then re-sort the list that the
-        parsers will use during parse_line()
+        """Add an item to the matcher that the parsers will use during
+        parse_line() to find items we already know about.
 
-        :param item:    The unobfuscated item to generate a regex for
+        :param item:    The unobfuscated item to match
         :type item:     ``str``
         """
         if self.ignore_item(item):
             return
-        if item not in self._regexes_made:
-            # save the item in a set to avoid clobbering existing regexes,
-            # as searching this set is significantly faster than searching
-            # through the actual compiled_regexes list, especially for very
-            # large collections of entries
-            self._regexes_made.add(item)
-            # add the item, Pattern tuple directly to the compiled_regexes list
-            # and then sort the existing list, rather than rebuild the list
-            # from scratch every time we add something like we would do if we
-            # tracked/saved the item and the Pattern() object in a dict or in
-            # the set above
-            self.compiled_regexes.append((item, self.get_regex_result(item)))
-            self.compiled_regexes.sort(key=lambda x: len(x[0]), reverse=True)
-
-    def get_regex_result(self, item):
-        """Generate the object/value that is used by the parser when iterating
-        over pre-generated regexes during parse_line(). For most parsers this
-        will simply be a ``re.Pattern()`` object, but for more complex parsers
-        this can be overridden to provide a different object, e.g. a tuple,
-        for that parer's specific iteration needs.
-
-        :param item:    The unobfuscated string to generate the regex for
-        :type item:     ``str``
-
-        :returns:       A compiled regex pattern for the item
-        :rtype:         ``re.Pattern``
-        """
-        return re.compile(re.escape(item), re.I)
+        self.matcher.add(item)
 
     def sanitize_item(self, item):
         """Perform the obfuscation relevant to the item being added to the map.
@@ -117,6 +96,53 @@ class SoSMap():
             return self.add(item)
         return self.dataset[item]
 
+    def items_with_prefix(self, prefix):
+        """Get the items in the map that start with the given prefix, along
+        with their obfuscated counterparts.
+
+        :param prefix:  The start of the items to look for
+        :type prefix:   ``str``
+
+        :returns:   (item, obfuscated item) pairs, in the order they were
+                    added to the map
+        :rtype:     An iterable of ``tuple``
+        """
+        if isinstance(self.dataset, SoSMapStore):
+            return self.dataset.items_with_prefix(prefix)
+        return (
+            (k, v) for k, v in self.dataset.items() if k.startswith(prefix)
+        )
+
+    def items_within(self, text):
+        """Get the items in the map that occur within the given text, longest
+        first, and otherwise in the order they were added to the map.
+
+        :param text:    The text to look for items in
+        :type text:     ``str``
+
+        :returns:   The matching items
+        :rtype:     ``list``
+        """
+        if isinstance(self.dataset, SoSMapStore):
+            _items = self.dataset.items_within(text)
+        else:
+            _items = [k for k in self.dataset if k in text]
+        return sorted(_items, reverse=True, key=len)
+
+    def values_with_prefix(self, prefix):
+        """Get the obfuscated items in the map that start with the given
+        prefix.
+
+        :param prefix:  The start of the obfuscated items to look for
+        :type prefix:   ``str``
+
+        :returns:   The matching obfuscated items
+        :rtype:     An iterable of ``str``
+        """
+        if isinstance(self.dataset, SoSMapStore):
+            return self.dataset.values_with_prefix(prefix)
+        return (v for v in self.dataset.values() if v.startswith(prefix))
+
     def conf_update(self, map_dict):
         """Update the map using information from a previous run to ensure that
         we have consistent obfuscation between reports
@@ -40,6 +40,11 @@ class SoSHostnameMap(SoSMap):
         'api'
     ]
 
+    # FQDNs and domains are also matched when underscore formatted
+    item_char_patterns = {
+        '.': '[._]'
+    }
+
     strip_exts = ('.yaml', '.yml', '.crt', '.key', '.pem', '.log', '.repo',
                   '.rules', '.conf', '.cfg')
 
@@ -80,15 +85,6 @@ class SoSHostnameMap(SoSMap):
                         self._domains[_domain_to_inject] = _ob_domain
         self.set_initial_counts()
 
-    def get_regex_result(self, item):
-        """Override the base get_regex_result() to provide a regex that, if
-        this is an FQDN or a straight domain, will include an underscore
-        formatted regex as well.
-        """
-        if '.' in item:
-            item = item.replace('.', '(\\.|_)')
-        return re.compile(item, re.I)
-
     def set_initial_counts(self):
         """Set the initial counter for host and domain obfuscation numbers
         based on what is already present in the mapping.
@@ -152,9 +148,9 @@ class SoSHostnameMap(SoSMap):
             suffix += ext
         if item not in self.dataset.keys():
             # try to account for use of '-' in names that include hostnames
-            # and don't create new mappings for each of these
-            for _existing in sorted(self.dataset.keys(), reverse=True,
-                                    key=lambda x: len(x)):
+            # and don't create new mappings for each of these, which can only
+            # be based on existing items that are within this one
+            for _existing in self.items_within(item):
                 _host_substr = False
                 _test = item.split(_existing)
                 _h = _existing.split('.')
@@ -53,10 +53,10 @@ class SoSIPMap(SoSMap):
         Here, match the ip address to any of the obfuscated addresses we've
         already created
         """
-        for _ip in self.dataset.values():
-            if str(ipaddr).split('/')[0] == _ip.split('/')[0]:
-                return True
-        return False
+        _ip = str(ipaddr).split('/')[0]
+        if _ip in self.dataset.values():
+            return True
+        return any(True for _ in self.values_with_prefix(_ip + '/'))
 
     def get(self, ipaddr):
         """Ensure that when requesting an obfuscated address, we return a str
@@ -76,9 +76,8 @@ class SoSIPMap(SoSMap):
         # an address with a CIDR notation and we're now looking for it without
         # that notation
         if '/' not in ipaddr:
-            for key in self.dataset.keys():
-                if key.startswith(ipaddr):
-                    return self.dataset[key].split('/')[0]
+            for _, value in self.items_with_prefix(ipaddr):
+                return value.split('/')[0]
 
         # fallback to the default map behavior of adding it fresh
         return self.add(ipaddr)
@@ -66,6 +66,7 @@ class SoSIPv6Map(SoSMap):
     first_hexes = ['534f']
 
     compile_regexes = False
+    use_map_store = False
     version = 1
 
     def conf_update(self, config):
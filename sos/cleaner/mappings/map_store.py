@@ -0,0 +1,356 @@
+# Copyright 2020 Red Hat, Inc. Jake Hunsaker <jhunsake@redhat.com>
+
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import json
+import os
+import sqlite3
+
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from threading import Lock
+
+# sorts after any other character, used as the upper bound of prefix lookups
+_PREFIX_END = chr(0x10ffff)
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS items (seq INTEGER PRIMARY KEY, "
+    "map TEXT NOT NULL, item TEXT NOT NULL, obfuscated TEXT NOT NULL, "
+    "UNIQUE (map, item))",
+    "CREATE INDEX IF NOT EXISTS items_obfuscated ON items (map, obfuscated)",
+    "CREATE TABLE IF NOT EXISTS sections (map TEXT PRIMARY KEY, "
+    "content TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, "
+    "value TEXT NOT NULL)"
+]
+
+
+def _connect(path, readonly=False):
+    if readonly:
+        conn = sqlite3.connect("file:%s?mode=ro" % path, uri=True,
+                               check_same_thread=False, isolation_level=None)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute("PRAGMA synchronous=OFF")
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+    return conn
+
+
+class SoSMapIndex():
+    """An sqlite database kept alongside a map file, that holds the same
+    content as the map file, in a form that can be used directly by SoSMaps
+    via SoSMapStore without first parsing the whole map file.
+
+    Sections of the map file that are flat item to obfuscated item pairs are
+    stored as individual rows, which allows for exact, reverse and prefix
+    lookups. Any other section is stored as-is, to be loaded normally.
+
+    The index records the modification time and size of the map file it was
+    built from, and is rebuilt if the map file is changed by anything else.
+
+    :param map_file:    The path to the map file to index
+    :type map_file:     ``str``
+    """
+
+    def __init__(self, map_file):
+        self.map_file = map_file
+        self.path = map_file + '.idx'
+
+    def _map_file_stamp(self):
+        _stat = os.stat(self.map_file)
+        return "%s:%s" % (_stat.st_mtime_ns, _stat.st_size)
+
+    def is_current(self):
+        """Check if the index exists and was built from the current content
+        of the map file.
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            conn = _connect(self.path, readonly=True)
+            try:
+                row = conn.execute(
+                    "SELECT value FROM meta WHERE key = 'map_file'"
+                ).fetchone()
+            finally:
+                conn.close()
+            return row is not None and row[0] == self._map_file_stamp()
+        except (OSError, sqlite3.Error):
+            return False
+
+    def load_sections(self):
+        """Get the sections of the map file that are not stored as items.
+
+        :returns:   The map file sections that need to be loaded normally
+        :rtype:     ``dict``
+        """
+        conn = _connect(self.path, readonly=True)
+        try:
+            return {
+                name: json.loads(content) for name, content in
+                conn.execute("SELECT map, content FROM sections")
+            }
+        finally:
+            conn.close()
+
+    def build(self, conf):
+        """(Re)build the index from the loaded content of the map file.
+
+        :param conf:    The content of the map file
+        :type conf:     ``dict``
+        """
+        _tmp = self.path + '.tmp'
+        if os.path.exists(_tmp):
+            os.remove(_tmp)
+        conn = _connect(_tmp)
+        try:
+            self._write_conf(conn, conf, replace_items=True)
+        finally:
+            conn.close()
+        os.replace(_tmp, self.path)
+
+    def _write_conf(self, conn, conf, replace_items=False):
+        conn.execute("BEGIN")
+        if replace_items:
+            conn.execute("DELETE FROM items")
+        conn.execute("DELETE FROM sections")
+        for name, section in conf.items():
+            if (isinstance(section, dict) and
+                    all(isinstance(v, str) for v in section.values())):
+                if replace_items:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO items (map, item, obfuscated) "
+                        "VALUES (?, ?, ?)",
+                        ((name, k, v) for k, v in section.items())
+                    )
+            else:
+                conn.execute(
+                    "INSERT INTO sections (map, content) VALUES (?, ?)",
+                    (name, json.dumps(section))
+                )
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES "
+                     "('map_file', ?)", (self._map_file_stamp(),))
+        conn.execute("COMMIT")
+
+    def copy_to(self, path):
+        """Copy the index to a new database, for use during a single run so
+        that the index itself is only updated if the map file is.
+
+        :param path:    Where to create the copy
+        :type path:     ``str``
+        """
+        src = _connect(self.path, readonly=True)
+        dest = _connect(path)
+        try:
+            src.backup(dest)
+        finally:
+            src.close()
+            dest.close()
+
+    def update_from(self, path, conf):
+        """Replace the index with a database used during a run, after the map
+        file has been written with the content of that database.
+
+        :param path:    The database used during the run
+        :type path:     ``str``
+
+        :param conf:    The content written to the map file
+        :type conf:     ``dict``
+        """
+        _tmp = self.path + '.tmp'
+        if os.path.exists(_tmp):
+            os.remove(_tmp)
+        src = _connect(path)
+        dest = _connect(_tmp)
+        try:
+            src.backup(dest)
+            self._write_conf(dest, conf)
+        finally:
+            src.close()
+            dest.close()
+        os.replace(_tmp, self.path)
+
+
+class _StoreValuesView(ValuesView):
+
+    def __contains__(self, value):
+        return self._mapping.has_value(value)
+
+
+class _StoreItemsView(ItemsView):
+
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class SoSMapStore(MutableMapping):
+    """A dict-like store for the dataset of a single SoSMap, backed by an
+    sqlite database created by SoSMapIndex, so that the obfuscated items of
+    very large maps do not need to be held in memory. The map's matcher
+    still holds every item.
+
+    Items are iterated in the order they were first added, the same as a
+    dict. In addition to the normal dict operations, membership checks of
+    ``values()`` use an index rather than a scan, and items may be looked up
+    by prefix.
+
+    :param path:    The path to the database
+    :type path:     ``str``
+
+    :param name:    The name of the map within the database, which is the
+                    map file key of the map
+    :type name:     ``str``
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self._conn = _connect(path)
+        # new or changed items held in memory only, see make_private()
+        self._overlay = None
+        self.lock = Lock()
+
+    def _query(self, sql, *args):
+        with self.lock:
+            return self._conn.execute(sql, (self.name,) + args).fetchall()
+
+    def make_private(self):
+        """Reopen the database read-only and keep any changes from here on
+        in memory only, e.g. for use in a forked process whose changes
+        should not be seen by the parent.
+        """
+        self._conn = _connect(self.path, readonly=True)
+        self._overlay = {}
+
+    def __getitem__(self, item):
+        if self._overlay and item in self._overlay:
+            return self._overlay[item]
+        rows = self._query(
+            "SELECT obfuscated FROM items WHERE map = ? AND item = ?", item
+        )
+        if not rows:
+            raise KeyError(item)
+        return rows[0][0]
+
+    def __setitem__(self, item, obfuscated):
+        if self._overlay is not None:
+            self._overlay[item] = obfuscated
+            return
+        self._query(
+            "INSERT INTO items (map, item, obfuscated) VALUES (?, ?, ?) "
+            "ON CONFLICT (map, item) DO UPDATE SET obfuscated = "
+            "excluded.obfuscated", item, obfuscated
+        )
+
+    def __delitem__(self, item):
+        if item not in self:
+            raise KeyError(item)
+        if self._overlay is not None:
+            raise TypeError("Cannot remove items from a private map store")
+        self._query("DELETE FROM items WHERE map = ? AND item = ?", item)
+
+    def __contains__(self, item):
+        if self._overlay and item in self._overlay:
+            return True
+        return self._stored(item)
+
+    def _stored(self, item):
+        return bool(self._query(
+            "SELECT 1 FROM items WHERE map = ? AND item = ?", item
+        ))
+
+    def _stored_items(self):
+        return self._query(
+            "SELECT item, obfuscated FROM items WHERE map = ? ORDER BY seq"
+        )
+
+    def iter_items(self):
+        """Iterate over (item, obfuscated item) pairs"""
+        for item, obfuscated in self._stored_items():
+            if self._overlay and item in self._overlay:
+                continue
+            yield item, obfuscated
+        if self._overlay:
+            yield from self._overlay.items()
+
+    def __iter__(self):
+        for item, _ in self.iter_items():
+            yield item
+
+    def __len__(self):
+        _len = self._query("SELECT COUNT(*) FROM items WHERE map = ?")[0][0]
+        if self._overlay:
+            _len += len([i for i in self._overlay if not self._stored(i)])
+        return _len
+
+    def values(self):
+        return _StoreValuesView(self)
+
+    def items(self):
+        return _StoreItemsView(self)
+
+    def has_value(self, value):
+        """Check if an item has been obfuscated to the given value"""
+        if self._overlay and value in self._overlay.values():
+            return True
+        return bool(self._query(
+            "SELECT 1 FROM items WHERE map = ? AND obfuscated = ? LIMIT 1",
+            value
+        ))
+
+    def items_with_prefix(self, prefix):
+        """Get the (item, obfuscated item) pairs of items that start with
+        the given prefix, in the order they were added.
+        """
+        _items = self._query(
+            "SELECT item, obfuscated FROM items WHERE map = ? AND item >= ? "
+            "AND item < ? ORDER BY seq", prefix, prefix + _PREFIX_END
+        )
+        if self._overlay:
+            _items = [i for i in _items if i[0] not in self._overlay]
+            _items.extend(
+                i for i in self._overlay.items() if i[0].startswith(prefix)
+            )
+        return _items
+
+    def items_within(self, text):
+        """Get the items that occur within the given text, in the order they
+        were added.
+        """
+        _items = [
+            i[0] for i in self._query(
+                "SELECT item FROM items WHERE map = ? AND instr(?, item) > 0 "
+                "ORDER BY seq", text
+            )
+        ]
+        if self._overlay:
+            _items = [i for i in _items if i not in self._overlay]
+            _items.extend(i for i in self._overlay if i in text)
+        return _items
+
+    def values_with_prefix(self, prefix):
+        """Get the obfuscated items that start with the given prefix"""
+        _values = [
+            v[0] for v in self._query(
+                "SELECT obfuscated FROM items WHERE map = ? AND "
+                "obfuscated >= ? AND obfuscated < ?", prefix,
+                prefix + _PREFIX_END
+            )
+        ]
+        if self._overlay:
+            _values.extend(
+                v for v in self._overlay.values() if v.startswith(prefix)
+            )
+        return _values
+
+    def close(self):
+        self._conn.close()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,283 @@
+# Copyright 2020 Red Hat, Inc. Jake Hunsaker <jhunsake@redhat.com>
+
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import heapq
+import re
+
+from threading import Lock
+
+# marks a trie node as the end of a known item
+_END = None
+
+
+class SoSItemMatcher():
+    """A case-insensitive multi-pattern matcher for items already known to a
+    SoSMap.
+
+    Rather than keeping one compiled regex per known item and searching a
+    line once per item, all items are stored in a single character trie which
+    is then compiled into one regex. Since every branch of the trie begins
+    with a distinct character, the regex engine only ever follows the single
+    path dictated by the text being scanned, much like an Aho-Corasick
+    automaton, so a line is scanned once regardless of how many items are
+    known.
+
+    Items may be added at any time. Items added after the trie has been
+    compiled are held in a smaller secondary trie so that discovering new
+    items during obfuscation does not force a recompile of the full trie for
+    every new item. Once enough new items accumulate, they are folded into the
+    primary trie.
+
+    :param char_patterns:   Regex patterns to use in place of specific
+                            characters, e.g. to allow '.' to also match '_'
+    :type char_patterns:    ``dict``
+    """
+
+    # minimum number of newly added items before merging into the main trie
+    merge_threshold = 128
+
+    def __init__(self, char_patterns=None):
+        self.char_patterns = char_patterns or {}
+        self._char_regexes = {
+            char: re.compile(pattern, re.I)
+            for char, pattern in self.char_patterns.items()
+        }
+        self.items = {}
+        self.order = {}
+        self._trie = {}
+        self._pending = {}
+        self._pending_count = 0
+        self._regex = None
+        self._pending_regex = None
+        self._compiled = False
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item.lower() in self.items
+
+    def add(self, item):
+        """Add an item to the matcher.
+
+        :param item:    The unobfuscated item to match in future lines
+        :type item:     ``str``
+        """
+        key = item.lower()
+        with self.lock:
+            if not key or key in self.items:
+                return
+            self.items[key] = item
+            self.order[key] = len(self.order)
+            self._insert(self._trie, key)
+            if self._compiled:
+                self._insert(self._pending, key)
+                self._pending_count += 1
+                self._pending_regex = None
+
+    def _insert(self, trie, key):
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[_END] = True
+
+    def _char_pattern(self, char):
+        return self.char_patterns.get(char, re.escape(char))
+
+    def _build_pattern(self, trie):
+        """Build a regex string from a trie. Optional branches are greedy, so
+        the longest item from any given position is matched first.
+
+        The trie is as deep as the longest item, so it is walked with an
+        explicit stack rather than recursively, building the pattern of each
+        node once those of all its children are built.
+        """
+        patterns = {}
+        stack = [(trie, False)]
+        while stack:
+            node, visited = stack.pop()
+            chars = sorted(k for k in node if k is not _END)
+            if not visited:
+                stack.append((node, True))
+                stack.extend((node[char], False) for char in chars)
+                continue
+            branches = [
+                self._char_pattern(char) + patterns.pop(id(node[char]))
+                for char in chars
+            ]
+            if not branches:
+                pattern = ''
+            elif _END in node:
+                pattern = "(?:%s)?" % '|'.join(branches)
+            elif len(branches) == 1:
+                pattern = branches[0]
+            else:
+                pattern = "(?:%s)" % '|'.join(branches)
+            patterns[id(node)] = pattern
+        return patterns[id(trie)]
+
+    def _compile_trie(self, trie):
+        if not trie:
+            return None
+        # use a capturing lookahead so that the longest item starting at
+        # every position is reported, including those overlapping others
+        return re.compile("(?=(%s))" % self._build_pattern(trie), re.I)
+
+    def compile(self):
+        """Compile the full trie, folding in any pending items."""
+        with self.lock:
+            self._regex = self._compile_trie(self._trie)
+            self._pending = {}
+            self._pending_count = 0
+            self._pending_regex = None
+            self._compiled = True
+
+    def _get_regexes(self):
+        if not self._compiled or self._pending_count > max(
+                self.merge_threshold, len(self.items) // 10):
+            self.compile()
+        elif self._pending_count and self._pending_regex is None:
+            with self.lock:
+                self._pending_regex = self._compile_trie(self._pending)
+        return [r for r in (self._regex, self._pending_regex) if r]
+
+    def search(self, text):
+        """Check if any known item is present in the given text.
+
+        :param text:    The string to search
+        :type text:     ``str``
+
+        :returns:   True if any known item is in text, else False
+        :rtype:     ``bool``
+        """
+        if not self.items:
+            return False
+        return any(regex.search(text) for regex in self._get_regexes())
+
+    def find(self, line):
+        """Find all known items in the given line.
+
+        Longer items take precedence over shorter ones that overlap them, and
+        items of equal length are preferred in the order they were added, in
+        the same way that checking items one at a time in order of descending
+        length would.
+
+        :param line:    The string to search
+        :type line:     ``str``
+
+        :returns:   Non-overlapping (start, end, item) tuples, ordered by
+                    position in the line
+        :rtype:     ``list``
+        """
+        if not self.items:
+            return []
+        found = {}
+        for regex in self._get_regexes():
+            for match in regex.finditer(line):
+                if match.group(1):
+                    start = match.start(1)
+                    found[start] = max(found.get(start, 0), match.end(1))
+        if not found:
+            return []
+        candidates = [
+            self._candidate(line, start, end) for start, end in found.items()
+        ]
+        heapq.heapify(candidates)
+        matches = []
+        while candidates:
+            _, _, start, end, key = heapq.heappop(candidates)
+            if any(start < _end and _start < end
+                   for _start, _end, _ in matches):
+                # a longer item already claimed part of this match, but a
+                # shorter item may still start at the same position
+                shorter = self._prefix_ends(line, start, end)
+                if shorter:
+                    heapq.heappush(candidates,
+                                   self._candidate(line, start, shorter[-1]))
+                continue
+            matches.append((start, end, self.items[key]))
+        return sorted(matches)
+
+    def _candidate(self, line, start, end):
+        key = self._key_for(line[start:end])
+        return (start - end, self.order.get(key, 0), start, end, key)
+
+    def _key_for(self, text):
+        key = text.lower()
+        if key in self.items:
+            return key
+        # the text matched via one of the char_patterns, so walk every path
+        # through the trie that it may follow to find which item it is, as a
+        # character such as '_' may match both its own edge and that of '.'
+        paths = [(self._trie, '')]
+        for char in key:
+            paths = [
+                (node[_char], path + _char) for node, path in paths
+                for _char in self._trie_chars(node, char)
+            ]
+        keys = [path for node, path in paths if _END in node]
+        if not keys:
+            raise ValueError("matched text '%s' is not a known item" % text)
+        return min(keys, key=self.order.get)
+
+    def _trie_chars(self, node, char):
+        """Get the edges from a trie node that a character of text may
+        follow, i.e. its own and those of any char_patterns it matches.
+        """
+        chars = [char] if char in node else []
+        chars.extend(
+            _char for _char, pattern in self._char_regexes.items()
+            if _char != char and _char in node and pattern.fullmatch(char)
+        )
+        return chars
+
+    def _prefix_ends(self, line, start, end):
+        """Get the end positions of all items that begin at start and end
+        before the given end position.
+        """
+        ends = []
+        nodes = [self._trie]
+        for pos in range(start, end - 1):
+            nodes = [
+                node[_char] for node in nodes
+                for _char in self._trie_chars(node, line[pos].lower())
+            ]
+            if not nodes:
+                break
+            if any(_END in node for node in nodes):
+                ends.append(pos + 1)
+        return ends
+
+    def sub(self, line, repl):
+        """Replace all known items in a line.
+
+        :param line:    The string to perform substitutions on
+        :type line:     ``str``
+
+        :param repl:    Called with each matched item to get its replacement
+        :type repl:     ``callable``
+
+        :returns:   The substituted line and the number of substitutions made
+        :rtype:     ``tuple``, ``(str, int)``
+        """
+        matches = self.find(line)
+        if not matches:
+            return line, 0
+        parts = []
+        pos = 0
+        for start, end, item in matches:
+            parts.append(line[pos:start])
+            parts.append(repl(item))
+            pos = end
+        parts.append(line[pos:])
+        return ''.join(parts), len(matches)
+
+# vim: set et ts=4 sw=4 :
@@ -61,9 +61,14 @@ class SoSCleanerParser():
             self.skip_patterns.append(re.compile(p))
 
     def generate_item_regexes(self):
-        """Generate regexes for items the parser will be searching for
-        repeatedly without needing to generate them for every file and/or line
-        we process
+        """Build the matcher for items the parser will be searching for
+        repeatedly, so that it does not need to be rebuilt for every file
+        and/or line we process. The matcher is compiled the first time it is
+        used, and items added to the mapping later on are added to the
+        matcher incrementally.
+
+        Every item of the mapping is added to the matcher, which is held in
+        memory, including when the mapping's dataset is a SoSMapStore.
 
         Not used by all parsers.
         """
@@ -92,9 +97,26 @@ class SoSCleanerParser():
         count += _count
         return line, count
 
+    def may_match(self, text):
+        """Quickly check if a block of text, which may contain many lines,
+        contains anything this parser could obfuscate. If this returns False
+        then parse_line() would not change any line within the text.
+
+        :param text:    The text to check
+        :type text:     ``str``
+
+        :returns:   True if any line in text may need obfuscation
+        :rtype:     ``bool``
+        """
+        if self.compile_regexes and self.mapping.matcher.search(text):
+            return True
+        return any(re.search(pattern, text, re.I)
+                   for pattern in self.regex_patterns)
+
     def _parse_line_with_compiled_regexes(self, line):
         """Check the provided line against known items we have encountered
-        before and have pre-generated regex Pattern() objects for.
+        before, using the mapping's matcher to find all of them in a single
+        scan of the line.
 
         :param line:    The line to parse for possible matches for obfuscation
         :type line:     ``str``
@@ -102,12 +124,9 @@ class SoSCleanerParser():
         :returns:   The obfuscated line and the number of changes made
         :rtype:     ``str``, ``int``
         """
-        count = 0
-        for item, reg in self.mapping.compiled_regexes:
-            if reg.search(line):
-                line, _count = reg.subn(self.mapping.get(item.lower()), line)
-                count += _count
-        return line, count
+        return self.mapping.matcher.sub(
+            line, lambda item: self.mapping.get(item.lower())
+        )
 
     def _parse_line(self, line):
         """Check the provided line against the parser regex patterns to try
@@ -149,9 +168,8 @@ class SoSCleanerParser():
         :rtype: ``str``
         """
         if self.compile_regexes:
-            for item, reg in self.mapping.compiled_regexes:
-                if reg.search(string_data):
-                    string_data = reg.sub(self.mapping.get(item), string_data)
+            string_data, _ = self.mapping.matcher.sub(string_data,
+                                                      self.mapping.get)
         else:
             for k, ob in sorted(self.mapping.dataset.items(), reverse=True,
                                 key=lambda x: len(x[0])):
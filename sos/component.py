@@ -49,6 +49,8 @@ class SoSComponent():
     desc = 'unset'
 
     arg_defaults = {}
+    # the compression types that -z/--compression-type accepts
+    compression_types = ['auto', 'gzip', 'xz']
     configure_logging = True
     load_policy = True
     load_probe = True
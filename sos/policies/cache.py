@@ -0,0 +1,203 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import json
+import logging
+import os
+import stat
+import tempfile
+
+CACHE_DIR = '/var/cache/sos'
+
+# the cache in use, if enabled by enable_discovery_cache()
+_discovery_cache = None
+
+
+def enable_discovery_cache(path=CACHE_DIR):
+    """Enable the discovery cache for the rest of the run, so that host data
+    that is expensive to discover, such as the list of installed packages,
+    is reused from a previous run if it has not changed since.
+
+    :param path:    The directory to keep cached data in
+    :type path:     ``str``
+    """
+    global _discovery_cache
+    _discovery_cache = DiscoveryCache(path)
+
+
+def get_discovery_cache():
+    """Get the discovery cache, if it has been enabled
+
+    :returns:   The discovery cache, or None if it is not enabled
+    :rtype:     ``DiscoveryCache`` or ``None``
+    """
+    return _discovery_cache
+
+
+def path_stamp(paths, sysroot=None, size_only=()):
+    """Build a fingerprint of the modification times and sizes of a set of
+    files, and of the files directly within any of them that are directories,
+    that can be compared to a later fingerprint to cheaply detect if any of
+    them have changed.
+
+    :param paths:   The paths to fingerprint
+    :type paths:    ``list``
+
+    :param sysroot: The root the paths are relative to
+    :type sysroot:  ``str`` or ``None``
+
+    :param size_only:   Further paths to fingerprint by size alone, for files
+                        whose modification time changes without their content
+                        changing
+    :type size_only:    ``list``
+
+    :returns:   The fingerprint, or None if none of the paths exist
+    :rtype:     ``list`` or ``None``
+    """
+    stamp = []
+    for path in paths:
+        if sysroot:
+            path = os.path.join(sysroot, path.lstrip(os.sep))
+        try:
+            _stat = os.stat(path)
+        except OSError:
+            continue
+        stamp.append([path, _stat.st_mtime_ns, _stat.st_size])
+        if stat.S_ISDIR(_stat.st_mode):
+            with os.scandir(path) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    try:
+                        _stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    stamp.append([entry.path, _stat.st_mtime_ns,
+                                  _stat.st_size])
+    for path in size_only:
+        if sysroot:
+            path = os.path.join(sysroot, path.lstrip(os.sep))
+        try:
+            stamp.append([path, os.stat(path).st_size])
+        except OSError:
+            continue
+    return stamp or None
+
+
+class DiscoveryCache():
+    """A cache of host data discovered during a run, kept on disk so that
+    later runs can reuse it.
+
+    Each item is stored alongside a fingerprint of whatever the data was
+    discovered from, e.g. the modification time of the package database,
+    and is only used by a later run if the fingerprint still matches. Data
+    must be serializable to JSON.
+
+    The cache is only used if its directory is owned by the current user and
+    cannot be written to by anyone else. Any failure to read or write the
+    cache is logged and otherwise ignored, so that the data is discovered as
+    if the cache was not enabled.
+
+    :param path:    The directory to keep cached data in
+    :type path:     ``str``
+    """
+
+    def __init__(self, path=CACHE_DIR):
+        self.path = path
+        self.log = logging.getLogger('sos')
+
+    def _check_dir(self):
+        os.makedirs(self.path, 0o700, exist_ok=True)
+        _stat = os.stat(self.path)
+        if (_stat.st_uid != os.geteuid() or
+                _stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+            raise PermissionError("%s is not private to the current user"
+                                  % self.path)
+
+    def _item_path(self, name):
+        return os.path.join(self.path, "%s.json" % name)
+
+    def load(self, name, fingerprint):
+        """Load an item from the cache.
+
+        :param name:        The name of the item
+        :type name:         ``str``
+
+        :param fingerprint: The fingerprint the item must have been stored
+                            with to be used
+        :type fingerprint:  Any JSON serializable value
+
+        :returns:   The cached data, or None if there is no cached data with
+                    a matching fingerprint
+        """
+        try:
+            self._check_dir()
+            with open(self._item_path(name), 'r') as item:
+                cached = json.load(item)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            self.log.debug("Unable to load %s from discovery cache: %s"
+                           % (name, err))
+            return None
+        if not isinstance(cached, dict) or cached.get('fingerprint') != \
+                json.loads(json.dumps(fingerprint)):
+            return None
+        return cached.get('data')
+
+    def store(self, name, fingerprint, data):
+        """Store an item in the cache, replacing any previous version of it.
+
+        :param name:        The name of the item
+        :type name:         ``str``
+
+        :param fingerprint: A fingerprint of what the data was discovered from
+        :type fingerprint:  Any JSON serializable value
+
+        :param data:        The data to store
+        :type data:         Any JSON serializable value
+        """
+        try:
+            self._check_dir()
+            fd, tmp = tempfile.mkstemp(prefix=".%s." % name, dir=self.path)
+            try:
+                with os.fdopen(fd, 'w') as item:
+                    json.dump({'fingerprint': fingerprint, 'data': data},
+                              item)
+                os.replace(tmp, self._item_path(name))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except (OSError, TypeError, ValueError) as err:
+            self.log.debug("Unable to store %s in discovery cache: %s"
+                           % (name, err))
+
+    def get(self, name, fingerprint, func):
+        """Get an item from the cache, discovering and storing it if it is
+        not cached or its fingerprint has changed.
+
+        :param name:        The name of the item
+        :type name:         ``str``
+
+        :param fingerprint: A fingerprint of what the data is discovered from.
+                            If None, the cache is not used
+        :type fingerprint:  Any JSON serializable value
+
+        :param func:        Called to discover the data
+        :type func:         ``callable``
+
+        :returns:   The cached or discovered data
+        """
+        if fingerprint is None:
+            return func()
+        data = self.load(name, fingerprint)
+        if data is None:
+            data = func()
+            if data:
+                self.store(name, fingerprint, data)
+        return data
+
+# vim: set et ts=4 sw=4 :
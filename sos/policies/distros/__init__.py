@@ -22,14 +22,7 @@ from sos.policies.runtimes.podman import PodmanContainerRuntime
 from sos.policies.runtimes.docker import DockerContainerRuntime
 
 from sos.utilities import (shell_out, is_executable, bold,
-                           sos_get_command_output)
-
-
-try:
-    import requests
-    REQUESTS_LOADED = True
-except ImportError:
-    REQUESTS_LOADED = False
+                           sos_get_command_output, load_requests)
 
 # Container environment variables for detecting if we're in a container
 ENV_CONTAINER = 'container'
@@ -464,6 +457,7 @@ class LinuxPolicy(Policy):
         if not password:
             password = self.get_upload_password()
 
+        requests = load_requests()
         return requests.auth.HTTPBasicAuth(user, password)
 
     def get_upload_url(self):
@@ -626,6 +620,7 @@ class LinuxPolicy(Policy):
 
         :param archive:     The open archive file object
         """
+        requests = load_requests()
         return requests.put(self.get_upload_url(), data=archive,
                             auth=self.get_upload_https_auth(),
                             verify=verify)
@@ -646,6 +641,7 @@ class LinuxPolicy(Policy):
             'file': (archive.name.split('/')[-1], archive,
                      self._get_upload_headers())
         }
+        requests = load_requests()
         return requests.post(self.get_upload_url(), files=files,
                              auth=self.get_upload_https_auth(),
                              verify=verify)
@@ -658,7 +654,7 @@ class LinuxPolicy(Policy):
 
         :raises: ``Exception`` if upload was unsuccessful
         """
-        if not REQUESTS_LOADED:
+        if not load_requests():
             raise Exception("Unable to upload due to missing python requests "
                             "library")
 
@@ -19,15 +19,9 @@ from sos.presets.redhat import (RHEL_PRESETS, ATOMIC_PRESETS, RHV, RHEL,
                                 ATOMIC)
 from sos.policies.distros import LinuxPolicy, ENV_HOST_SYSROOT
 from sos.policies.package_managers.rpm import RpmPackageManager
-from sos.utilities import bold
+from sos.utilities import bold, load_requests
 from sos import _sos as _
 
-try:
-    import requests
-    REQUESTS_LOADED = True
-except ImportError:
-    REQUESTS_LOADED = False
-
 OS_RELEASE = "/etc/os-release"
 RHEL_RELEASE_STR = "Red Hat Enterprise Linux"
 ATOMIC_RELEASE_STR = "Atomic"
@@ -322,7 +316,8 @@ support representative.
         if RH_SFTP_HOST.split('//')[1] not in self.get_upload_url():
             return super(RHELPolicy, self).upload_sftp()
 
-        if not REQUESTS_LOADED:
+        requests = load_requests()
+        if not requests:
             raise Exception("python3-requests is not installed and is required"
                             " for obtaining SFTP auth token.")
         _token = None
@@ -9,7 +9,7 @@
 # See the LICENSE file in the source distribution for further information.
 
 from sos.policies.init_systems import InitSystem
-from sos.utilities import shell_out
+from sos.utilities import shell_out, sos_get_command_output
 
 
 class SystemdInit(InitSystem):
@@ -22,6 +22,8 @@ class SystemdInit(InitSystem):
             query_cmd='status',
             chroot=chroot
         )
+        self.states_cmd = ("%s list-units --all --type=service --no-legend "
+                           "--plain --no-pager" % self.init_cmd)
         self.load_all_services()
 
     def parse_query(self, output):
@@ -42,6 +44,34 @@ class SystemdInit(InitSystem):
                 }
             except IndexError:
                 pass
+        self.load_service_states()
+
+    def load_service_states(self):
+        """Load the state of every service with a single systemctl call,
+        rather than querying each service with `systemctl status` the first
+        time its state is checked. If the states cannot be listed, services
+        are still queried individually.
+        """
+        res = sos_get_command_output(self.states_cmd, chroot=self.chroot)
+        if res['status'] == 0:
+            self.parse_service_states(res['output'])
+
+    def parse_service_states(self, output):
+        """Set the status of known services from the output of
+        `states_cmd`, which lists every unit systemd has loaded. A service
+        that is not listed is not loaded, and so is inactive.
+
+        :param output: The output of `states_cmd`
+        :type output: ``str``
+        """
+        states = {}
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) < 4 or not fields[0].endswith('.service'):
+                continue
+            states[fields[0][:-len('.service')]] = (fields[2], line)
+        for name, svc in self.services.items():
+            svc['status'], svc['output'] = states.get(name, ('inactive', ''))
 
     def is_running(self, name, default=False):
         try:
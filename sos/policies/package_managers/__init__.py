@@ -8,11 +8,22 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
+import os
 import re
 import fnmatch
 
+from bisect import bisect_left
+from threading import Lock
+from sos.policies.cache import get_discovery_cache, path_stamp
 from sos.utilities import sos_get_command_output
 
+# characters that make a package name a glob, rather than an exact name
+_GLOB_CHARS = re.compile(r'[*?\[]')
+# the leading characters of a regex that can only match themselves
+_REGEX_LITERAL = re.compile(r'[\w\-]*')
+# sorts after any other character, used as the upper bound of prefix lookups
+_PREFIX_END = chr(0x10ffff)
+
 
 class PackageManager():
     """Encapsulates a package manager. If you provide a query_command to the
@@ -37,6 +48,21 @@ class PackageManager():
     :cvar files_command: The command to use for getting file lists for packages
     :vartype files_command: ``str`` or ``None``
 
+    :cvar file_owners_command: The command to use for listing every file known
+                               to the package manager, one per line, with the
+                               package that owns it after a tab
+    :vartype file_owners_command: ``str`` or ``None``
+
+    :cvar db_paths: The files and directories of the package database, that
+                    are checked to see if data cached by a previous run is
+                    still valid
+    :vartype db_paths: ``tuple``
+
+    :cvar db_size_paths: Files of the package database that are only checked
+                         by size, as their modification time also changes on
+                         read-only queries
+    :vartype db_size_paths: ``tuple``
+
     :cvar chroot: Perform a chroot when executing `files_command`
     :vartype chroot: ``bool``
 
@@ -50,12 +76,19 @@ class PackageManager():
     verify_filter = None
     files_command = None
     query_path_command = None
+    file_owners_command = None
+    db_paths = ()
+    db_size_paths = ()
     chroot = None
     files = None
 
     def __init__(self, chroot=None, remote_exec=None):
         self._packages = {}
+        # see _get_index()
+        self._index = None
         self.files = []
+        self._file_owners = None
+        self._file_owners_lock = Lock()
         self.remote_exec = remote_exec
 
         if chroot:
@@ -64,9 +97,30 @@ class PackageManager():
     @property
     def packages(self):
         if not self._packages:
-            self._generate_pkg_list()
+            if self.db_paths and get_discovery_cache():
+                self._packages = self._get_cached('packages',
+                                                  self._load_packages)
+            else:
+                self._generate_pkg_list()
         return self._packages
 
+    def _load_packages(self):
+        self._generate_pkg_list()
+        return self._packages
+
+    def _get_cached(self, name, func):
+        """Get data from the discovery cache, which is only valid for as
+        long as the package database is unchanged, calling func to get the
+        data if it is not cached.
+        """
+        stamp = None
+        if not self.remote_exec:
+            stamp = path_stamp(self.db_paths, sysroot=self.chroot,
+                               size_only=self.db_size_paths)
+        return get_discovery_cache().get(
+            "%s-%s" % (self.manager_name, name), stamp, func
+        )
+
     @property
     def manager_name(self):
         return self.__class__.__name__.lower().split('package')[0]
@@ -112,17 +166,59 @@ class PackageManager():
         # all by returning nothing.
         return ''
 
+    def _get_index(self):
+        """Get the index used to look up packages by name. This is the
+        package names in sorted order, so that every name with a given prefix
+        can be found with a binary search, along with the position of each
+        name in `packages`, so that lookups return packages in the same order
+        as a scan of `packages` would. The index is rebuilt if packages are
+        added after it is built.
+        """
+        pkgs = self.packages
+        index = self._index
+        if index is None or index[0] != len(pkgs):
+            order = {name: idx for idx, name in enumerate(pkgs)}
+            index = (len(pkgs), sorted(order), order)
+            self._index = index
+        return index
+
+    def _names_with_prefix(self, prefix):
+        _, names, order = self._get_index()
+        if not prefix:
+            return list(order)
+        start = bisect_left(names, prefix)
+        end = bisect_left(names, prefix + _PREFIX_END, start)
+        return sorted(names[start:end], key=order.get)
+
     def all_pkgs_by_name(self, name):
         """
         Get a list of packages that match name.
 
-        :param name: The name of the package
+        :param name: The name of the package, or a shell-style glob to match
+                     package names against
         :type name: ``str``
 
         :returns: List of all packages matching `name`
         :rtype: ``list``
         """
-        return fnmatch.filter(self.packages.keys(), name)
+        glob = _GLOB_CHARS.search(name)
+        if not glob:
+            return [name] if name in self.packages else []
+        return fnmatch.filter(self._names_with_prefix(name[:glob.start()]),
+                              name)
+
+    def are_installed(self, names):
+        """
+        Check which of several packages are installed.
+
+        :param names: The names of the packages, or shell-style globs to
+                      match package names against
+        :type names: ``list``
+
+        :returns: Whether any package matching each name is installed
+        :rtype: ``dict``
+        """
+        return {name: bool(self.all_pkgs_by_name(name)) for name in names}
 
     def all_pkgs_by_name_regex(self, regex_name, flags=0):
         """
@@ -137,7 +233,15 @@ class PackageManager():
         :rtype: ``list``
         """
         reg = re.compile(regex_name, flags)
-        return [pkg for pkg in self.packages.keys() if reg.match(pkg)]
+        prefix = ''
+        if (isinstance(regex_name, str) and '|' not in regex_name and
+                not reg.flags & re.IGNORECASE):
+            prefix = _REGEX_LITERAL.match(regex_name).group()
+            # a quantifier applies to the last literal character
+            if regex_name[len(prefix):len(prefix) + 1] in ('?', '*', '{'):
+                prefix = prefix[:-1]
+        return [pkg for pkg in self._names_with_prefix(prefix)
+                if reg.match(pkg)]
 
     def pkg_by_name(self, name):
         """
@@ -228,11 +332,62 @@ class PackageManager():
         :rtype: ``list``
         """
         if self.files_command and not self.files:
+            if self.file_owners:
+                self.files = list(self.file_owners)
+                return self.files
             cmd = self.files_command
             files = self.exec_cmd(cmd, timeout=180, chroot=self.chroot)
             self.files = files.splitlines()
         return self.files
 
+    def _generate_file_owners(self):
+        """Generate the (path, package) pairs of every file known to the
+        package manager, for the `file_owners` index. By default this parses
+        the output of `file_owners_command`, if one is set.
+        """
+        if not self.file_owners_command:
+            return
+        owners = self.exec_cmd(self.file_owners_command, timeout=180,
+                               chroot=self.chroot)
+        for line in owners.splitlines():
+            path, _, pkg = line.partition('\t')
+            if pkg:
+                yield path, pkg
+
+    @property
+    def file_owners(self):
+        """An index of the packages that own each file known to the package
+        manager, built the first time it is used so that the owners of any
+        number of paths can be looked up without querying the package manager
+        for each one.
+
+        :returns: The owning packages of each path, or an empty dict if the
+                  package manager cannot list them
+        :rtype: ``dict``
+        """
+        if self._file_owners is None:
+            with self._file_owners_lock:
+                if self._file_owners is None:
+                    if self.db_paths and get_discovery_cache():
+                        self._file_owners = self._get_cached(
+                            'file_owners', self._load_file_owners
+                        )
+                    else:
+                        self._file_owners = self._load_file_owners()
+        return self._file_owners
+
+    def _load_file_owners(self):
+        owners = {}
+        for path, pkg in self._generate_file_owners():
+            owners.setdefault(path, []).append(pkg)
+        return owners
+
+    def _format_owners(self, path, owners):
+        """Format the owners of a path found in `file_owners` in the same
+        way as the output of `query_path_command`
+        """
+        return owners
+
     def pkg_by_path(self, path):
         """Given a path, return the package that owns that path.
 
@@ -244,6 +399,13 @@ class PackageManager():
         """
         if not self.query_path_command:
             return 'unknown'
+        if self.file_owners:
+            owners = self.file_owners.get(os.path.normpath(path))
+            if not owners and not self.chroot:
+                owners = self.file_owners.get(os.path.realpath(path))
+            if not owners:
+                return 'unknown'
+            return self._format_owners(path, owners)
         try:
             cmd = f"{self.query_path_command} {path}"
             pkg = self.exec_cmd(cmd, timeout=5, chroot=self.chroot)
@@ -251,6 +413,17 @@ class PackageManager():
         except Exception:
             return 'unknown'
 
+    def pkgs_by_paths(self, paths):
+        """Given several paths, return the package that owns each of them.
+
+        :param paths:   The filepaths to check for package ownership
+        :type paths:    ``list``
+
+        :returns:       The package names, or 'unknown', for each path
+        :rtype:         ``dict``
+        """
+        return {path: self.pkg_by_path(path) for path in paths}
+
     def build_verify_command(self, packages):
         """build_verify_command(self, packages) -> str
             Generate a command to verify the list of packages given
@@ -390,7 +563,8 @@ class MultiPackageManager(PackageManager):
         # which case we only want to use the one actually defined here, or
         # _pm_wrapper, which we need to avoid this override for to not hit
         # recursion hell.
-        if item in ['_generate_pkg_list', '_pm_wrapper', 'all_files']:
+        if item in ['_generate_pkg_list', '_pm_wrapper', 'all_files',
+                    'are_installed', 'pkgs_by_paths']:
             return super().__getattribute__(item)
         attr = super().__getattribute__(item)
         if hasattr(attr, '__call__'):
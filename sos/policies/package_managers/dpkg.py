@@ -8,6 +8,8 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
+import os
+
 from sos.policies.package_managers import PackageManager
 
 
@@ -18,6 +20,7 @@ class DpkgPackageManager(PackageManager):
     query_command = "dpkg-query -W -f='${Package}|${Version}|${Status}\\n'"
     query_path_command = "dpkg -S"
     verify_command = "dpkg --verify"
+    db_paths = ('/var/lib/dpkg/status',)
     verify_filter = ""
 
     def _parse_pkg_list(self, pkg_list):
@@ -29,4 +32,28 @@ class DpkgPackageManager(PackageManager):
                 continue
             yield (name, version, None)
 
+    def _generate_file_owners(self):
+        # dpkg keeps the list of files installed by each package in its
+        # database, which is quicker to read directly than to query
+        if self.remote_exec:
+            return
+        info = os.path.join(self.chroot or '/', 'var/lib/dpkg/info')
+        try:
+            lists = [f for f in os.listdir(info) if f.endswith('.list')]
+        except OSError:
+            return
+        for fname in lists:
+            pkg = fname[:-len('.list')]
+            try:
+                with open(os.path.join(info, fname), 'r',
+                          errors='surrogateescape') as files:
+                    for path in files:
+                        yield path.rstrip('\n'), pkg
+            except OSError:
+                continue
+
+    def _format_owners(self, path, owners):
+        # as output by `dpkg -S`
+        return ["%s: %s" % (', '.join(owners), path)]
+
 # vim: set et ts=4 sw=4 :
@@ -18,7 +18,21 @@ class RpmPackageManager(PackageManager):
     query_command = 'rpm -qa --queryformat "%{NAME}|%{VERSION}|%{RELEASE}\\n"'
     query_path_command = 'rpm -qf'
     files_command = 'rpm -qal'
+    file_owners_command = (
+        "rpm -qa --queryformat "
+        "'[%{FILENAMES}\\t%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}\\n]'"
+    )
     verify_command = 'rpm -V'
+    # only the files that hold the package headers, for the sqlite, ndb and
+    # bdb backends. The sqlite shared memory file and the lock files are
+    # touched by every query, so are left out
+    db_paths = tuple(
+        '%s/%s' % (_dir, _db)
+        for _dir in ('/usr/lib/sysimage/rpm', '/var/lib/rpm')
+        for _db in ('rpmdb.sqlite', 'Packages.db', 'Packages')
+    )
+    db_size_paths = ('/usr/lib/sysimage/rpm/rpmdb.sqlite-wal',
+                     '/var/lib/rpm/rpmdb.sqlite-wal')
     verify_filter = ["debuginfo", "-devel"]
 
     def _parse_pkg_list(self, pkg_list):
@@ -12,27 +12,35 @@ import sys
 import traceback
 import os
 import errno
+import itertools
+import json
 import logging
+import threading
+import time
 
 from datetime import datetime
 import glob
 import sos.report.plugins
 from sos.utilities import (ImporterHelper, SoSTimeoutError, bold,
                            sos_get_command_output, TIMEOUT_DEFAULT, listdir,
-                           is_executable)
+                           is_executable, StatCache, PredicateCache)
 from shutil import rmtree
 import hashlib
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
-import pdb
 
 from sos import _sos as _
 from sos import __version__
+from sos.archive import TarFileArchive
 from sos.component import SoSComponent
 import sos.policies
+from sos.report.scheduler import (PluginScheduler, load_plugin_run_times,
+                                  load_command_sizes)
+from sos.report.plugin_index import PluginIndex
+from sos.report.profiler import Profiler, PROFILE_PATH
+from sos.policies.cache import enable_discovery_cache
 from sos.report.reporting import (Report, Section, Command, CopiedFile,
                                   CreatedFile, Alert, Note, PlainTextReport,
                                   JSONReport, HTMLReport)
-from sos.cleaner import SoSCleaner
 
 # file system errors that should terminate a run
 fatal_fs_errors = (errno.ENOSPC, errno.EROFS)
@@ -75,6 +83,9 @@ class SoSReport(SoSComponent):
 
     desc = "Collect files and command output in an archive"
     root_required = True
+    # zstd archives cannot yet be read by sos clean, so only sos report may
+    # create them
+    compression_types = SoSComponent.compression_types + ['zstd']
 
     arg_defaults = {
         'alloptions': False,
@@ -88,6 +99,7 @@ class SoSReport(SoSComponent):
         'desc': '',
         'domains': [],
         'disable_parsers': [],
+        'discovery_cache': False,
         'dry_run': False,
         'estimate_only': False,
         'experimental': False,
@@ -114,10 +126,15 @@ class SoSReport(SoSComponent):
         'note': '',
         'only_plugins': [],
         'preset': 'auto',
+        'plugin_history': [],
         'plugin_timeout': TIMEOUT_DEFAULT,
+        'cmd_concurrency': 1,
         'cmd_timeout': TIMEOUT_DEFAULT,
         'profiles': [],
+        'profile_summary': 0,
+        'profile_trace': False,
         'since': None,
+        'stream_archive': False,
         'verify': False,
         'allow_system_changes': False,
         'usernames': [],
@@ -144,6 +161,13 @@ class SoSReport(SoSComponent):
         self.sysroot = "/"
         self.preset = None
         self.estimated_plugsizes = {}
+        self.estimated_cmd_sizes = {}
+        # shared by all plugins, to avoid repeatedly stat'ing the same files
+        self.stat_cache = StatCache()
+        # shared by all predicates, so that each check is only made once
+        self.predicate_cache = PredicateCache()
+        self.profiler = Profiler(bool(self.opts.profile_trace or
+                                      self.opts.profile_summary))
 
         self.print_header()
         self._set_debug()
@@ -193,6 +217,13 @@ class SoSReport(SoSComponent):
         self._get_namespaces()
         self._get_hardware_devices()
 
+    def load_local_policy(self):
+        # the policy discovers packages as it is loaded, so the cache must be
+        # enabled first
+        if self.opts.discovery_cache:
+            enable_discovery_cache()
+        super(SoSReport, self).load_local_policy()
+
     @classmethod
     def add_parser_options(cls, parser):
         report_grp = parser.add_argument_group(
@@ -227,13 +258,17 @@ class SoSReport(SoSComponent):
         report_grp.add_argument("--desc", "--description", type=str,
                                 action="store", default="",
                                 help="Description for a new preset",)
+        report_grp.add_argument("--discovery-cache", action="store_true",
+                                dest="discovery_cache", default=False,
+                                help="Reuse host data such as the package "
+                                     "list from previous runs if unchanged")
         report_grp.add_argument("--dry-run", action="store_true",
                                 help="Run plugins but do not collect data")
         report_grp.add_argument("--estimate-only", action="store_true",
                                 help="Approximate disk space requirements for "
-                                     "a real sos run; disables --clean and "
-                                     "--collect, sets --threads=1 and "
-                                     "--no-postproc")
+                                     "a real sos run without collecting data; "
+                                     "disables --clean and --upload, sets "
+                                     "--build and --no-postproc")
         report_grp.add_argument("--experimental", action="store_true",
                                 dest="experimental", default=False,
                                 help="enable experimental plugins")
@@ -292,21 +327,42 @@ class SoSReport(SoSComponent):
                                 help="enable these plugins only", default=[])
         report_grp.add_argument("--preset", action="store", type=str,
                                 help="A preset identifier", default="auto")
+        report_grp.add_argument("--plugin-history", action="extend",
+                                dest="plugin_history", type=str, default=[],
+                                help="start plugins in order of their run "
+                                     "times in these previous reports")
         report_grp.add_argument("--plugin-timeout", default=None,
                                 help="set a timeout for all plugins")
         report_grp.add_argument("--cmd-timeout", default=None,
                                 help="set a command timeout for all plugins")
+        report_grp.add_argument("--cmd-concurrency", default=1, type=int,
+                                help="number of commands each plugin may run "
+                                     "at the same time")
         report_grp.add_argument("-p", "--profile", "--profiles",
                                 action="extend", dest="profiles", type=str,
                                 default=[],
                                 help="enable plugins used by the given "
                                      "profiles")
+        report_grp.add_argument("--profile-summary", nargs='?', const=10,
+                                default=0, type=int, metavar='N',
+                                dest="profile_summary",
+                                help="time the run and show the N slowest "
+                                     "items at the end (default 10)")
+        report_grp.add_argument("--profile-trace", action="store_true",
+                                dest="profile_trace", default=False,
+                                help="time the run and save a trace of it "
+                                     "in the report")
         report_grp.add_argument('--skip-commands', default=[], action='extend',
                                 dest='skip_commands',
                                 help="do not execute these commands")
         report_grp.add_argument('--skip-files', default=[], action='extend',
                                 dest='skip_files',
                                 help="do not collect these files")
+        report_grp.add_argument("--stream-archive", action="store_true",
+                                dest="stream_archive", default=False,
+                                help="write collected files that are not "
+                                     "post-processed directly to the final "
+                                     "archive")
         report_grp.add_argument("--verify", action="store_true",
                                 dest="verify", default=False,
                                 help="perform data verification during "
@@ -694,7 +750,10 @@ class SoSReport(SoSComponent):
             'verbosity': self.opts.verbosity,
             'cmdlineopts': self.opts,
             'devices': self.devices,
-            'namespaces': self.namespaces
+            'namespaces': self.namespaces,
+            'stat_cache': self.stat_cache,
+            'predicate_cache': self.predicate_cache,
+            'profiler': self.profiler
         }
 
     def get_temp_file(self):
@@ -730,6 +789,7 @@ class SoSReport(SoSComponent):
                                       file=sys.stdout)
             print()
             # ...then start the debugger in post-mortem mode.
+            import pdb
             pdb.pm()
 
     def handle_exception(self, plugname=None, func=None):
@@ -740,6 +800,7 @@ class SoSReport(SoSComponent):
             traceback.print_exception(etype, val, tb, file=sys.stdout)
             print()
             # ...then start the debugger in post-mortem mode.
+            import pdb
             pdb.post_mortem(tb)
         if plugname and func:
             self._log_plugin_exception(plugname, func)
@@ -796,10 +857,29 @@ class SoSReport(SoSComponent):
             plugin_class(self.get_commons())
         ))
 
+    def _is_excluded(self, plugin_name, index_classes):
+        """Check if a plugin would not be loaded because of the plugins and
+        profiles requested, using only the profiles of its classes in the
+        plugin index, so that its module need not be imported.
+        """
+        if self._is_skipped(plugin_name):
+            return True
+        if not self.opts.profiles:
+            return bool(self._is_not_specified(plugin_name))
+        if self.opts.only_plugins and not self._is_not_specified(plugin_name):
+            return False
+        return not any(p in self.opts.profiles
+                       for entry in index_classes
+                       for p in entry['profiles'])
+
     def load_plugins(self):
         import_plugin = sos.report.plugins.import_plugin
+        resolve_triggers = sos.report.plugins.resolve_plugin_triggers
         helper = ImporterHelper(sos.report.plugins)
         plugins = helper.get_modules()
+        index = PluginIndex(sos.report.plugins, sos.report.plugins.Plugin)
+        # plugins that are skipped are only reported when listing them
+        listing = self.opts.list_plugins or self.opts.list_profiles
         self.plugin_names = []
         self.profiles = set()
         using_profiles = len(self.opts.profiles)
@@ -812,10 +892,20 @@ class SoSReport(SoSComponent):
         validate_plugin = self.policy.validate_plugin
         remaining_profiles = list(self.opts.profiles)
 
-        # validate and load plugins
+        # validate plugins
+        candidates = []
         for plug in plugins:
             plugbase, ext = os.path.splitext(plug)
             try:
+                index_classes = index.get_classes(plugbase,
+                                                  valid_plugin_classes)
+                if not index_classes:
+                    # no valid plugin classes for this policy
+                    continue
+                if not listing and self._is_excluded(plugbase, index_classes):
+                    self.plugin_names.append(plugbase)
+                    continue
+
                 plugin_classes = import_plugin(plugbase, valid_plugin_classes)
                 if not len(plugin_classes):
                     # no valid plugin classes for this policy
@@ -833,7 +923,27 @@ class SoSReport(SoSComponent):
 
                 # plug-in is valid, let's decide whether run it or not
                 self.plugin_names.append(plugbase)
+                candidates.append((plug, plugbase, plugin_class))
+            except Exception as e:
+                self.soslog.warning(_("plugin %s does not install, "
+                                      "skipping: %s") % (plug, e))
+                self.handle_exception()
+
+        # check the triggers of all plugins that may be loaded together,
+        # before each plugin checks if it is enabled
+        try:
+            resolve_triggers([
+                plugin_class for _, plugbase, plugin_class in candidates
+                if self._is_in_profile(plugin_class) and
+                not self._is_skipped(plugbase)
+            ], self.get_commons())
+        except Exception as e:
+            self.soslog.debug("Unable to check plugin triggers together: %s"
+                              % e)
 
+        # load plugins
+        for plug, plugbase, plugin_class in candidates:
+            try:
                 in_profile = self._is_in_profile(plugin_class)
                 if not in_profile:
                     self._skip(plugin_class, _("excluded"))
@@ -869,6 +979,7 @@ class SoSReport(SoSComponent):
                 self.soslog.warning(_("plugin %s does not install, "
                                       "skipping: %s") % (plug, e))
                 self.handle_exception()
+        index.save()
         if len(remaining_profiles) > 0:
             self.soslog.error(_("Unknown or inactive profile(s) provided:"
                                 " %s") % ", ".join(remaining_profiles))
@@ -942,7 +1053,6 @@ class SoSReport(SoSComponent):
                 self.soslog.error('')
 
     def _check_for_unknown_plugins(self):
-        import itertools
         for plugin in itertools.chain(self.opts.only_plugins,
                                       self.opts.enable_plugins):
             plugin_name = plugin.split(".")[0]
@@ -966,9 +1076,6 @@ class SoSReport(SoSComponent):
         # and return a corresponding log messages string
         msg = "\nEstimate-only mode enabled"
         ext_msg = []
-        if self.opts.threads > 1:
-            ext_msg += ["--threads=%s overriden to 1" % self.opts.threads, ]
-            self.opts.threads = 1
         if not self.opts.build:
             ext_msg += ["--build enabled", ]
             self.opts.build = True
@@ -1218,36 +1325,59 @@ class SoSReport(SoSComponent):
             self.ui_log.error(e)
         self._exit(1)
 
+    def _setup_plugin(self, plug):
+        """Run the setup of a single plugin, recording the time it took in
+        the plugin's manifest. This is run concurrently for several plugins,
+        from setup().
+        """
+        start = datetime.now()
+        plug.manifest.add_field('setup_start', start)
+        plug.archive = self.archive
+        with self.profiler.span(plug.name(), 'setup'):
+            plug.add_default_collections()
+            plug.setup()
+            with self._setup_lock:
+                self.env_vars.update(plug._env_vars)
+            if self.opts.verify:
+                plug.setup_verify()
+        end = datetime.now()
+        plug.manifest.add_field('setup_end', end)
+        plug.manifest.add_field('setup_time', end - start)
+
     def setup(self):
         self.ui_log.info(_(" Setting up plugins ..."))
+        # add manifest sections up front so that their order does not depend
+        # on which plugin finishes setting up first
         for plugname, plug in self.loaded_plugins:
-            try:
-                self.report_md.plugins.add_section(plugname)
-                plug.set_plugin_manifest(getattr(self.report_md.plugins,
-                                                 plugname))
-                start = datetime.now()
-                plug.manifest.add_field('setup_start', start)
-                plug.archive = self.archive
-                plug.add_default_collections()
-                plug.setup()
-                self.env_vars.update(plug._env_vars)
-                if self.opts.verify:
-                    plug.setup_verify()
-                end = datetime.now()
-                plug.manifest.add_field('setup_end', end)
-                plug.manifest.add_field('setup_time', end - start)
-            except KeyboardInterrupt:
-                raise
-            except (OSError, IOError) as e:
-                if e.errno in fatal_fs_errors:
-                    self.ui_log.error("")
-                    self.ui_log.error(" %s while setting up plugins"
-                                      % e.strerror)
-                    self.ui_log.error("")
-                    self._exit(1)
-                self.handle_exception(plugname, "setup")
-            except Exception:
-                self.handle_exception(plugname, "setup")
+            self.report_md.plugins.add_section(plugname)
+            plug.set_plugin_manifest(getattr(self.report_md.plugins,
+                                             plugname))
+        self._setup_lock = threading.Lock()
+        with ThreadPoolExecutor(self.opts.threads) as executor:
+            futures = [
+                executor.submit(self._setup_plugin, plug)
+                for plugname, plug in self.loaded_plugins
+            ]
+            for (plugname, plug), future in zip(self.loaded_plugins,
+                                                futures):
+                try:
+                    future.result()
+                except KeyboardInterrupt:
+                    for _future in futures:
+                        _future.cancel()
+                    raise
+                except (OSError, IOError) as e:
+                    if e.errno in fatal_fs_errors:
+                        self.ui_log.error("")
+                        self.ui_log.error(" %s while setting up plugins"
+                                          % e.strerror)
+                        self.ui_log.error("")
+                        for _future in futures:
+                            _future.cancel()
+                        self._exit(1)
+                    self.handle_exception(plugname, "setup")
+                except Exception:
+                    self.handle_exception(plugname, "setup")
 
     def version(self):
         """Fetch version information from all plugins and store in the report
@@ -1259,25 +1389,105 @@ class SoSReport(SoSComponent):
         self.archive.add_string(content="\n".join(versions),
                                 dest='version.txt')
 
+    def _start_archive_stream(self):
+        """Start writing the final archive before collection, so that files
+        which no plugin will post-process can be written directly to it.
+
+        Any file collected by a plugin that post-processes its collections,
+        or that is below a directory collected by one, is still copied to the
+        archive root so that it may be modified before the archive is built.
+        """
+        if not self.opts.stream_archive:
+            return
+        if self.opts.build or self.opts.clean:
+            self.soslog.info("--stream-archive is not used with --build, "
+                             "--clean or --estimate-only")
+            return
+        if not isinstance(self.archive, TarFileArchive):
+            return
+        staged_paths = set()
+        if not self.opts.no_postproc:
+            for plugname, plug in self.loaded_plugins:
+                if plug.has_postproc():
+                    staged_paths.update(plug.copy_paths)
+        self.archive.start_stream(self.opts.compression_type, staged_paths)
+
+    def _get_plugin_costs(self):
+        """Get the expected cost in seconds of collecting each plugin, from
+        the run times recorded in any reports given by --plugin-history, or
+        else from the collect_cost of the plugin.
+        """
+        run_times = {}
+        if self.opts.plugin_history:
+            try:
+                run_times = load_plugin_run_times(self.opts.plugin_history)
+            except (OSError, ValueError) as err:
+                self.soslog.warning("Unable to load plugin run times from "
+                                    "--plugin-history: %s" % err)
+        return {
+            plugname: run_times.get(plugname, plug.collect_cost)
+            for plugname, plug in self.loaded_plugins
+        }
+
+    def _get_estimated_cmd_sizes(self):
+        """Get the output sizes of commands from any reports given by
+        --plugin-history, so that --estimate-only need not run them.
+        """
+        if not self.opts.plugin_history:
+            return {}
+        try:
+            return load_command_sizes(self.opts.plugin_history)
+        except (OSError, ValueError) as err:
+            self.soslog.warning("Unable to load command sizes from "
+                                "--plugin-history: %s" % err)
+        return {}
+
+    def _get_plugin_scheduler(self):
+        """Build the scheduler that decides the order in which plugins are
+        collected, so that slower plugins are started first.
+        """
+        scheduler = PluginScheduler(
+            [plugname for plugname, _ in self.loaded_plugins],
+            costs=self._get_plugin_costs(),
+            deps={
+                plugname: plug.collect_after
+                for plugname, plug in self.loaded_plugins
+            },
+            log=self.soslog
+        )
+        self.soslog.debug("plugin collection order: %s"
+                          % ', '.join(scheduler.order))
+        return scheduler
+
     def collect(self):
         self.ui_log.info(_(" Running plugins. Please wait ..."))
         self.ui_log.info("")
 
+        self._start_archive_stream()
+
         plugruncount = 0
         self.pluglist = []
         self.running_plugs = []
+        self._plugs_started = itertools.count(1)
         for i in self.loaded_plugins:
             plugruncount += 1
             self.pluglist.append((plugruncount, i[0]))
+        scheduler = self._get_plugin_scheduler()
+        if self.opts.estimate_only:
+            self.estimated_cmd_sizes = self._get_estimated_cmd_sizes()
+        # plugins wait from here until they are started, see _collect_plugin()
+        self._collect_start = time.monotonic()
         try:
             results = []
             with ThreadPoolExecutor(self.opts.threads) as executor:
-                results = executor.map(self._collect_plugin,
-                                       list(self.pluglist))
+                results = scheduler.run(executor, self._collect_plugin,
+                                        list(self.pluglist),
+                                        self.opts.threads)
             for res in results:
                 if not res:
                     self.soslog.debug("Unexpected plugin task result: %s" %
                                       res)
+            self.stat_cache.clear()
             self.ui_log.info("")
         except KeyboardInterrupt:
             # We may not be at a newline when the user issues Ctrl-C
@@ -1287,6 +1497,7 @@ class SoSReport(SoSComponent):
     def _collect_plugin(self, plugin):
         """Wraps the collect_plugin() method so we can apply a timeout
         against the plugin as a whole"""
+        self.profiler.add(plugin[1], 'queue', self._collect_start)
         with ThreadPoolExecutor(1) as pool:
             try:
                 _plug = self.loaded_plugins[plugin[0]-1][1]
@@ -1311,26 +1522,6 @@ class SoSReport(SoSComponent):
                 self.loaded_plugins[plugin[0]-1][1].set_timeout_hit()
                 pool.shutdown(wait=True)
                 pool._threads.clear()
-        if self.opts.estimate_only:
-            # call "du -s -B1" for the tmp dir to get the disk usage of the
-            # data collected by the plugin - if the command fails, count with 0
-            tmpdir = self.archive.get_tmp_dir()
-            try:
-                du = sos_get_command_output('du -sB1 %s' % tmpdir)
-                self.estimated_plugsizes[plugin[1]] = \
-                    int(du['output'].split()[0])
-            except Exception:
-                self.estimated_plugsizes[plugin[1]] = 0
-            # remove whole tmp_dir content - including "sos_commands" and
-            # similar dirs that will be re-created on demand by next plugin
-            # if needed; it is less error-prone approach than skipping
-            # deletion of some dirs but deleting their content
-            for f in os.listdir(tmpdir):
-                f = os.path.join(tmpdir, f)
-                if os.path.isdir(f) and not os.path.islink(f):
-                    rmtree(f)
-                else:
-                    os.unlink(f)
         return True
 
     def collect_plugin(self, plugin):
@@ -1342,13 +1533,20 @@ class SoSReport(SoSComponent):
             return False
         numplugs = len(self.loaded_plugins)
         status_line = "  Starting %-5s %-15s %s" % (
-            "%d/%d" % (count, numplugs),
+            "%d/%d" % (next(self._plugs_started), numplugs),
             plugname,
             "[Running: %s]" % ' '.join(p for p in self.running_plugs)
         )
         self.ui_progress(status_line)
         try:
-            plug.collect_plugin()
+            if self.opts.estimate_only:
+                with self.profiler.span(plugname, 'estimate'):
+                    size = plug.estimate_size(self.estimated_cmd_sizes)
+                self.estimated_plugsizes[plugname] = size
+                plug.manifest.add_field('estimated_size', size)
+            else:
+                with self.profiler.span(plugname, 'collect'):
+                    plug.collect_plugin()
             # certain exceptions can cause either of these lists to no
             # longer contain the plugin, which will result in sos hanging
             # so we can't blindly call remove() on these two.
@@ -1460,24 +1658,59 @@ class SoSReport(SoSComponent):
                     self.ui_log.error("")
                     self._exit(1)
 
+    def _postproc_plugin(self, plugname, func, *args):
+        try:
+            func(*args)
+        except (OSError, IOError) as e:
+            if e.errno in fatal_fs_errors:
+                self.ui_log.error("")
+                self.ui_log.error(" %s while post-processing plugin data"
+                                  % e.strerror)
+                self.ui_log.error("")
+                self._exit(1)
+            self.handle_exception(plugname, "postproc")
+        except Exception:
+            self.handle_exception(plugname, "postproc")
+
     def postproc(self):
+        # substitutions are queued by each plugin's postproc() and applied
+        # afterwards, so that each file is only rewritten once
+        deferred = []
         for plugname, plug in self.loaded_plugins:
-            try:
-                if plug.get_option('postproc'):
-                    plug.postproc()
-                else:
-                    self.soslog.info("Skipping postproc for plugin %s"
-                                     % plugname)
-            except (OSError, IOError) as e:
-                if e.errno in fatal_fs_errors:
-                    self.ui_log.error("")
-                    self.ui_log.error(" %s while post-processing plugin data"
-                                      % e.strerror)
-                    self.ui_log.error("")
-                    self._exit(1)
-                self.handle_exception(plugname, "postproc")
-            except Exception:
-                self.handle_exception(plugname, "postproc")
+            if plug.get_option('postproc'):
+                plug.defer_file_subs()
+                deferred.append((plugname, plug))
+                with self.profiler.span(plugname, 'postproc'):
+                    self._postproc_plugin(plugname, plug.postproc)
+            else:
+                self.soslog.info("Skipping postproc for plugin %s"
+                                 % plugname)
+        with ThreadPoolExecutor(self.opts.threads) as pool:
+            for plugname, plug in deferred:
+                with self.profiler.span(plugname, 'file_subs'):
+                    self._postproc_plugin(plugname, plug.apply_file_subs,
+                                          pool)
+
+    def _add_profile_trace(self):
+        """Add the trace recorded by --profile-trace to the report. This is
+        done as late as possible, but cannot include the compression of the
+        archive it is written to.
+        """
+        try:
+            self.archive.add_string(json.dumps(self.profiler.get_trace()),
+                                    PROFILE_PATH)
+        except (OSError, IOError) as err:
+            self.soslog.error("Unable to add profile trace to report: %s"
+                              % err)
+
+    def _show_profile_summary(self):
+        """Show the slowest items of the run, for --profile-summary"""
+        if not self.opts.profile_summary:
+            return
+        self.ui_log.info("")
+        for line in self.profiler.get_summary(self.opts.profile_summary):
+            self.ui_log.info(line)
+        self.ui_log.info("")
 
     def _create_checksum(self, archive, hash_name):
         if not archive:
@@ -1523,6 +1756,7 @@ class SoSReport(SoSComponent):
                     'options': self.opts,
                     'manifest': self.manifest
                 }
+                from sos.cleaner import SoSCleaner
                 cleaner = SoSCleaner(in_place=True, hook_commons=hook_commons)
                 cleaner.set_target_path(self.archive.get_archive_path())
                 # ignore the returned paths here
@@ -1532,6 +1766,8 @@ class SoSReport(SoSComponent):
                 print(_("ERROR: Unable to obfuscate report: %s" % err))
 
         self._add_sos_logs()
+        if self.opts.profile_trace:
+            self._add_profile_trace()
         if self.manifest is not None:
             self.archive.add_final_manifest_data(self.opts.compression_type)
         # Now, separately clean the log files that cleaner also wrote to
@@ -1545,6 +1781,9 @@ class SoSReport(SoSComponent):
                 os.path.join(_dir, 'sos_reports', 'manifest.json'),
                 short_name='manifest.json'
             )
+            if self.opts.profile_trace:
+                cleaner.obfuscate_file(os.path.join(_dir, PROFILE_PATH),
+                                       short_name='profile.json')
 
         # Now, just (optionally) pack the report and print work outcome; let
         # print ui_log to stdout also in quiet mode. For non-quiet mode we
@@ -1557,8 +1796,7 @@ class SoSReport(SoSComponent):
             from sos.utilities import get_human_readable
             from pathlib import Path
             # add sos_logs, sos_reports dirs, etc., basically everything
-            # that remained in self.tmpdir after plugins' contents removal
-            # that still will be moved to the sos report final directory path
+            # in self.tmpdir as no plugin data was collected to it
             tmpdir_path = Path(self.tmpdir)
             self.estimated_plugsizes['sos_logs_reports'] = sum(
                     [f.lstat().st_size for f in tmpdir_path.glob('**/*')])
@@ -1589,8 +1827,9 @@ class SoSReport(SoSComponent):
             try:
                 if do_clean:
                     self.archive.rename_archive_root(cleaner)
-                archive = self.archive.finalize(
-                    self.opts.compression_type)
+                with self.profiler.span('finalize', 'phase'):
+                    archive = self.archive.finalize(
+                        self.opts.compression_type)
             except (OSError, IOError) as e:
                 print("")
                 print(_(" %s while finalizing archive %s" %
@@ -1623,6 +1862,7 @@ class SoSReport(SoSComponent):
                 print(_("Error moving directory: %s" % directory))
                 return False
 
+        self._show_profile_summary()
         checksum = None
 
         if not self.opts.build:
@@ -1791,7 +2031,8 @@ class SoSReport(SoSComponent):
     def execute(self):
         try:
             self.policy.set_commons(self.get_commons())
-            self.load_plugins()
+            with self.profiler.span('load_plugins', 'phase'):
+                self.load_plugins()
             self._set_all_options()
             self._merge_preset_options()
             self._set_tunables()
@@ -1818,14 +2059,17 @@ class SoSReport(SoSComponent):
             self.batch()
             self.prework()
             self.add_manifest_data()
-            self.setup()
-            self.collect()
+            with self.profiler.span('setup', 'phase'):
+                self.setup()
+            with self.profiler.span('collect', 'phase'):
+                self.collect()
             if not self.opts.no_env_vars:
                 self.collect_env_vars()
             if not self.opts.no_report:
                 self.generate_reports()
             if not self.opts.no_postproc:
-                self.postproc()
+                with self.profiler.span('postproc', 'phase'):
+                    self.postproc()
             else:
                 self.ui_log.info("Skipping postprocessing of collected data")
             self.version()
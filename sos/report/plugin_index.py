@@ -0,0 +1,129 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import os
+
+from sos import __version__
+from sos.policies.cache import DiscoveryCache, get_discovery_cache
+from sos.utilities import import_module
+
+
+def class_id(class_):
+    """Get the fully qualified name of a class, as used in the index"""
+    return "%s.%s" % (class_.__module__, class_.__qualname__)
+
+
+def _stamp(path):
+    _stat = os.stat(path)
+    return [_stat.st_mtime_ns, _stat.st_size]
+
+
+class PluginIndex():
+    """An index of the plugin classes defined by each module of a plugin
+    package, so that modules whose plugins cannot be used by a run, for
+    example because they are for another distribution or were excluded on
+    the command line, need not be imported.
+
+    For each plugin class the index records the classes it inherits from,
+    which includes its tagging classes, and its profiles. A module's entry is
+    only used while the module's modification time and size are unchanged;
+    otherwise the module is imported to update it. The index is kept in the
+    discovery cache directory, whether or not the discovery cache is enabled
+    for the run, and so is only used under the same ownership and permission
+    checks as the rest of the cache.
+
+    :param package:     The plugin package module
+    :type package:      ``module``
+
+    :param superclass:  The class a class must inherit from to be indexed
+    :type superclass:   ``class``
+
+    :param cache:       The cache to keep the index in, by default the
+                        enabled discovery cache or else one in the default
+                        cache directory
+    :type cache:        ``DiscoveryCache``
+    """
+
+    def __init__(self, package, superclass, cache=None):
+        self.package = package
+        self.superclass = superclass
+        self.cache = cache or get_discovery_cache() or DiscoveryCache()
+        self.name = "%s-index" % package.__name__
+        self._changed = False
+        self._modules = self._load()
+
+    def _base_stamp(self):
+        return [__version__, self.package.__file__,
+                _stamp(self.package.__file__)]
+
+    def _load(self):
+        modules = self.cache.load(self.name, self._base_stamp())
+        return modules if isinstance(modules, dict) else {}
+
+    def _module_file(self, name):
+        for path in self.package.__path__:
+            _file = os.path.join(path, "%s.py" % name)
+            if os.path.isfile(_file):
+                return _file
+        raise ImportError("No plugin module named %s" % name)
+
+    def _index_module(self, name):
+        classes = import_module("%s.%s" % (self.package.__name__, name),
+                                (self.superclass, ))
+        return [{
+            'bases': [class_id(base) for base in class_.__mro__],
+            'profiles': list(getattr(class_, 'profiles', ()))
+        } for class_ in classes]
+
+    def get(self, name):
+        """Get the index entries of the plugin classes in a module, importing
+        the module to update them if it has changed since it was indexed.
+
+        :param name:    The name of the module within the plugin package
+        :type name:     ``str``
+
+        :returns:   The bases and profiles of each plugin class in the module
+        :rtype:     ``list`` of ``dict``
+        """
+        stamp = _stamp(self._module_file(name))
+        entry = self._modules.get(name)
+        if entry is None or entry['stamp'] != stamp:
+            entry = {'stamp': stamp, 'classes': self._index_module(name)}
+            self._modules[name] = entry
+            self._changed = True
+        return entry['classes']
+
+    def get_classes(self, name, superclasses):
+        """Get the index entries of the plugin classes in a module that
+        inherit from any of the given classes, e.g. the tagging classes that
+        are valid for the current policy.
+
+        :param name:            The name of the module within the package
+        :type name:             ``str``
+
+        :param superclasses:    The classes to match
+        :type superclasses:     ``tuple``
+
+        :returns:   The bases and profiles of each matching plugin class
+        :rtype:     ``list`` of ``dict``
+        """
+        ids = set(class_id(class_) for class_ in superclasses)
+        return [
+            entry for entry in self.get(name)
+            if ids.intersection(entry['bases'])
+        ]
+
+    def save(self):
+        """Write the index to the cache, if it was updated.
+        """
+        if not self._changed:
+            return
+        self.cache.store(self.name, self._base_stamp(), self._modules)
+        self._changed = False
+
+# vim: set et ts=4 sw=4 :
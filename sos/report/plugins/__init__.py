@@ -11,12 +11,16 @@
 """ This exports methods available for use by plugins for sos """
 
 from sos.utilities import (sos_get_command_output, import_module, grep,
-                           fileobj, tail, is_executable, TIMEOUT_DEFAULT,
+                           fileobj, tail, is_executable, are_executable,
+                           TIMEOUT_DEFAULT,
                            path_exists, path_isdir, path_isfile, path_islink,
                            listdir, path_join, bold, file_is_binary,
-                           recursive_dict_values_by_key)
+                           recursive_dict_values_by_key, StatCache,
+                           PredicateCache)
 
 from sos.archive import P_FILE, P_LINK
+from sos.report.profiler import Profiler
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import os
 import glob
@@ -30,6 +34,10 @@ import textwrap
 
 from datetime import datetime
 
+# the longest a command may run for when sampling the size of its output for
+# --estimate-only
+ESTIMATE_CMD_TIMEOUT = 10
+
 
 def regex_findall(regex, fname):
     """Return a list of all non overlapping matches in the string(s)"""
@@ -201,6 +209,13 @@ class SoSPredicate(object):
         else:
             self._forbidden[test].append(item)
 
+    def _check(self, test, item, func, *args):
+        """Make a single check of a predicate, using the result of any
+        identical check already made during this run
+        """
+        cache = self._owner.predicate_cache
+        return cache.get((test, item, self._owner.sysroot), func, *args)
+
     def _eval_kmods(self):
         if not self.kmods or self._owner.get_option('allow_system_changes'):
             return True
@@ -208,7 +223,8 @@ class SoSPredicate(object):
         _kmods = []
         # Are kernel modules loaded?
         for kmod in self.kmods:
-            res = self._owner.is_module_loaded(kmod)
+            res = self._check('kmods', kmod, self._owner.is_module_loaded,
+                              kmod)
             _kmods.append(res)
             if not res:
                 self._failed_or_forbidden('kmods', kmod)
@@ -221,7 +237,8 @@ class SoSPredicate(object):
 
         _svcs = []
         for svc in self.services:
-            res = self._owner.is_service_running(svc)
+            res = self._check('services', svc,
+                              self._owner.is_service_running, svc)
             _svcs.append(res)
             if not res:
                 self._failed_or_forbidden('services', svc)
@@ -234,7 +251,8 @@ class SoSPredicate(object):
 
         _pkgs = []
         for pkg in self.packages:
-            res = self._owner.is_installed(pkg)
+            res = self._check('packages', pkg, self._owner.is_installed,
+                              pkg)
             _pkgs.append(res)
             if not res:
                 self._failed_or_forbidden('packages', pkg)
@@ -245,7 +263,8 @@ class SoSPredicate(object):
         """Does 'cmd' output contain string 'output'?"""
         if 'cmd' not in cmd_output or 'output' not in cmd_output:
             return False
-        result = sos_get_command_output(cmd_output['cmd'])
+        result = self._check('cmd_outputs', cmd_output['cmd'],
+                             sos_get_command_output, cmd_output['cmd'])
         if result['status'] != 0:
             return False
         for line in result['output'].splitlines():
@@ -333,10 +352,12 @@ class SoSPredicate(object):
                     self.arch, self.dry_run]):
             return True
 
-        return ((self._eval_kmods() and self._eval_services() and
-                 self._eval_packages() and self._eval_cmd_outputs() and
-                 self._eval_arch())
-                and not self.dry_run)
+        with self._owner.profiler.span(self._owner.name(), 'predicate',
+                                       predicate=self):
+            return ((self._eval_kmods() and self._eval_services() and
+                     self._eval_packages() and self._eval_cmd_outputs() and
+                     self._eval_arch())
+                    and not self.dry_run)
 
     def __init__(self, owner, dry_run=False, kmods=[], services=[],
                  packages=[], cmd_outputs=[], arch=[], required={}):
@@ -518,6 +539,15 @@ class Plugin():
 
     :cvar cmd_timeout:  Timeout in seconds for individual commands
     :vartype cmd_timeout:   ``int``
+
+    :cvar collect_cost: The expected time in seconds to collect this plugin,
+                        used to start slower plugins first when there is no
+                        recorded run time for the plugin
+    :vartype collect_cost: ``int``
+
+    :cvar collect_after: Name(s) of plugins that, if enabled, must finish
+                         collecting before this plugin is collected
+    :vartype collect_after: ``tuple``
     """
 
     plugin_name = None
@@ -533,6 +563,8 @@ class Plugin():
     sysroot = '/'
     plugin_timeout = TIMEOUT_DEFAULT
     cmd_timeout = TIMEOUT_DEFAULT
+    collect_cost = 1
+    collect_after = ()
     _timeout_hit = False
     cmdtags = {}
     filetags = {}
@@ -559,11 +591,22 @@ class Plugin():
         self.sysroot = commons['sysroot']
         self.policy = commons['policy']
         self.devices = commons['devices']
+        self.stat_cache = commons.get('stat_cache')
+        if self.stat_cache is None:
+            self.stat_cache = StatCache()
+        self.predicate_cache = commons.get('predicate_cache')
+        if self.predicate_cache is None:
+            self.predicate_cache = PredicateCache()
+        self.profiler = commons.get('profiler')
+        if self.profiler is None:
+            self.profiler = Profiler()
         self.manifest = None
         self.skip_files = commons['cmdlineopts'].skip_files
         self.skip_commands = commons['cmdlineopts'].skip_commands
         self.default_environment = {}
         self._tail_files_list = []
+        # archive paths to queued substitutions, see defer_file_subs()
+        self._file_subs = None
 
         self.soslog = self.commons['soslog'] if 'soslog' in self.commons \
             else logging.getLogger('sos')
@@ -1193,7 +1236,8 @@ class Plugin():
                       `regexp`
         :type subst: ``str``
 
-        :returns: Number of replacements made
+        :returns: Number of replacements made, or 0 if substitutions are
+                  being deferred
         :rtype: ``int``
         """
         globstr = '*' + cmd + '*'
@@ -1216,6 +1260,11 @@ class Plugin():
                     continue
                 if fnmatch.fnmatch(called['cmd'], globstr):
                     path = os.path.join(self.commons['cmddir'], called['file'])
+                    if self._file_subs is not None:
+                        self._queue_file_sub(path, path, re.compile(regexp),
+                                             subst)
+                        replacements = 0
+                        continue
                     self._log_debug("applying substitution to '%s'" % path)
                     readable = self.archive.open_file(path)
                     result, replacements = re.subn(
@@ -1269,11 +1318,15 @@ class Plugin():
                       within the file
         :type subst: ``str``
 
-        :returns: Number of replacements made
+        :returns: Number of replacements made, or 0 if substitutions are
+                  being deferred
         :rtype: ``int``
         """
+        return self._do_file_sub(srcpath, self._get_dest_for_srcpath(srcpath),
+                                 regexp, subst)
+
+    def _do_file_sub(self, srcpath, path, regexp, subst):
         try:
-            path = self._get_dest_for_srcpath(srcpath)
             common_flags = re.IGNORECASE | re.MULTILINE
             if hasattr(regexp, "pattern"):
                 pattern = regexp.pattern
@@ -1286,28 +1339,97 @@ class Plugin():
                             % (subst, pattern, path))
             if not path:
                 return 0
-            readable = self.archive.open_file(path)
-            content = readable.read()
-            if not isinstance(content, str):
-                content = content.decode('utf8', 'ignore')
-            result, replacements = re.subn(pattern, subst, content,
-                                           flags=flags)
-            if replacements:
-                self.archive.add_string(result, self.strip_sysroot(srcpath))
-            else:
-                replacements = 0
+            regex = re.compile(pattern, flags)
+            if self._file_subs is not None:
+                self._queue_file_sub(path, self.strip_sysroot(srcpath), regex,
+                                     subst)
+                return 0
+            replacements = self._sub_file(path, self.strip_sysroot(srcpath),
+                                          [(regex, subst)])[0]
         except (OSError, IOError) as e:
-            # if trying to regexp a nonexisting file, dont log it as an
-            # error to stdout
-            if e.errno == errno.ENOENT:
-                msg = "file '%s' not collected, substitution skipped"
-                self._log_debug(msg % path)
-            else:
-                msg = "regex substitution failed for '%s' with: '%s'"
-                self._log_error(msg % (path, e))
+            self._log_sub_error(path, e)
             replacements = 0
         return replacements
 
+    def _log_sub_error(self, path, e):
+        # if trying to regexp a nonexisting file, dont log it as an
+        # error to stdout
+        if e.errno == errno.ENOENT:
+            msg = "file '%s' not collected, substitution skipped"
+            self._log_debug(msg % path)
+        else:
+            msg = "regex substitution failed for '%s' with: '%s'"
+            self._log_error(msg % (path, e))
+
+    def _sub_file(self, path, dest, subs):
+        """Apply a list of (regex, substitution) pairs in turn to a file in
+        the archive, reading and rewriting it only once.
+
+        :returns: The number of replacements made by each substitution
+        :rtype: ``list``
+        """
+        with self.archive.open_file(path) as readable:
+            content = readable.read()
+        if not isinstance(content, str):
+            content = content.decode('utf8', 'ignore')
+        counts = []
+        for regex, subst in subs:
+            content, replacements = regex.subn(subst, content)
+            counts.append(replacements)
+        if any(counts):
+            self.archive.add_string(content, dest)
+        return counts
+
+    def _queue_file_sub(self, path, dest, regex, subst):
+        self._file_subs.setdefault(path, (dest, []))[1].append((regex, subst))
+
+    def defer_file_subs(self):
+        """Queue the substitutions requested by do_file_sub() and the methods
+        that use it, as well as do_cmd_output_sub(), rather than applying them
+        straight away. Plugins commonly make several substitutions in the same
+        files during postproc(), and queueing them allows each file to be
+        read and rewritten once by apply_file_subs(), however many
+        substitutions are made in it.
+
+        Substitutions are still applied to each file in the order they were
+        requested.
+        """
+        if self._file_subs is None:
+            self._file_subs = {}
+
+    def _apply_file_subs(self, path):
+        dest, subs = self._file_subs[path]
+        try:
+            counts = self._sub_file(path, dest, subs)
+        except (OSError, IOError) as e:
+            self._log_sub_error(path, e)
+            return [0] * len(subs)
+        for (regex, subst), count in zip(subs, counts):
+            self._log_debug("substituted '%s' for '%s' in '%s' %s times"
+                            % (subst, regex.pattern, path, count))
+        return counts
+
+    def apply_file_subs(self, executor=None):
+        """Apply the substitutions queued since defer_file_subs() was called,
+        and stop deferring any further substitutions.
+
+        :param executor:    An executor to apply the substitutions to several
+                            files at once with
+        :type executor:     ``concurrent.futures.Executor``
+
+        :returns:   The number of replacements made by each substitution,
+                    in the order they were requested, for each archive path
+        :rtype:     ``dict``
+        """
+        if not self._file_subs:
+            self._file_subs = None
+            return {}
+        paths = list(self._file_subs)
+        _map = executor.map if executor else map
+        counts = dict(zip(paths, _map(self._apply_file_subs, paths)))
+        self._file_subs = None
+        return counts
+
     def do_path_regex_sub(self, pathexp, regexp, subst):
         """Apply a regexp substituation to a set of files archived by
         sos. The set of files to be substituted is generated by matching
@@ -1327,7 +1449,7 @@ class Plugin():
         match = pathexp.match
         file_list = [f for f in self.copied_files if match(f['srcpath'])]
         for file in file_list:
-            self.do_file_sub(file['srcpath'], regexp, subst)
+            self._do_file_sub(file['srcpath'], file['dstpath'], regexp, subst)
 
     def do_regex_find_all(self, regex, fname):
         return regex_findall(regex, fname)
@@ -1470,9 +1592,9 @@ class Plugin():
         if self.use_sysroot():
             dest = self.strip_sysroot(dest)
 
-        try:
-            st = os.lstat(srcpath)
-        except (OSError, IOError):
+        st = self.stat_cache.stat(srcpath, follow_symlinks=False)
+        self.stat_cache.forget(srcpath)
+        if st is None:
             self._log_info("failed to stat '%s'" % srcpath)
             return
 
@@ -1504,7 +1626,9 @@ class Plugin():
             # FIXME: reflect permissions in archive
             self.archive.add_string("", dest)
         else:
-            self.archive.add_file(srcpath, dest, force=force)
+            with self.profiler.span(dest, 'archive', plugin=self.name()):
+                self.archive.add_file(srcpath, dest, force=force,
+                                      stream=not self.has_postproc())
 
         self.copied_files.append({
             'srcpath': srcpath,
@@ -1574,8 +1698,9 @@ class Plugin():
         """
 
         global_options = (
-            'all_logs', 'allow_system_changes', 'cmd_timeout', 'journal_size',
-            'log_size', 'plugin_timeout', 'since', 'verify'
+            'all_logs', 'allow_system_changes', 'cmd_concurrency',
+            'cmd_timeout', 'journal_size', 'log_size', 'plugin_timeout',
+            'since', 'verify'
         )
 
         if optionname in global_options:
@@ -1798,10 +1923,8 @@ class Plugin():
             # Files should be sorted in most-recently-modified order, so that
             # we collect the newest data first before reaching the limit.
             def getmtime(path):
-                try:
-                    return os.path.getmtime(path)
-                except OSError:
-                    return 0
+                _st = self.stat_cache.stat(path)
+                return _st.st_mtime if _st else 0
 
             def time_filter(path):
                 """ When --since is passed, or maxage is coming from the
@@ -1844,9 +1967,10 @@ class Plugin():
                     self._log_info("skipping '%s' over size limit" % _file)
                     continue
 
-                try:
-                    file_size = os.stat(_file)[stat.ST_SIZE]
-                except OSError:
+                _st = self.stat_cache.stat(_file)
+                if _st is not None:
+                    file_size = _st.st_size
+                else:
                     # if _file is a broken symlink, we should collect it,
                     # otherwise skip it
                     if self.path_islink(_file):
@@ -2288,7 +2412,7 @@ class Plugin():
                             binary=False, sizelimit=None, subdir=None,
                             changes=False, foreground=False, tags=[],
                             priority=10, cmd_as_tag=False, to_file=False,
-                            container_cmd=False):
+                            container_cmd=False, prefetched=None):
         """Execute a command and save the output to a file for inclusion in the
         report.
 
@@ -2316,6 +2440,8 @@ class Plugin():
             :param cmd_as_tag:          Format command string to tag
             :param to_file:             Write output directly to file instead
                                         of saving in memory
+            :param prefetched:          A future holding the result of the
+                                        cmd already run by _collect_cmds()
 
         :returns:       dict containing status, output, and filename in the
                         archive for the executed cmd
@@ -2339,12 +2465,9 @@ class Plugin():
 
         _tags = list(set(_tags))
 
-        _env = self._get_cmd_environment(env)
-
-        if chroot or self.commons['cmdlineopts'].chroot == 'always':
-            root = self.sysroot
-        else:
-            root = None
+        run_opts = self._get_cmd_run_opts(timeout, stderr, chroot, runat, env,
+                                          binary, sizelimit, foreground)
+        root = run_opts['chroot']
 
         if suggest_filename:
             outfn = self._make_command_filename(suggest_filename, subdir)
@@ -2361,16 +2484,14 @@ class Plugin():
         else:
             out_file = False
 
-        start = time()
-
-        result = sos_get_command_output(
-            cmd, timeout=timeout, stderr=stderr, chroot=root,
-            chdir=runat, env=_env, binary=binary, sizelimit=sizelimit,
-            poller=self.check_timeout, foreground=foreground,
-            to_file=out_file
-        )
-
-        end = time()
+        if prefetched is not None:
+            result, start, end = prefetched.result()
+        else:
+            start = time()
+            with self.profiler.span(cmd, 'command', plugin=self.name()):
+                result = sos_get_command_output(cmd, to_file=out_file,
+                                                **run_opts)
+            end = time()
         run_time = end - start
 
         if result['status'] == 124:
@@ -2427,10 +2548,11 @@ class Plugin():
             outfn = outfn.replace('sos_commands', 'sos_strings') + '.tailed'
 
         if not to_file:
-            if binary:
-                self.archive.add_binary(result['output'], outfn)
-            else:
-                self.archive.add_string(result['output'], outfn)
+            with self.profiler.span(outfn, 'archive', plugin=self.name()):
+                if binary:
+                    self.archive.add_binary(result['output'], outfn)
+                else:
+                    self.archive.add_string(result['output'], outfn)
 
         if result['truncated']:
             # we need to manually build the relative path from the paths that
@@ -2998,48 +3120,71 @@ class Plugin():
                              priority=priority)
 
     def _expand_copy_spec(self, copyspec):
-        def __expand(paths):
+        def __list(path):
+            """List a directory the same way glob(path/*) would, skipping
+            hidden entries, or return None if the directory is empty. Entries
+            are listed through the stat cache so that the file type and stat
+            result of each are only fetched once.
+            """
+            entries = self.stat_cache.scandir(path)
+            if not entries:
+                return None
+            return [e for e in entries if not e.name.startswith('.')]
+
+        def __expand(entries):
             found_paths = []
-            paths = glob.glob(paths)
-            for path in paths:
+            for entry in entries:
                 try:
                     # avoid recursive symlink dirs
-                    if self.path_isfile(path) or self.path_islink(path):
-                        found_paths.append(path)
-                    elif self.path_isdir(path) and self.listdir(path):
-                        found_paths.extend(__expand(self.path_join(path, '*')))
-                    else:
-                        found_paths.append(path)
+                    if entry.is_file() or entry.is_symlink():
+                        found_paths.append(entry.path)
+                        continue
+                    if entry.is_dir():
+                        children = __list(entry.path)
+                        if children is not None:
+                            found_paths.extend(__expand(children))
+                            continue
+                    found_paths.append(entry.path)
                 except PermissionError:
                     # when running in LXD, we've seen os.access return True for
                     # some /sys or /proc paths yet still get a PermissionError
-                    # when calling os.listdir(), so rather than rely on that,
-                    # just catch and ignore permissions errors resulting from
+                    # when listing them, so rather than rely on that, just
+                    # catch and ignore permissions errors resulting from
                     # security modules like apparmor/selinux
                     # Ref: https://github.com/lxc/lxd/issues/5688
                     pass
-            return list(set(found_paths))
-
-        if (os.access(copyspec, os.R_OK) and self.path_isdir(copyspec) and
-                self.listdir(copyspec)):
-            # the directory exists and is non-empty, recurse through it
-            copyspec = self.path_join(copyspec, '*')
-        expanded = glob.glob(copyspec, recursive=True)
-        recursed_files = []
+            return found_paths
+
+        expanded = None
+        if os.access(copyspec, os.R_OK) and self.path_isdir(copyspec):
+            # the directory exists, recurse through it if non-empty
+            try:
+                children = __list(copyspec)
+                if children is not None:
+                    expanded = [e.path for e in children]
+            except PermissionError:
+                expanded = []
+        if expanded is None:
+            expanded = glob.glob(copyspec, recursive=True)
+        found_paths = []
         for _path in expanded:
+            _st = self.stat_cache.stat(_path)
             try:
-                if self.path_isdir(_path) and self.listdir(_path):
-                    # remove the top level dir to avoid duplicate attempts to
-                    # copy the dir and its contents
-                    expanded.remove(_path)
-                    recursed_files.extend(__expand(os.path.join(_path, '*')))
+                if _st is not None and stat.S_ISDIR(_st.st_mode):
+                    children = __list(_path)
+                    if children is not None:
+                        # add the contents rather than the top level dir to
+                        # avoid duplicate attempts to copy the dir and its
+                        # contents
+                        found_paths.extend(__expand(children))
+                        continue
             except PermissionError:
-                # same as the above in __expand(), but this time remove the
+                # same as the above in __expand(), but this time drop the
                 # path so we don't hit another PermissionError during the
                 # actual copy
-                expanded.remove(_path)
-        expanded.extend(recursed_files)
-        return list(set(expanded))
+                continue
+            found_paths.append(_path)
+        return list(set(found_paths))
 
     def _collect_copy_specs(self):
         for path in sorted(self.copy_paths, reverse=True):
@@ -3089,13 +3234,117 @@ class Plugin():
                 self._log_info("error copying '%s' from container '%s': %s"
                                % (path, con, cpret['output']))
 
+    def _get_cmd_run_opts(self, timeout, stderr, chroot, runat, env, binary,
+                          sizelimit, foreground):
+        """Get the options to pass to sos_get_command_output() for a command
+        collected by this plugin.
+        """
+        if chroot or self.commons['cmdlineopts'].chroot == 'always':
+            root = self.sysroot
+        else:
+            root = None
+        return {
+            'timeout': timeout,
+            'stderr': stderr,
+            'chroot': root,
+            'chdir': runat,
+            'env': self._get_cmd_environment(env),
+            'binary': binary,
+            'sizelimit': sizelimit,
+            'poller': self.check_timeout,
+            'foreground': foreground
+        }
+
+    @property
+    def cmd_concurrency(self):
+        """The number of commands this plugin may run at the same time, as
+        set by the global cmd-concurrency option. Plugins whose commands must
+        not run alongside each other may set this to 1.
+        """
+        try:
+            return max(int(self.get_option('cmd_concurrency') or 1), 1)
+        except (AttributeError, TypeError, ValueError):
+            return 1
+
+    def _can_prefetch_cmd(self, soscmd):
+        """Check if a command may be run ahead of its turn in _collect_cmds().
+        Commands that write directly to the archive, need a TTY or may make
+        changes on the system are always run on their own.
+        """
+        return not (soscmd.__dict__.get('to_file') or
+                    soscmd.__dict__.get('foreground') or
+                    soscmd.__dict__.get('changes'))
+
+    def _get_soscmd_run_opts(self, soscmd):
+        """Get the options to pass to sos_get_command_output() for a command
+        added by add_cmd_output(), when it is not run in the foreground.
+        """
+        opts = soscmd.__dict__
+        timeout = opts.get('timeout')
+        if timeout is None:
+            timeout = self.cmdtimeout
+        return self._get_cmd_run_opts(
+            timeout, opts.get('stderr', True), opts.get('chroot', True),
+            opts.get('runat'), opts.get('env'), opts.get('binary', False),
+            opts.get('sizelimit'), False
+        )
+
+    def _prefetch_cmd_output(self, soscmd):
+        """Run a command for _collect_cmd_output(), returning the result of
+        the command along with its start and end times.
+        """
+        run_opts = self._get_soscmd_run_opts(soscmd)
+        start = time()
+        with self.profiler.span(soscmd.cmd, 'command', plugin=self.name()):
+            result = sos_get_command_output(soscmd.cmd, **run_opts)
+        return result, start, time()
+
     def _collect_cmds(self):
         self.collect_cmds.sort(key=lambda x: x.priority)
+        concurrency = self.cmd_concurrency
+        if concurrency > 1:
+            self._log_debug("running up to %s commands concurrently"
+                            % concurrency)
+            with ThreadPoolExecutor(concurrency) as pool:
+                self._collect_cmds_concurrently(pool, concurrency)
+            return
         for soscmd in self.collect_cmds:
             self._log_debug("unpacked command: " + soscmd.__str__())
             self._log_info("collecting output of '%s'" % soscmd.cmd)
             self._collect_cmd_output(**soscmd.__dict__)
 
+    def _collect_cmds_concurrently(self, pool, concurrency):
+        """Collect commands in priority order as _collect_cmds() does, while
+        running up to `concurrency` of the following commands of the same
+        priority in the background.
+
+        Only the execution of commands is done concurrently. The output of each
+        command is still written to the archive in turn, so that filenames and
+        the manifest are the same as when commands are run one at a time.
+        Commands that cannot be prefetched act as a barrier, and are only run
+        once every command before them has been collected.
+        """
+        cmds = self.collect_cmds
+        pending = {}
+        ahead = 0
+        for idx, soscmd in enumerate(cmds):
+            if self._timeout_hit:
+                break
+            if self._can_prefetch_cmd(soscmd):
+                ahead = max(ahead, idx)
+                while (ahead < len(cmds) and ahead < idx + concurrency and
+                       cmds[ahead].priority == soscmd.priority and
+                       self._can_prefetch_cmd(cmds[ahead])):
+                    pending[ahead] = pool.submit(self._prefetch_cmd_output,
+                                                 cmds[ahead])
+                    ahead += 1
+            self._log_debug("unpacked command: " + soscmd.__str__())
+            self._log_info("collecting output of '%s'" % soscmd.cmd)
+            self._collect_cmd_output(**soscmd.__dict__,
+                                     prefetched=pending.pop(idx, None))
+        for future in pending.values():
+            future.cancel()
+
     def _collect_tailed_files(self):
         for _file, _size in self._tail_files_list:
             self._log_info(f"collecting tail of '{_file}' due to size limit")
@@ -3204,6 +3453,100 @@ class Plugin():
         fields = (self.name(), time() - start)
         self._log_debug("collected plugin '%s' in %s" % fields)
 
+    def _has_copied_parent(self, path):
+        parent = os.path.dirname(path)
+        while parent != path:
+            if parent in self.copy_paths:
+                return True
+            path, parent = parent, os.path.dirname(parent)
+        return False
+
+    def _estimate_path_size(self, path):
+        """Get the size of a file that would be copied by add_copy_spec(), or
+        of everything below a directory that would be. Symlinks and special
+        nodes are copied without any data, and are not counted.
+        """
+        if self._timeout_hit or self._is_forbidden_path(path):
+            return 0
+        st = self.stat_cache.stat(path, follow_symlinks=False)
+        if st is None:
+            return 0
+        if stat.S_ISDIR(st.st_mode):
+            try:
+                entries = self.stat_cache.scandir(path)
+            except OSError:
+                return 0
+            return sum(self._estimate_path_size(e.path) for e in entries)
+        if not stat.S_ISREG(st.st_mode):
+            return 0
+        if not self.strip_sysroot(path).startswith(('/proc/', '/sys/')):
+            return st.st_size
+        # files on /proc and /sys report a size of zero or of a page, and the
+        # size of their content is only known by reading it
+        size = 0
+        try:
+            with open(path, 'rb') as _file:
+                for chunk in iter(lambda: _file.read(65536), b''):
+                    size += len(chunk)
+        except OSError:
+            pass
+        return size
+
+    def _estimate_cmd_size(self, soscmd):
+        """Run a command only to measure the size of its output, within
+        ESTIMATE_CMD_TIMEOUT and the sizelimit of the command. Nothing is
+        written to the archive, and commands that may make changes to the
+        system or need a TTY are not run.
+        """
+        opts = soscmd.__dict__
+        if opts.get('changes') or opts.get('foreground'):
+            self._log_debug("not sampling output of '%s'" % soscmd.cmd)
+            return 0
+        run_opts = self._get_soscmd_run_opts(soscmd)
+        run_opts['timeout'] = min(run_opts['timeout'] or ESTIMATE_CMD_TIMEOUT,
+                                  ESTIMATE_CMD_TIMEOUT)
+        with self.profiler.span(soscmd.cmd, 'command', plugin=self.name()):
+            result = sos_get_command_output(soscmd.cmd, **run_opts)
+        output = result['output']
+        if isinstance(output, str):
+            output = output.encode('utf-8', 'replace')
+        return len(output)
+
+    def estimate_size(self, cmd_sizes=None):
+        """Estimate the size of the data the plugin would collect, for
+        --estimate-only, without collecting it.
+
+        Files are sized from the paths selected by add_copy_spec(), so that
+        sizelimits and tailing are applied as in a real collection. The size
+        of each command's output is taken from `cmd_sizes` where it is known,
+        and otherwise measured by running the command once with a bounded
+        timeout. Files copied from containers and data written by a plugin's
+        own collect() method are not included.
+
+        :param cmd_sizes:   The output sizes in bytes of commands, by command
+                            line, e.g. from load_command_sizes()
+        :type cmd_sizes:    ``dict``
+
+        :returns:   The estimated size in bytes
+        :rtype:     ``int``
+        """
+        cmd_sizes = cmd_sizes or {}
+        # paths below a directory that is copied are counted with it
+        size = sum(self._estimate_path_size(path) for path in self.copy_paths
+                   if not self._has_copied_parent(path))
+        size += sum(_size for _file, _size in self._tail_files_list)
+        size += sum(len(string) for string, _, _ in self.copy_strings)
+        for soscmd in self.collect_cmds:
+            if self._timeout_hit:
+                break
+            if soscmd.cmd in cmd_sizes:
+                size += cmd_sizes[soscmd.cmd]
+            else:
+                size += self._estimate_cmd_size(soscmd)
+        self._log_debug("estimated plugin '%s' at %s bytes"
+                        % (self.name(), size))
+        return size
+
     def get_description(self):
         """This function will return the description for the plugin"""
         try:
@@ -3287,14 +3630,30 @@ class Plugin():
             # no checks beyond architecture restrictions
             return self.check_is_architecture()
 
-        return ((any(self.path_exists(fname) for fname in files) or
-                any(self.is_installed(pkg) for pkg in packages) or
-                any(is_executable(cmd, self.sysroot) for cmd in commands) or
-                any(self.is_module_loaded(mod) for mod in self.kernel_mods) or
-                any(self.is_service(svc) for svc in services) or
+        return ((any(self._check_trigger('files', fname, self.path_exists)
+                     for fname in files) or
+                any(self._check_trigger('packages', pkg, self.is_installed)
+                    for pkg in packages) or
+                any(self._check_trigger('commands', cmd, is_executable,
+                                        self.sysroot)
+                    for cmd in commands) or
+                any(self._check_trigger('kernel_mods', mod,
+                                        self.is_module_loaded)
+                    for mod in self.kernel_mods) or
+                any(self._check_trigger('services', svc, self.is_service)
+                    for svc in services) or
                 any(self.container_exists(cntr) for cntr in containers)) and
                 self.check_is_architecture())
 
+    def _check_trigger(self, trigger, item, func, *args):
+        """Check a single enablement trigger, using the result of the same
+        check for any other plugin if it has already been made, e.g. by
+        resolve_plugin_triggers()
+        """
+        return bool(self.predicate_cache.get(
+            ('%s_trigger' % trigger, item, self.sysroot), func, item, *args
+        ))
+
     def check_is_architecture(self):
         """Checks whether or not the system is running on an architecture that
         the plugin allows. If not architecture is set, assume plugin can run
@@ -3433,6 +3792,16 @@ class Plugin():
         """
         pass
 
+    def has_postproc(self):
+        """Check if the plugin will post-process the content it collects
+
+        :returns: ``True`` if the plugin implements ``postproc()`` and the
+                  postproc option is enabled, else ``False``
+        :rtype: ``bool``
+        """
+        return bool(self.get_option('postproc') and
+                    type(self).postproc is not Plugin.postproc)
+
     def check_process_by_name(self, process):
         """Checks if a named process is found in /proc/[0-9]*/cmdline.
 
@@ -3652,4 +4021,58 @@ def import_plugin(name, superclasses=None):
         superclasses = (Plugin,)
     return import_module(plugin_fqname, superclasses)
 
+
+def resolve_plugin_triggers(plugin_classes, commons):
+    """Check the enablement triggers of many plugins at once, so that when
+    each plugin checks if it is enabled its triggers are already resolved.
+
+    The files, packages, commands, kernel modules and services that enable
+    any of the plugins are gathered together, and each distinct trigger is
+    checked once, in a single pass per type of trigger: one listing of each
+    directory on the PATH for all commands, one lookup in the set of loaded
+    kernel modules for each module, and so on. The results are recorded in
+    the predicate cache shared by the plugins of the run.
+
+    Container triggers, and the triggers of plugins that override
+    check_enabled(), are still checked by each plugin as needed.
+
+    :param plugin_classes:  The plugin classes that will check if they are
+                            enabled
+    :type plugin_classes:   ``list``
+
+    :param commons:         The commons the plugins will be created with
+    :type commons:          ``dict``
+    """
+    triggers = {
+        'files': set(), 'packages': set(), 'commands': set(),
+        'kernel_mods': set(), 'services': set()
+    }
+    for plugin_class in plugin_classes:
+        for trigger, items in triggers.items():
+            _items = getattr(plugin_class, trigger, ())
+            if isinstance(_items, str):
+                _items = [_items]
+            # SCL triggers are templates, filled in for each SCL
+            items.update(i for i in _items if '%(' not in i)
+
+    sysroot = commons['sysroot']
+    policy = commons['policy']
+    loaded_mods = set(getattr(policy, 'kernel_mods', ()))
+    results = {
+        'files': {f: bool(path_exists(f, sysroot))
+                  for f in triggers['files']},
+        'packages': policy.package_manager.are_installed(
+            sorted(triggers['packages'])
+        ),
+        'commands': are_executable(triggers['commands'], sysroot),
+        'kernel_mods': {m: m in loaded_mods for m in triggers['kernel_mods']},
+        'services': {s: policy.init_system.is_service(s)
+                     for s in triggers['services']}
+    }
+    commons['predicate_cache'].update({
+        ('%s_trigger' % trigger, item, sysroot): result
+        for trigger, _results in results.items()
+        for item, result in _results.items()
+    })
+
 # vim: set et ts=4 sw=4 :
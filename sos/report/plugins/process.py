@@ -96,8 +96,7 @@ class Process(Plugin, IndependentPlugin):
                 pfile.write('Package manager not configured for path queries')
                 return
             _ps = self.exec_cmd('ps --no-headers aex')
-            pidpkg = {}
-            paths = {}
+            pidpaths = {}
             if not _ps['status'] == 0:
                 pfile.write(f"Unable to get process list: {_ps['output']}")
                 return
@@ -107,9 +106,14 @@ class Process(Plugin, IndependentPlugin):
                 path = proc[4]
                 if not self.path_exists(path):
                     continue
-                if path not in paths:
-                    paths[path] = self.policy.package_manager.pkg_by_path(path)
-                pidpkg[pid] = {'path': path, 'package': paths[path]}
+                pidpaths[pid] = path
+            paths = self.policy.package_manager.pkgs_by_paths(
+                set(pidpaths.values())
+            )
+            pidpkg = {
+                pid: {'path': path, 'package': paths[path]}
+                for pid, path in pidpaths.items()
+            }
 
             pfile.write(json.dumps(pidpkg, indent=4))
 
@@ -51,6 +51,7 @@ class Rpm(Plugin, RedHatPlugin):
 
         if self.get_option("rpmva"):
             self.plugin_timeout = 1000
+            self.collect_cost = 600
             self.add_cmd_output("rpm -Va", root_symlink="rpm-Va",
                                 timeout=900, priority=100,
                                 tags=['rpm_va', 'rpm_V', 'rpm_v',
@@ -0,0 +1,172 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import contextlib
+import os
+import threading
+import time
+
+from sos import __version__
+
+PROFILE_PATH = 'sos_reports/profile.json'
+
+
+class Profiler():
+    """Records how long the phases of a run take, along with the setup,
+    collection and post-processing of each plugin and the commands,
+    predicates and archive writes within them, so that it can be seen where
+    the time of a run is spent.
+
+    Times are taken from a monotonic clock, and are exported in the Chrome
+    trace event format, which can be loaded by chrome://tracing or Perfetto.
+    Each item is recorded on the thread that ran it, so concurrent plugins
+    and commands are shown side by side.
+
+    A profiler that is not enabled records nothing, and its methods return
+    as soon as possible so that they may be called unconditionally.
+
+    :param enabled:     Whether to record anything
+    :type enabled:      ``bool``
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+
+    @contextlib.contextmanager
+    def span(self, name, cat, **args):
+        """Record the time taken by the body of a with statement.
+
+        :param name:    The name of the item, e.g. a plugin or command
+        :type name:     ``str``
+
+        :param cat:     The type of item, e.g. 'collect' or 'command'
+        :type cat:      ``str``
+
+        :param args:    Details to record with the item. Values are only
+                        converted to strings if the profiler is enabled
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, cat, start, **args)
+
+    def add(self, name, cat, start, end=None, **args):
+        """Record an item that started, and optionally ended, at the given
+        times of time.monotonic().
+
+        :param name:    The name of the item
+        :type name:     ``str``
+
+        :param cat:     The type of item
+        :type cat:      ``str``
+
+        :param start:   When the item started
+        :type start:    ``float``
+
+        :param end:     When the item ended, if not now
+        :type end:      ``float``
+        """
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.monotonic()
+        thread = threading.current_thread()
+        event = {
+            'name': str(name),
+            'cat': cat,
+            'ph': 'X',
+            'ts': round((start - self._origin) * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': {k: str(v) for k, v in args.items()}
+        }
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def get_trace(self):
+        """Get the recorded items as a Chrome trace.
+
+        :returns:   The trace, ready to be written as JSON
+        :rtype:     ``dict``
+        """
+        with self._lock:
+            names = [{
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': os.getpid(),
+                'tid': ident,
+                'args': {'name': name}
+            } for ident, name in self._threads.items()]
+            return {
+                'traceEvents': names + list(self.events),
+                'displayTimeUnit': 'ms',
+                'otherData': {'version': __version__}
+            }
+
+    def get_slowest(self, count=10):
+        """Get the items that took longest.
+
+        :param count:   The number of items to get
+        :type count:    ``int``
+
+        :returns:   The slowest items, as (seconds, type, name) tuples
+        :rtype:     ``list``
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e['dur'],
+                            reverse=True)[:count]
+        return [(e['dur'] / 1e6, e['cat'], e['name']) for e in events]
+
+    def get_totals(self):
+        """Get the total time taken by, and the number of, the items of each
+        type. Items of the same type may overlap, so a total may exceed the
+        run time.
+
+        :returns:   (seconds, number of items) tuples by type
+        :rtype:     ``dict``
+        """
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                _dur, _count = totals.get(event['cat'], (0, 0))
+                totals[event['cat']] = (_dur + event['dur'] / 1e6, _count + 1)
+        return totals
+
+    def get_summary(self, count=10):
+        """Get a table of the slowest items and the totals of each type of
+        item, for display to the user.
+
+        :param count:   The number of items to list
+        :type count:    ``int``
+
+        :returns:   The lines of the table
+        :rtype:     ``list``
+        """
+        lines = [" Slowest %d items:" % count, "",
+                 "  %10s  %-10s %s" % ("Time (s)", "Type", "Name")]
+        for dur, cat, name in self.get_slowest(count):
+            lines.append("  %10.3f  %-10s %s" % (dur, cat, name))
+        lines.extend(["", " Totals by type:", "",
+                      "  %10s  %-10s %s" % ("Time (s)", "Type", "Items")])
+        totals = sorted(self.get_totals().items(), key=lambda t: t[1][0],
+                        reverse=True)
+        for cat, (dur, _count) in totals:
+            lines.append("  %10.3f  %-10s %d" % (dur, cat, _count))
+        return lines
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,309 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+import json
+import os
+import re
+import tarfile
+
+from concurrent.futures import FIRST_COMPLETED, wait
+from heapq import heappop, heappush
+
+MANIFEST_PATH = 'sos_reports/manifest.json'
+
+# str() of a datetime.timedelta, as written to the manifest
+_RUN_TIME_RE = re.compile(
+    r'^(?:(?P<days>-?\d+) days?, )?(?P<hours>\d+):(?P<minutes>\d{2}):'
+    r'(?P<seconds>\d{2}(?:\.\d+)?)$'
+)
+
+
+def parse_run_time(run_time):
+    """Convert a run time recorded in a manifest to seconds.
+
+    :param run_time:    The run time as written to the manifest, e.g.
+                        '0:01:23.456789'
+    :type run_time:     ``str``
+
+    :returns:   The run time in seconds, or None if it could not be parsed
+    :rtype:     ``float`` or ``None``
+    """
+    if isinstance(run_time, (int, float)):
+        return float(run_time)
+    match = _RUN_TIME_RE.match(str(run_time).strip())
+    if not match:
+        return None
+    return (int(match.group('days') or 0) * 86400 +
+            int(match.group('hours')) * 3600 +
+            int(match.group('minutes')) * 60 +
+            float(match.group('seconds')))
+
+
+def _walk_sizes(root):
+    sizes = {}
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            _path = os.path.join(dirpath, name)
+            try:
+                sizes[os.path.relpath(_path, root)] = os.lstat(_path).st_size
+            except OSError:
+                continue
+    return sizes
+
+
+def _read_report(path, sizes=False):
+    """Read the manifest of a previous report, and if `sizes` is set the size
+    of each file in the report by its path relative to the report root. Sizes
+    are not available when given only a manifest.json file.
+    """
+    root = None
+    if os.path.isdir(path):
+        for _path in (os.path.join(path, MANIFEST_PATH),
+                      os.path.join(path, 'manifest.json')):
+            if os.path.isfile(_path):
+                root = path if _path.endswith(MANIFEST_PATH) else None
+                path = _path
+                break
+    if tarfile.is_tarfile(path):
+        manifest = None
+        file_sizes = {}
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                if manifest is None and member.name.endswith(MANIFEST_PATH):
+                    manifest = json.load(tar.extractfile(member))
+                    if not sizes:
+                        break
+                if sizes:
+                    # strip the name of the report's top level directory
+                    _name = member.name.split('/', 1)[-1]
+                    file_sizes[_name] = member.size
+        if manifest is None:
+            raise ValueError("no manifest found in %s" % path)
+        return manifest, file_sizes
+    with open(path, 'r') as manifest:
+        manifest = json.load(manifest)
+    if sizes and root:
+        return manifest, _walk_sizes(root)
+    return manifest, {}
+
+
+def _get_manifest_plugins(manifest, path):
+    try:
+        return manifest['components']['report']['plugins']
+    except (KeyError, TypeError):
+        raise ValueError("%s is not the manifest of an sos report" % path)
+
+
+def load_plugin_run_times(paths):
+    """Load the run times of plugins from the manifests of previous reports.
+
+    Each path may be a manifest.json file, an extracted report, or a report
+    archive that is not encrypted. If a plugin was run in more than one of
+    the given reports, the average of its run times is used.
+
+    :param paths:   The paths to load run times from
+    :type paths:    ``list``
+
+    :returns:   A dict of plugin names to run times in seconds
+    :rtype:     ``dict``
+
+    :raises:    ``OSError`` or ``ValueError`` if a path cannot be read
+    """
+    times = {}
+    for path in paths:
+        manifest, _ = _read_report(path)
+        plugins = _get_manifest_plugins(manifest, path)
+        for plugname, plug in plugins.items():
+            run_time = parse_run_time(plug.get('run_time', ''))
+            if run_time is not None:
+                times.setdefault(plugname, []).append(run_time)
+    return {name: sum(_times) / len(_times) for name, _times in times.items()}
+
+
+def load_command_sizes(paths):
+    """Load the sizes of the output of commands from previous reports, for
+    estimating the size of a report without running the commands again.
+
+    Each path may be an extracted report, or a report archive that is not
+    encrypted; a manifest.json file on its own records no sizes. Commands
+    that could not be run are recorded with no output. If a command was run
+    in more than one of the given reports, the largest of its sizes is used.
+
+    :param paths:   The paths to load command sizes from
+    :type paths:    ``list``
+
+    :returns:   A dict of command lines to output sizes in bytes
+    :rtype:     ``dict``
+
+    :raises:    ``OSError`` or ``ValueError`` if a path cannot be read
+    """
+    cmd_sizes = {}
+    for path in paths:
+        manifest, file_sizes = _read_report(path, sizes=True)
+        plugins = _get_manifest_plugins(manifest, path)
+        for plug in plugins.values():
+            for cmd in plug.get('commands', []):
+                _exec = cmd.get('exec')
+                if cmd.get('return_code') in (126, 127):
+                    size = 0
+                elif cmd.get('filepath') in file_sizes:
+                    size = file_sizes[cmd['filepath']]
+                else:
+                    continue
+                cmd_sizes[_exec] = max(size, cmd_sizes.get(_exec, 0))
+    return cmd_sizes
+
+
+class PluginScheduler():
+    """Decides the order in which plugins are collected, so that the slowest
+    plugins are not left to be started last.
+
+    Plugins are ranked by their own expected cost plus the highest rank of
+    any plugin that must wait for them, and whenever a thread is free the
+    highest ranked plugin whose dependencies have all been collected is
+    started. Without dependencies this is a longest job first ordering.
+    Plugins of the same rank are started in the order they were given.
+
+    :param plugins:     The names of the plugins to collect, in load order
+    :type plugins:      ``list``
+
+    :param costs:       The expected cost, in seconds, of each plugin
+    :type costs:        ``dict``
+
+    :param deps:        The names of plugins that must be collected before
+                        each plugin. Plugins that are not in `plugins` are
+                        ignored
+    :type deps:         ``dict``
+
+    :param log:         A logger to report ignored dependencies to
+    :type log:          ``logging.Logger``
+    """
+
+    def __init__(self, plugins, costs=None, deps=None, log=None):
+        self.plugins = list(plugins)
+        self.costs = costs or {}
+        self.log = log
+        self.deps = self._check_deps(deps or {})
+        self.dependents = self._get_dependents()
+        self.ranks = self._get_ranks()
+
+    def _check_deps(self, deps):
+        """Drop dependencies on plugins that are not being collected, and any
+        dependency that would form a cycle.
+        """
+        plugins = set(self.plugins)
+        checked = {}
+        visiting = set()
+
+        def _visit(name):
+            visiting.add(name)
+            checked[name] = []
+            for dep in deps.get(name, ()):
+                if dep not in plugins or dep == name or dep in checked[name]:
+                    continue
+                if dep in visiting:
+                    if self.log:
+                        self.log.warning("ignoring dependency of plugin %s on"
+                                         " %s, which forms a cycle"
+                                         % (name, dep))
+                    continue
+                if dep not in checked:
+                    _visit(dep)
+                checked[name].append(dep)
+            visiting.discard(name)
+
+        for name in self.plugins:
+            if name not in checked:
+                _visit(name)
+        return checked
+
+    def _get_dependents(self):
+        dependents = {name: [] for name in self.plugins}
+        for name in self.plugins:
+            for dep in self.deps[name]:
+                dependents[dep].append(name)
+        return dependents
+
+    def _get_ranks(self):
+        ranks = {}
+
+        def _rank(name):
+            if name not in ranks:
+                ranks[name] = self.costs.get(name, 0) + max(
+                    [_rank(d) for d in self.dependents[name]] or [0]
+                )
+            return ranks[name]
+
+        for name in self.plugins:
+            _rank(name)
+        return ranks
+
+    def _start_ready(self, ready, names):
+        for name in names:
+            self._remaining[name] -= 1
+            if not self._remaining[name]:
+                heappush(ready,
+                         (-self.ranks[name], self._index[name], name))
+
+    @property
+    def order(self):
+        """The order plugins would be started in with a single thread"""
+        order = []
+        ready = self._init_ready()
+        while ready:
+            _, _, name = heappop(ready)
+            order.append(name)
+            self._start_ready(ready, self.dependents[name])
+        return order
+
+    def _init_ready(self):
+        self._index = {name: idx for idx, name in enumerate(self.plugins)}
+        self._remaining = {name: len(self.deps[name]) + 1
+                           for name in self.plugins}
+        ready = []
+        self._start_ready(ready, self.plugins)
+        return ready
+
+    def run(self, executor, func, args, slots):
+        """Collect plugins using an executor, starting no more than `slots`
+        plugins at once so that each free thread is given the highest ranked
+        plugin that is ready to run.
+
+        :param executor:    The executor to submit plugins to
+        :type executor:     ``concurrent.futures.Executor``
+
+        :param func:        The function to call to collect a plugin
+        :type func:         ``callable``
+
+        :param args:        The argument to pass to `func` for each plugin,
+                            in the same order as the plugins
+        :type args:         ``list``
+
+        :param slots:       The number of plugins to run at the same time
+        :type slots:        ``int``
+
+        :returns:   The results of `func`, in the order plugins finished
+        :rtype:     ``list``
+        """
+        ready = self._init_ready()
+        running = {}
+        results = []
+        while ready or running:
+            while ready and len(running) < max(slots, 1):
+                _, idx, name = heappop(ready)
+                running[executor.submit(func, args[idx])] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results.append(future.result())
+                self._start_ready(ready, self.dependents[name])
+        return results
+
+# vim: set et ts=4 sw=4 :
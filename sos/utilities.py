@@ -8,43 +8,71 @@
 
 import os
 import re
+import stat
 import inspect
-from subprocess import Popen, PIPE, STDOUT
+from subprocess import Popen, PIPE, STDOUT, TimeoutExpired
 import logging
 import fnmatch
 import errno
+import fcntl
 import shlex
 import glob
 import tempfile
 import threading
-import time
 import io
+import selectors
 from contextlib import closing
-from collections import deque
-
-try:
-    from pkg_resources import parse_version as version_parse
-except SyntaxError:
-    from packaging.version import parse as version_parse
-
-# try loading magic>=0.4.20 which implements detect_from_filename method
-magic_mod = False
-try:
-    import magic
-    magic.detect_from_filename(__file__)
-    magic_mod = True
-except (ImportError, AttributeError):
-    log = logging.getLogger('sos')
-    from textwrap import fill
-    msg = ("""\
+
+# python-magic, requests and the version parser are slow to import and only
+# needed by some components, so are imported when first used
+_magic = None
+_requests = None
+
+
+def _load_magic():
+    """Load magic>=0.4.20, which implements the detect_from_filename method,
+    the first time it is needed.
+
+    :returns:   The magic module, or False if it is not available
+    """
+    global _magic
+    if _magic is None:
+        try:
+            import magic
+            magic.detect_from_filename(__file__)
+            _magic = magic
+        except (ImportError, AttributeError):
+            _magic = False
+            log = logging.getLogger('sos')
+            from textwrap import fill
+            msg = ("""\
 WARNING: Failed to load 'magic' module version >= 0.4.20 which sos aims to \
 use for detecting binary files. A less effective method will be used. It is \
 recommended to install proper python3-magic package with the module.
 """)
-    log.warning('\n' + fill(msg, 72, replace_whitespace=False) + '\n')
+            log.warning('\n' + fill(msg, 72, replace_whitespace=False) + '\n')
+    return _magic
+
+
+def load_requests():
+    """Load the requests module the first time it is needed, e.g. for an
+    upload.
+
+    :returns:   The requests module, or False if it cannot be imported
+    """
+    global _requests
+    if _requests is None:
+        try:
+            import requests
+            _requests = requests
+        except ImportError:
+            _requests = False
+    return _requests
 
 
 TIMEOUT_DEFAULT = 300
+# how often, in seconds, a poller is checked while waiting on a command
+POLLER_INTERVAL = 0.5
 
 
 def tail(filename, number_of_bytes):
@@ -95,7 +123,8 @@ def file_is_binary(fname):
     :returns:   True if binary, else False
     :rtype:     ``bool``
     """
-    if magic_mod:
+    magic = _load_magic()
+    if magic:
         try:
             _ftup = magic.detect_from_filename(fname)
             _mimes = ['text/', 'inode/']
@@ -163,6 +192,49 @@ def is_executable(command, sysroot=None):
     return any(os.access(path, os.X_OK) for path in candidates)
 
 
+def are_executable(commands, sysroot=None):
+    """Check which of several commands match an executable on the PATH, as
+    is_executable() does for each, but listing each directory on the PATH
+    once rather than checking every directory for every command.
+
+    :param commands:    The commands to check
+    :type commands:     ``list``
+
+    :param sysroot:     The sysroot to also check the PATH within
+    :type sysroot:      ``str``
+
+    :returns:   Whether each command is executable
+    :rtype:     ``dict``
+    """
+    results = {}
+    names = set()
+    for command in commands:
+        if os.sep in command:
+            results[command] = is_executable(command, sysroot)
+        else:
+            names.add(command)
+    if not names:
+        return results
+
+    paths = os.environ.get("PATH", "").split(os.path.pathsep)
+    if sysroot:
+        paths += [os.path.join(sysroot, p.lstrip('/')) for p in paths]
+    found = set()
+    for path in paths:
+        try:
+            entries = set(os.listdir(path or os.curdir))
+        except OSError:
+            continue
+        found.update(name for name in names.intersection(entries)
+                     if os.access(os.path.join(path, name), os.X_OK))
+
+    for name in names:
+        results[name] = name in found or os.access(name, os.X_OK) or bool(
+            sysroot and os.access(os.path.join(sysroot, name), os.X_OK)
+        )
+    return results
+
+
 def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                            chroot=None, chdir=None, env=None, foreground=False,
                            binary=False, sizelimit=None, poller=None,
@@ -180,11 +252,13 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
         if (chdir):
             os.chdir(chdir)
 
-    def _check_poller(proc):
-        if poller() or proc.poll() == 124:
-            proc.terminate()
-            raise SoSTimeoutError
-        time.sleep(0.01)
+    def _wait_with_poller(proc, wait):
+        # wait() returns as soon as what it waits for is done, so the
+        # poller only needs checking each time it times out
+        while not wait(POLLER_INTERVAL):
+            if poller() or proc.poll() == 124:
+                proc.terminate()
+                raise SoSTimeoutError
 
     cmd_env = os.environ.copy()
     # ensure consistent locale for collected command output
@@ -232,28 +306,26 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
             reader = FakeReader(p, binary)
 
         if poller:
-            while reader.running:
-                _check_poller(p)
-        else:
-            try:
-                # override timeout=0 to timeout=None, as Popen will treat the
-                # former as a literal 0-second timeout
-                p.wait(timeout if timeout else None)
-            except Exception:
-                p.terminate()
-                if to_file:
-                    _output.close()
-                # until we separate timeouts from the `timeout` command
-                # handle per-cmd timeouts via Plugin status checks
-                reader.running = False
-                return {'status': 124, 'output': reader.get_contents(),
-                        'truncated': reader.is_full}
+            _wait_with_poller(p, reader.wait)
+        # override timeout=0 to timeout=None, as Popen will treat the
+        # former as a literal 0-second timeout
+        elif not wait_for_process(p, timeout if timeout else None):
+            p.terminate()
+            if to_file:
+                _output.close()
+            # until we separate timeouts from the `timeout` command
+            # handle per-cmd timeouts via Plugin status checks
+            reader.stop()
+            return {'status': 124, 'output': reader.get_contents(),
+                    'truncated': reader.is_full}
         if to_file:
             _output.close()
 
         # wait for Popen to set the returncode
-        while p.poll() is None:
-            pass
+        if poller:
+            _wait_with_poller(p, lambda t: wait_for_process(p, t))
+        else:
+            p.wait()
 
         stdout = reader.get_contents()
         truncated = reader.is_full
@@ -276,6 +348,45 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
     }
 
 
+def wait_for_process(proc, timeout=None):
+    """Wait for a process to exit, returning as soon as it does.
+
+    Popen.wait() with a timeout sleeps between checks of the process, so where
+    possible wait on a pidfd for the process instead.
+
+    :param proc:    The process to wait for
+    :type proc:     ``subprocess.Popen``
+
+    :param timeout: How long to wait, in seconds, or None to wait forever
+    :type timeout:  ``int`` or ``float``
+
+    :returns:   True if the process exited, else False if timeout was hit
+    :rtype:     ``bool``
+    """
+    if timeout is None:
+        proc.wait()
+        return True
+    if proc.poll() is not None:
+        return True
+    try:
+        # the process is not reaped until poll() or wait() see it exit, so
+        # its pid cannot have been reused here
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        try:
+            proc.wait(timeout)
+            return True
+        except TimeoutExpired:
+            return False
+    try:
+        with selectors.DefaultSelector() as sel:
+            sel.register(pidfd, selectors.EVENT_READ)
+            sel.select(timeout)
+    finally:
+        os.close(pidfd)
+    return proc.poll() is not None
+
+
 def import_module(module_fqname, superclasses=None):
     """Imports the module module_fqname and returns a list of defined classes
     from that module. If superclasses is defined then the classes returned will
@@ -416,6 +527,10 @@ def recursive_dict_values_by_key(dobj, keys=[]):
 def parse_version(version):
     """Parse the version string
     """
+    try:
+        from pkg_resources import parse_version as version_parse
+    except SyntaxError:
+        from packaging.version import parse as version_parse
     return version_parse(version)
 
 
@@ -440,66 +555,143 @@ class FakeReader():
     def running(self):
         return self.process.poll() is None
 
+    def wait(self, timeout=None):
+        """Wait for the process writing to disk to exit"""
+        return wait_for_process(self.process, timeout)
+
+    def stop(self):
+        pass
+
 
 class AsyncReader(threading.Thread):
     """Used to limit command output to a given size without deadlocking
     sos.
 
     Takes a sizelimit value in MB, and will compile stdout from Popen into a
-    string that is limited to the given sizelimit.
+    string that is limited to the last sizelimit bytes of output.
     """
 
+    # read size to use if the capacity of the pipe cannot be determined
+    default_chunksize = 65536
+
     def __init__(self, channel, sizelimit, binary):
         super(AsyncReader, self).__init__()
         self.chan = channel
         self.binary = binary
-        self.chunksize = 2048
-        self.slots = None
+        self.chunksize = self._get_chunksize(channel)
+        self.sizelimit = None
         if sizelimit:
-            sizelimit = sizelimit * 1048576  # convert to bytes
-            self.slots = int(sizelimit / self.chunksize)
-        self.deque = deque(maxlen=self.slots)
-        self.running = True
+            self.sizelimit = int(sizelimit * 1048576)  # convert to bytes
+        # output is appended to the buffer until it reaches sizelimit, after
+        # which the buffer is used as a ring with the oldest output at _pos
+        self._buffer = bytearray()
+        self._pos = 0
+        self._total = 0
+        self._lock = threading.Lock()
+        self.done = threading.Event()
         self.start()
 
+    def _get_chunksize(self, channel):
+        """Read up to the full capacity of the pipe at once"""
+        try:
+            _size = fcntl.fcntl(channel.fileno(),
+                                getattr(fcntl, 'F_GETPIPE_SZ', 1032))
+            return max(_size, self.default_chunksize)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            return self.default_chunksize
+
+    def _read(self):
+        _read1 = getattr(self.chan, 'read1', None)
+        if _read1:
+            # return whatever is available, rather than waiting to fill a
+            # whole chunk
+            return _read1(self.chunksize)
+        return self.chan.read(self.chunksize)
+
     def run(self):
         """Reads from the channel (pipe) that is the output pipe for a
         called Popen. As we are reading from the pipe, the output is added
-        to a deque. After the size of the deque exceeds the sizelimit
-        earlier (older) entries are removed.
-
-        This means the returned output is chunksize-sensitive, but is not
-        really byte-sensitive.
+        to a buffer. Once the buffer reaches the sizelimit, the oldest output
+        is overwritten so that the last sizelimit bytes are kept.
         """
         try:
             while True:
-                line = self.chan.read(self.chunksize)
-                if not line:
+                data = self._read()
+                if not data:
                     # Pipe can remain open after output has completed
                     break
-                self.deque.append(line)
+                self._append(data)
         except (ValueError, IOError):
             # pipe has closed, meaning command output is done
             pass
-        self.running = False
+        self.done.set()
+
+    def _append(self, data):
+        with self._lock:
+            self._total += len(data)
+            if self.sizelimit is None:
+                self._buffer += data
+                return
+            data = memoryview(data)
+            _free = self.sizelimit - len(self._buffer)
+            if _free > 0:
+                self._buffer += data[:_free]
+                data = data[_free:]
+            if not data:
+                return
+            if len(data) >= self.sizelimit:
+                self._buffer[:] = data[-self.sizelimit:]
+                self._pos = 0
+                return
+            _end = self._pos + len(data)
+            if _end <= self.sizelimit:
+                self._buffer[self._pos:_end] = data
+            else:
+                _split = self.sizelimit - self._pos
+                self._buffer[self._pos:] = data[:_split]
+                self._buffer[:_end - self.sizelimit] = data[_split:]
+            self._pos = _end % self.sizelimit
+
+    @property
+    def running(self):
+        return not self.done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for all command output to be read.
+
+        :returns:   True once output is complete, else False if timeout was hit
+        """
+        return self.done.wait(timeout)
+
+    def stop(self):
+        """Stop waiting for further output, so that what has been read so
+        far can be returned by get_contents()
+        """
+        self.done.set()
 
     def get_contents(self):
-        """Returns the contents of the deque as a string"""
+        """Returns the contents of the buffer as a string"""
         # block until command completes or timesout (separate from the plugin
         # hitting a timeout)
-        while self.running:
-            time.sleep(0.01)
-        if not self.binary:
-            return ''.join(ln.decode('utf-8', 'ignore') for ln in self.deque)
-        else:
-            return b''.join(ln for ln in self.deque)
+        self.wait()
+        with self._lock:
+            if self._pos:
+                # put the oldest output first
+                self._buffer[:] = (self._buffer[self._pos:] +
+                                   self._buffer[:self._pos])
+                self._pos = 0
+            if not self.binary:
+                return self._buffer.decode('utf-8', 'ignore')
+            return bytes(self._buffer)
 
     @property
     def is_full(self):
-        """Checks if the deque is full, implying that output was truncated"""
-        if not self.slots:
+        """Checks if more output was read than the sizelimit, meaning that
+        output was truncated
+        """
+        if not self.sizelimit:
             return False
-        return len(self.deque) == self.slots
+        return self._total > self.sizelimit
 
 
 class ImporterHelper(object):
@@ -574,6 +766,139 @@ class TempFileUtil():
         self.files = []
 
 
+class StatCache():
+    """A cache of stat results for paths that are looked at more than once
+    during a run, for example when a file found while expanding a copyspec
+    is later checked against size limits and --since, and finally copied.
+
+    Directories listed via ``scandir()`` keep the ``os.DirEntry`` of each
+    entry, so that the file type is known without a stat call, and the stat
+    result fetched by any later check is shared with every other check. Any
+    other path is stat'ed on first use.
+
+    Cached results are kept until ``forget()`` is called for a path, or the
+    cache is cleared.
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    def scandir(self, path):
+        """List a directory, caching an entry for each path within it.
+
+        :param path:    The directory to list
+        :type path:     ``str``
+
+        :returns:       The entries of the directory
+        :rtype:         ``list`` of ``os.DirEntry``
+
+        :raises:        ``OSError`` if the directory cannot be listed
+        """
+        with os.scandir(path) as it:
+            entries = list(it)
+        for entry in entries:
+            self._cache[entry.path] = entry
+        return entries
+
+    def stat(self, path, follow_symlinks=True):
+        """Get the stat result for a path, as ``os.stat()`` or ``os.lstat()``
+        would, if `follow_symlinks` is False.
+
+        :param path:            The path to stat
+        :type path:             ``str``
+
+        :param follow_symlinks: Stat the target of `path` if it is a symlink
+        :type follow_symlinks:  ``bool``
+
+        :returns:       The stat result, or None if `path` cannot be stat'ed
+        :rtype:         ``os.stat_result`` or ``None``
+        """
+        cached = self._cache.get(path)
+        try:
+            if isinstance(cached, os.DirEntry):
+                return cached.stat(follow_symlinks=follow_symlinks)
+            if cached is None:
+                cached = os.lstat(path)
+                self._cache[path] = cached
+            if follow_symlinks and stat.S_ISLNK(cached.st_mode):
+                return os.stat(path)
+            return cached
+        except OSError:
+            return None
+
+    def forget(self, path):
+        """Drop any cached result for a path, e.g. once it has been copied"""
+        self._cache.pop(path, None)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class PredicateCache():
+    """A cache of the results of the individual checks made by predicates,
+    such as whether a service is running or what a command outputs, so that
+    each distinct check is made once per run however many plugins and
+    commands use a predicate that includes it.
+
+    Results are keyed by a tuple, conventionally of the type of check, the
+    item checked and the sysroot it was checked against. If several threads
+    ask for the same uncached result, the check is made by one of them and
+    the others wait for its result. A check that raises an exception is not
+    cached.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key, func, *args):
+        """Get the cached result for a check, making the check first if it
+        has not been made before.
+
+        :param key:     The key of the result
+        :type key:      ``tuple``
+
+        :param func:    Called with `args` to make the check
+        :type func:     ``callable``
+
+        :returns:   The result of the check
+        """
+        try:
+            return self._results[key]
+        except KeyError:
+            pass
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._results:
+                self._results[key] = func(*args)
+        return self._results[key]
+
+    def update(self, results):
+        """Record the results of checks that were made elsewhere, e.g. for
+        many items at once, so that later calls to get() for them do not
+        make the checks again. Results that are already cached are kept.
+
+        :param results: The results of the checks, by key
+        :type results:  ``dict``
+        """
+        with self._lock:
+            for key, result in results.items():
+                self._results.setdefault(key, result)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._locks.clear()
+
+
 class SoSTimeoutError(OSError):
     pass
 
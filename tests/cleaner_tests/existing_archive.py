@@ -108,3 +108,28 @@ class ExistingArchiveCleanTmpTest(StageTwoReportTest):
         """
         self.assertTrue(self.archive.startswith(os.getenv('AVOCADO_TESTS_COMMON_TMPDIR')))
 
+
+class ExistingArchiveParallelFilesCleanTest(StageTwoReportTest):
+    """Ensure that obfuscating the files of an archive in worker processes
+    still obfuscates consistently
+
+    :avocado: tags=stagetwo
+    """
+
+    sos_cmd = '-v --parallel-files -j 4 tests/test_data/%s.tar.xz' % ARCHIVE
+    sos_component = 'clean'
+
+    def test_workers_used(self):
+        with open(os.path.join(self.tmpdir, '%s-obfuscation.log' % ARCHIVE), 'r') as log:
+            assert 'using 4 worker processes' in log.read(), "Worker processes not used"
+
+    def test_hostname_not_in_any_file(self):
+        content = self.grep_for_content('cleanertest')
+        if content:
+            self.fail("Hostname appears in files: %s"
+                      % "\n".join(f for f in content))
+
+    def test_ip_not_in_any_file(self):
+        content = self.grep_for_content('10.0.0.15')
+        if content:
+            self.fail("IP appears in files: %s" % "\n".join(f for f in content))
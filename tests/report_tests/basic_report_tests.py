@@ -116,3 +116,22 @@ class DisabledCollectionsReport(StageOneReportTest):
     def test_skip_commands_working(self):
         self.assertFileGlobNotInArchive('sos_commands/*/journalctl*')
 
+
+
+class StreamArchiveReport(StageOneReportTest):
+    """
+    :avocado: tags=stageone
+    """
+
+    sos_cmd = '-o kernel,pam,host --stream-archive'
+
+    def test_archive_streamed(self):
+        self.assertSosLogContains('streaming archive content')
+
+    def test_streamed_files_collected(self):
+        self.assertFileCollected('/etc/pam.d/login')
+        self.assertFileCollected('/etc/security/limits.conf')
+
+    def test_staged_files_collected(self):
+        self.assertFileCollected('sos_commands/kernel/uname_-a')
+        self.assertFileCollected('sos_reports/manifest.json')
@@ -6,12 +6,17 @@
 #
 # See the LICENSE file in the source distribution for further information.
 import unittest
+import gzip
+import io
 import os
 import tarfile
 import tempfile
+import threading
 import shutil
 
-from sos.archive import TarFileArchive
+from unittest.mock import patch
+
+from sos.archive import ParallelCompressor, TarFileArchive
 from sos.utilities import tail
 from sos.policies import Policy
 
@@ -113,6 +118,148 @@ class TarFileArchiveTest(unittest.TestCase):
     def test_compress(self):
         self.tf.finalize("auto")
 
+    def test_compress_parallel(self):
+        enc = {'encrypt': False}
+        tf = TarFileArchive('parallel', self.tmpdir, Policy(), 4, enc, '/')
+        tf._get_compression_threads = lambda: 4
+        tf.add_string('this is content', 'tests/string_test.txt')
+        for method in ['xz', 'gzip']:
+            self.assertEqual(tf.get_compression_method(method),
+                             '%s-parallel' % method)
+        arc = tf.finalize('gzip')
+        self.assertTrue(arc.endswith('parallel.tar.gz'))
+        rtf = tarfile.open(arc)
+        self.assertEqual(
+            rtf.extractfile('parallel/tests/string_test.txt').read(),
+            b'this is content'
+        )
+        rtf.close()
+
+    def test_stream_archive(self):
+        self.tf.start_stream('auto', {'tests/unittests/juju'})
+        self.tf.add_file('tests/unittests/test.txt', stream=True)
+        self.tf.add_file('tests/unittests/tail_test.txt')
+        self.tf.add_file('tests/unittests/juju/juju_cluster_tests.py',
+                         stream=True)
+        # streamed files are only written to the final archive
+        self.assertFalse(os.path.exists(
+            self.tf.dest_path('tests/unittests/test.txt')))
+        self.assertTrue(os.path.exists(
+            self.tf.dest_path('tests/unittests/juju/juju_cluster_tests.py')))
+        # but are still treated as being present
+        self.assertIsNone(
+            self.tf.check_path('tests/unittests/test.txt', 'file'))
+        self.tf.finalize('auto')
+
+        self.check_for_file('test/tests/unittests/test.txt')
+        self.check_for_file('test/tests/unittests/tail_test.txt')
+        self.check_for_file('test/tests/unittests/juju/juju_cluster_tests.py')
+
+    @unittest.skipUnless(os.path.isfile('/sys/kernel/address_bits'),
+                         "requires sysfs")
+    def test_stream_archive_sysroot(self):
+        # sysfs files report a size of a page, whatever their content
+        sysroot = os.path.join(self.tmpdir, 'host')
+        os.makedirs(sysroot)
+        os.symlink('/sys', os.path.join(sysroot, 'sys'))
+        src = os.path.join(sysroot, 'sys/kernel/address_bits')
+        tf = TarFileArchive('sysroot', self.tmpdir, Policy(), 1,
+                            {'encrypt': False}, sysroot)
+        tf.start_stream('auto')
+        tf.add_file(src, dest='sys/kernel/address_bits', stream=True)
+        # it is copied to the archive root rather than streamed
+        self.assertTrue(
+            os.path.exists(tf.dest_path('sys/kernel/address_bits')))
+        arc = tf.finalize('auto')
+        with tarfile.open(arc) as rtf, open(src, 'rb') as sfile:
+            self.assertEqual(
+                rtf.extractfile('sysroot/sys/kernel/address_bits').read(),
+                sfile.read()
+            )
+
+    def test_copy_file_methods(self):
+        src = 'tests/unittests/tail_test.txt'
+        dest = self.tf.dest_path(src)
+        self.tf.check_path(src, 'file')
+        with open(src, 'rb') as sfile:
+            content = sfile.read()
+        src_st = os.stat(src)
+        # try each fallback in turn, by marking the faster ones as failed
+        for failed in ([], ['_no_reflink'], ['_no_reflink', '_no_copy_range']):
+            for attr in failed:
+                getattr(self.tf, attr).add(src_st.st_dev)
+            self.tf._copy_file(src, dest)
+            with open(dest, 'rb') as dfile:
+                self.assertEqual(dfile.read(), content)
+            dest_st = os.stat(dest)
+            self.assertEqual(dest_st.st_mtime_ns, src_st.st_mtime_ns)
+            self.assertEqual(dest_st.st_mode, src_st.st_mode)
+
+    def test_copy_file_kernel_copies_nothing(self):
+        # as cross file system copy_file_range() does for files whose
+        # reported size is 0 on some kernels
+        src = 'tests/unittests/tail_test.txt'
+        dest = self.tf.dest_path(src)
+        self.tf.check_path(src, 'file')
+        self.tf._no_reflink.add(os.stat(src).st_dev)
+        with patch('os.copy_file_range', return_value=0), \
+                patch('os.sendfile', return_value=0):
+            self.tf._copy_file(src, dest)
+        with open(src, 'rb') as sfile, open(dest, 'rb') as dfile:
+            self.assertEqual(dfile.read(), sfile.read())
+
+    def test_is_pseudo_file(self):
+        tf = TarFileArchive('sysroot', self.tmpdir, Policy(), 1,
+                            {'encrypt': False}, '/host/')
+        self.assertTrue(tf._is_pseudo_file('/host/sys/kernel/address_bits'))
+        self.assertTrue(tf._is_pseudo_file('/host/proc/cpuinfo'))
+        self.assertTrue(tf._is_pseudo_file('/proc/cpuinfo'))
+        self.assertFalse(tf._is_pseudo_file('/host/etc/sys/proc'))
+
+    def test_copy_file_special(self):
+        fifo = os.path.join(self.tmpdir, 'fifo')
+        os.mkfifo(fifo)
+        self.tf.add_file(fifo)
+        self.assertFalse(os.path.exists(self.tf.dest_path(fifo)))
+
+    def test_concurrent_writes(self):
+        test_txt = 'tests/unittests/test.txt'
+        tail_txt = 'tests/unittests/tail_test.txt'
+        dest = self.tf.dest_path(test_txt)
+        # hold the write lock of one file as if a large copy was under way
+        lock = threading.Lock()
+        self.tf._write_lock = lambda path: (
+            lock if path == dest else threading.Lock()
+        )
+        lock.acquire()
+        writer = threading.Thread(target=self.tf.add_file, args=(test_txt,))
+        writer.start()
+        while dest not in self.tf._pending_paths:
+            writer.join(0.01)
+        # other paths can be added meanwhile, and the pending path is skipped
+        self.tf.add_file(tail_txt)
+        self.assertTrue(os.path.exists(self.tf.dest_path(tail_txt)))
+        self.assertIsNone(self.tf.check_path(test_txt, 'file'))
+        self.assertFalse(os.path.exists(dest))
+        lock.release()
+        writer.join()
+        self.assertFalse(self.tf._pending_paths)
+        self.assertTrue(os.path.exists(dest))
+
+
+class ParallelCompressorTest(unittest.TestCase):
+
+    def test_multiple_streams(self):
+        out = io.BytesIO()
+        pc = ParallelCompressor(out, gzip.compress, 2, 10)
+        data = b''.join(b'line %d\n' % i for i in range(100))
+        for i in range(0, len(data), 7):
+            pc.write(data[i:i + 7])
+        pc.close()
+        self.assertEqual(gzip.decompress(out.getvalue()), data)
+        # each block is its own gzip member
+        self.assertGreater(out.getvalue().count(b'\x1f\x8b\x08'), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
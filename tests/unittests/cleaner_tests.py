@@ -6,6 +6,9 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from ipaddress import ip_interface
@@ -20,10 +23,13 @@ from sos.cleaner.mappings.mac_map import SoSMacMap
 from sos.cleaner.mappings.hostname_map import SoSHostnameMap
 from sos.cleaner.mappings.keyword_map import SoSKeywordMap
 from sos.cleaner.mappings.ipv6_map import SoSIPv6Map
+from sos.cleaner.mappings.matcher import SoSItemMatcher
+from sos.cleaner.mappings.map_store import SoSMapIndex, SoSMapStore
 from sos.cleaner.preppers import SoSPrepper
 from sos.cleaner.preppers.hostname import HostnamePrepper
 from sos.cleaner.preppers.ip import IPPrepper
-from sos.cleaner.archives.sos import SoSReportArchive
+from sos.cleaner.archives.sos import (SoSReportArchive,
+                                      SoSCollectorDirectory)
 from sos.options import SoSOptions
 
 class CleanerMapTests(unittest.TestCase):
@@ -150,6 +156,139 @@ class CleanerMapTests(unittest.TestCase):
         self.assertTrue(len(set(_nets)) == len(_nets), "Duplicate global network obfuscations produced")
         self.assertTrue(_nets[-1].startswith('54'), "First hextet of global network obfuscation over 256 not expected '54'")
 
+class CleanerMatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = SoSItemMatcher()
+        for item in ['foo', 'foobar', 'barfoo', 'Example']:
+            self.matcher.add(item)
+
+    def test_matcher_case_insensitive(self):
+        _test = self.matcher.sub('an EXAMPLE line', lambda x: 'X')
+        self.assertEqual(_test, ('an X line', 1))
+
+    def test_matcher_longest_item_first(self):
+        _test = self.matcher.sub('xfoobarfoo', lambda x: '<%s>' % x)
+        self.assertEqual(_test, ('x<foobar><foo>', 2))
+
+    def test_matcher_shorter_item_at_same_start(self):
+        self.matcher.add('fo')
+        self.matcher.add('obarfoo')
+        _test = self.matcher.sub('foobarfoo', lambda x: '<%s>' % x)
+        self.assertEqual(_test, ('<fo><obarfoo>', 2))
+
+    def test_matcher_add_after_compile(self):
+        self.matcher.compile()
+        self.matcher.add('foobarfoo')
+        _test = self.matcher.sub('foobarfoo', lambda x: '<%s>' % x)
+        self.assertEqual(_test, ('<foobarfoo>', 1))
+
+    def test_matcher_char_patterns(self):
+        _matcher = SoSItemMatcher(char_patterns={'.': '[._]'})
+        _matcher.add('host.example.com')
+        _test = _matcher.find('host_example_com')
+        self.assertEqual(_test, [(0, 16, 'host.example.com')])
+
+    def test_matcher_long_item(self):
+        _item = 'y' * 1000
+        self.matcher.add(_item)
+        self.matcher.add(_item[:500])
+        self.matcher.compile()
+        _test = self.matcher.sub('a %sz b' % _item, lambda x: 'X')
+        self.assertEqual(_test, ('a Xz b', 1))
+
+    def test_matcher_char_pattern_shares_node(self):
+        # '_' may follow both the '.' and '_' edges of the same trie node
+        _matcher = SoSItemMatcher(char_patterns={'.': '[._]'})
+        _matcher.add('foo.example.com')
+        _matcher.add('foo_bar.example.com')
+        _test = _matcher.find('foo_example_com foo_bar_example_com')
+        self.assertEqual(_test, [(0, 15, 'foo.example.com'),
+                                 (16, 35, 'foo_bar.example.com')])
+
+
+class CleanerMapStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.map_file = os.path.join(self.tmpdir.name, 'mapping')
+        with open(self.map_file, 'w') as mf:
+            mf.write('{}')
+        self.index = SoSMapIndex(self.map_file)
+        self.index.build({
+            'ip_map': {'10.0.0.1/24': '100.0.0.1/24', '10.0.1.1': '100.0.1.1'},
+            'ipv6_map': {'version': 1, 'networks': {}}
+        })
+        self.db = os.path.join(self.tmpdir.name, 'run.db')
+        self.index.copy_to(self.db)
+        self.store = SoSMapStore(self.db, 'ip_map')
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_index_current(self):
+        self.assertTrue(self.index.is_current())
+        with open(self.map_file, 'w') as mf:
+            mf.write('{"ip_map": {}}')
+        self.assertFalse(self.index.is_current())
+
+    def test_index_sections(self):
+        self.assertEqual(self.index.load_sections(),
+                         {'ipv6_map': {'version': 1, 'networks': {}}})
+
+    def test_store_lookups(self):
+        self.assertEqual(self.store['10.0.1.1'], '100.0.1.1')
+        self.assertTrue('100.0.1.1' in self.store.values())
+        self.assertFalse('10.0.1.1' in self.store.values())
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(list(self.store.items_with_prefix('10.0.0')),
+                         [('10.0.0.1/24', '100.0.0.1/24')])
+
+    def test_store_keeps_order(self):
+        self.store['10.0.2.1'] = '100.0.2.1'
+        self.store['10.0.0.1/24'] = '100.0.0.2/24'
+        self.assertEqual(list(self.store),
+                         ['10.0.0.1/24', '10.0.1.1', '10.0.2.1'])
+
+    def test_private_store(self):
+        self.store.make_private()
+        self.store['10.0.2.1'] = '100.0.2.1'
+        self.assertEqual(len(self.store), 3)
+        _other = SoSMapStore(self.db, 'ip_map')
+        self.assertFalse('10.0.2.1' in _other)
+        _other.close()
+
+    def test_store_items_within(self):
+        self.store['10.0.0.1'] = '100.0.0.3'
+        self.store.make_private()
+        self.store['0.0.1'] = '100.0.0.4'
+        self.assertEqual(self.store.items_within('x10.0.0.1/24'),
+                         ['10.0.0.1/24', '10.0.0.1', '0.0.1'])
+        self.assertEqual(self.store.items_within('192.168.0.1'), [])
+        _map = SoSIPMap()
+        _map.dataset = self.store
+        self.assertEqual(_map.items_within('10.0.0.1 10.0.1.1'),
+                         ['10.0.1.1', '10.0.0.1', '0.0.1'])
+
+    def test_hostname_map_with_store(self):
+        _store = SoSMapStore(self.db, 'hostname_map')
+        _map = SoSHostnameMap()
+        _map.dataset = _store
+        _map.add('example.com')
+        _host = _map.get('foo.example.com')
+        self.assertNotEqual(_host, 'foo.example.com')
+        self.assertEqual(_map.get('bar-foo.example.com'), 'bar-' + _host)
+        self.assertEqual(_map.get('www.foo.example.com'), 'www.' + _host)
+        _store.close()
+
+    def test_ip_map_with_store(self):
+        _map = SoSIPMap()
+        _map.dataset = self.store
+        self.assertEqual(_map.get('10.0.0.1'), '100.0.0.1')
+        self.assertEqual(_map.get('100.0.1.1'), '100.0.1.1')
+
+
 class CleanerParserTests(unittest.TestCase):
 
     def setUp(self):
@@ -165,6 +304,15 @@ class CleanerParserTests(unittest.TestCase):
         self.uname_parser = SoSUsernameParser(config={})
         self.uname_parser.mapping.add('DOMAIN\myusername')
 
+    def test_hostname_parser_char_pattern_shares_node(self):
+        _parser = SoSHostnameParser(config={})
+        _parser.mapping.add('foo.example.com')
+        _parser.mapping.add('foo_bar.example.com')
+        _parser.generate_item_regexes()
+        _test = _parser.parse_line('a foo_example_com b foo.example.com c')[0]
+        self.assertNotIn('foo', _test)
+        self.assertNotIn('example', _test)
+
     def test_ip_parser_valid_ipv4_line(self):
         line = 'foobar foo 10.0.0.1/24 barfoo bar'
         _test = self.ip_parser.parse_line(line)[0]
@@ -246,6 +394,23 @@ class CleanerParserTests(unittest.TestCase):
         _test = self.kw_parser.parse_line(line)[0]
         self.assertNotEqual(line, _test)
 
+    def test_keyword_parser_long_keyword(self):
+        _keyword = 'k' * 1000
+        _parser = SoSKeywordParser(config={})
+        _parser.mapping.add(_keyword)
+        _parser.generate_item_regexes()
+        _test = _parser.parse_line('a %s b' % _keyword)[0]
+        self.assertNotIn(_keyword, _test)
+
+    def test_keyword_parser_may_match_block(self):
+        block = 'first line\nthis is my FOOBAR test line\nlast line\n'
+        self.assertTrue(self.kw_parser.may_match(block))
+        self.assertFalse(self.kw_parser_none.may_match(block))
+
+    def test_ip_parser_may_match_block(self):
+        self.assertTrue(self.ip_parser.may_match('foo\nbar 10.0.0.1/24\n'))
+        self.assertFalse(self.ip_parser.may_match('foo\nbar baz\n'))
+
     def test_keyword_parser_no_change_by_default(self):
         line = 'this is my foobar test line'
         _test = self.kw_parser_none.parse_line(line)[0]
@@ -281,6 +446,28 @@ class CleanerParserTests(unittest.TestCase):
         self.assertNotEqual(line, _test)
 
 
+class CleanerArchiveTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.collect_dir = os.path.join(self.tmpdir, 'sos-collector-test')
+        os.makedirs(self.collect_dir)
+        with open(os.path.join(self.collect_dir,
+                               'sosreport-node0.tar.xz.sha256'), 'w') as f:
+            f.write('checksum\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_nested_archives_unreadable_report(self):
+        archive = SoSCollectorDirectory(self.collect_dir, self.tmpdir)
+        self.assertEqual(archive.get_nested_archives(), [])
+        with open(os.path.join(self.collect_dir,
+                               'sosreport-node1.tar.zst'), 'wb') as f:
+            f.write(b'\x28\xb5\x2f\xfd not a tarball')
+        self.assertRaises(Exception, archive.get_nested_archives)
+
+
 class PrepperTests(unittest.TestCase):
     """
     Ensure that the translations for different parser/mapping methods are
@@ -0,0 +1,70 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+SOS_BIN = os.path.join(ROOT, 'bin', 'sos')
+
+# modules that only some subcommands, or only some uses of a subcommand, need
+DEFERRED = ['sos.cleaner', 'sos.collector', 'sos.help', 'pexpect',
+            'requests', 'magic', 'pkg_resources', 'pdb']
+
+
+def get_import_times(*args):
+    """Run sos under python -X importtime, returning the cumulative import
+    time in microseconds of each module imported. Modules imported directly
+    by importlib.import_module(), such as the subcommands, are not reported
+    but their submodules are.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', SOS_BIN] +
+                          list(args), cwd=ROOT, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            # the header line
+            continue
+    return times
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def assertNotImported(self, times, modules):
+        imported = [mod for mod in times
+                    if any(mod == m or mod.startswith(m + '.')
+                           for m in modules)]
+        self.assertFalse(imported, "unexpectedly imported, total %sus: %s"
+                         % (times.get('sos'), ', '.join(imported)))
+
+    def test_report_imports(self):
+        times = get_import_times('report', '--help')
+        self.assertIn('sos.report.plugins', times)
+        self.assertNotImported(times, DEFERRED)
+
+    def test_clean_imports(self):
+        times = get_import_times('clean', '--help')
+        self.assertIn('sos.cleaner.preppers', times)
+        self.assertNotImported(times, ['sos.collector', 'sos.help',
+                                       'pexpect', 'requests'])
+
+    def test_usage_imports_all(self):
+        times = get_import_times('--help')
+        for mod in ('sos.report.plugins', 'sos.cleaner.preppers'):
+            self.assertIn(mod, times)
+
+
+# vim: set et ts=4 sw=4 :
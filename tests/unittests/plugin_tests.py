@@ -13,10 +13,12 @@ import random
 
 from io import StringIO
 
-from sos.report.plugins import Plugin, regex_findall, _mangle_command, PluginOpt
+from sos.report.plugins import (Plugin, regex_findall, _mangle_command,
+                                PluginOpt, resolve_plugin_triggers)
 from sos.archive import TarFileArchive
 from sos.policies.distros import LinuxPolicy
 from sos.policies.init_systems import InitSystem
+from sos.utilities import PredicateCache
 from string import ascii_lowercase
 
 PATH = os.path.dirname(__file__)
@@ -45,7 +47,7 @@ class MockArchive(TarFileArchive):
     def name(self):
         return "mock.archive"
 
-    def add_file(self, src, dest=None, force=False):
+    def add_file(self, src, dest=None, force=False, stream=False):
         if not dest:
             dest = src
         self.m[src] = dest
@@ -108,6 +110,18 @@ class ForbiddenMockPlugin(Plugin):
         self.add_forbidden_path("tests")
 
 
+class CmdMockPlugin(Plugin):
+
+    plugin_name = "cmdmock"
+
+    def setup(self):
+        for i in range(6):
+            self.add_cmd_output("sh -c 'sleep 0.%d; echo %d'" % (6 - i, i),
+                                suggest_filename="cmd%d" % i,
+                                priority=1 if i < 4 else 5)
+        self.add_cmd_output("echo barrier", changes=True, priority=1)
+
+
 class EnablerPlugin(Plugin):
 
     def is_installed(self, pkg):
@@ -124,6 +138,10 @@ class MockOptions(object):
     skip_files = []
     skip_commands = []
     sysroot = None
+    cmd_concurrency = 1
+    cmd_timeout = 300
+    plugin_timeout = 300
+    chroot = 'auto'
 
 
 class PluginToolTests(unittest.TestCase):
@@ -401,6 +419,31 @@ class AddCopySpecTests(unittest.TestCase):
         self.mp.add_copy_spec(['tests/unittests/tail_test.txt', 'tests/unittests/test.txt'], 1)
         self.assertEquals(len(self.mp.copy_paths), 2)
 
+    def test_expand_dir(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for _dir in ('sub/nested', 'empty', 'hidden_only', 'target'):
+                os.makedirs(os.path.join(tmpdir, _dir))
+            for _file in ('top', '.hidden', 'sub/one', 'sub/nested/two',
+                          'sub/.hidden', 'hidden_only/.file', 'target/three'):
+                open(os.path.join(tmpdir, _file), 'w').close()
+            os.symlink('target', os.path.join(tmpdir, 'link'))
+            os.symlink('../target', os.path.join(tmpdir, 'sub', 'link'))
+            self.mp.sysroot = '/'
+            expanded = self.mp._expand_copy_spec(tmpdir)
+            self.assertEqual(sorted(expanded), [
+                os.path.join(tmpdir, _path) for _path in (
+                    'empty', 'link/three', 'sub/link', 'sub/nested/two',
+                    'sub/one', 'target/three', 'top'
+                )
+            ])
+            # entries found during expansion are stat'ed once, then shared
+            self.assertIsNotNone(
+                self.mp.stat_cache.stat(os.path.join(tmpdir, 'top'))
+            )
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 class CheckEnabledTests(unittest.TestCase):
 
@@ -430,6 +473,20 @@ class CheckEnabledTests(unittest.TestCase):
     def test_enabled_by_default(self):
         self.assertTrue(self.mp.check_enabled())
 
+    def test_resolved_triggers(self):
+        commons = dict(self.mp.commons, predicate_cache=PredicateCache())
+
+        class TriggeredPlugin(Plugin):
+            files = ('/sos-no-such-file',)
+            commands = ('true',)
+
+        resolve_plugin_triggers([TriggeredPlugin], commons)
+        self.assertEqual(len(commons['predicate_cache']), 2)
+        plugin = TriggeredPlugin(commons)
+        # the file trigger is not checked again
+        plugin.path_exists = None
+        self.assertTrue(plugin.check_enabled())
+
 
 class RegexSubTests(unittest.TestCase):
 
@@ -464,6 +521,115 @@ class RegexSubTests(unittest.TestCase):
         self.assertEquals(1, replacements)
         self.assertTrue("foobar" in self.mp.archive.m.get(j('tail_test.txt')))
 
+    def test_deferred_replacements(self):
+        self.mp.sysroot = '/'
+        self.mp.add_copy_spec(j("tail_test.txt"))
+        self.mp.collect_plugin()
+        writes = []
+        add_string = self.mp.archive.add_string
+        self.mp.archive.add_string = lambda *args: (
+            writes.append(args[1]), add_string(*args))
+        self.mp.defer_file_subs()
+        self.assertEquals(0, self.mp.do_file_sub(
+            j("tail_test.txt"), r"(tail)", "foobar"))
+        self.mp.do_path_regex_sub(r".*tail_test.txt", r"(foo)bar", r"\1")
+        self.mp.do_file_sub(j("tail_test.txt"), r"wont_match", "foobar")
+        self.assertEquals([], writes)
+        counts = self.mp.apply_file_subs()
+        self.assertEquals([[1, 1, 0]], list(counts.values()))
+        self.assertEquals([j('tail_test.txt')], writes)
+        content = self.mp.archive.m.get(j('tail_test.txt'))
+        self.assertTrue("foo" in content and "foobar" not in content)
+
+
+class CmdConcurrencyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.mp = CmdMockPlugin({
+            'cmdlineopts': MockOptions(),
+            'policy': LinuxPolicy(init=InitSystem(), probe_runtime=False),
+            'sysroot': '/',
+            'cmddir': 'sos_commands',
+            'devices': {}
+        })
+        self.mp.archive = MockArchive()
+        self.mp.archive._tmp_dir = self.tmpdir
+        self.mp.archive._archive_root = self.tmpdir
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def collect(self, concurrency):
+        self.mp.commons['cmdlineopts'].cmd_concurrency = concurrency
+        self.mp.setup()
+        self.mp._collect_cmds()
+        return [
+            (c['cmd'], c['file']) for c in self.mp.executed_commands
+        ], dict(self.mp.archive.m)
+
+    def test_cmd_concurrency_default(self):
+        self.assertEqual(self.mp.cmd_concurrency, 1)
+
+    def test_cmd_concurrency_keeps_order(self):
+        serial = self.collect(1)
+        self.mp.collect_cmds = []
+        self.mp.executed_commands = []
+        self.mp.archive.m = {}
+        self.assertEqual(self.collect(4), serial)
+        self.assertEqual(
+            [c[0] for c in serial[0]],
+            ["sh -c 'sleep 0.%d; echo %d'" % (6 - i, i) for i in range(4)] +
+            ['echo barrier'] +
+            ["sh -c 'sleep 0.%d; echo %d'" % (6 - i, i) for i in (4, 5)]
+        )
+        self.assertEqual(serial[1]['sos_commands/cmdmock/cmd0'], '0\n')
+
+    def test_cmd_concurrency_class_override(self):
+        class SerialCmdMockPlugin(CmdMockPlugin):
+            cmd_concurrency = 1
+
+        self.mp.commons['cmdlineopts'].cmd_concurrency = 4
+        self.assertEqual(self.mp.cmd_concurrency, 4)
+        mp = SerialCmdMockPlugin(self.mp.commons)
+        self.assertEqual(mp.cmd_concurrency, 1)
+
+
+class EstimateSizeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, 'sub'))
+        for _file, size in (('one', 100), ('sub/two', 50)):
+            with open(os.path.join(self.tmpdir, _file), 'w') as f:
+                f.write('x' * size)
+        os.symlink('one', os.path.join(self.tmpdir, 'link'))
+        self.mp = MockPlugin({
+            'cmdlineopts': MockOptions(),
+            'policy': LinuxPolicy(init=InitSystem(), probe_runtime=False),
+            'sysroot': '/',
+            'cmddir': 'sos_commands',
+            'devices': {}
+        })
+        self.mp.archive = MockArchive()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_estimate_size(self):
+        # the file below the copied directory is only counted once
+        self.mp.add_copy_spec([self.tmpdir,
+                               os.path.join(self.tmpdir, 'one')])
+        self.mp.add_string_as_file('abc', 'string')
+        self.mp.add_cmd_output('echo hello')
+        self.mp.add_cmd_output('echo barrier', changes=True)
+        self.assertEqual(self.mp.estimate_size(), 150 + 3 + 6)
+        self.assertEqual(self.mp.estimate_size({'echo hello': 1000}),
+                         150 + 3 + 1000)
+        # nothing is collected
+        self.assertEqual(self.mp.archive.m, {})
+        self.assertEqual(self.mp.executed_commands, [])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -5,13 +5,20 @@
 # version 2 of the GNU General Public License.
 #
 # See the LICENSE file in the source distribution for further information.
+import os
+import re
+import shutil
+import tempfile
 import unittest
 
 from avocado.utils import distro
 
+import sos.policies.cache
+
 from sos.policies import Policy, import_policy
 from sos.policies.distros import LinuxPolicy
 from sos.policies.package_managers import PackageManager, MultiPackageManager
+from sos.policies.init_systems.systemd import SystemdInit
 from sos.policies.package_managers.rpm import RpmPackageManager
 from sos.policies.package_managers.dpkg import DpkgPackageManager
 from sos.report.plugins import (Plugin, IndependentPlugin,
@@ -82,6 +89,32 @@ class PolicyTests(unittest.TestCase):
         self.assertTrue(import_policy('notreal') is None)
 
 
+class SystemdInitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.init = SystemdInit()
+        self.init.services = {
+            name: {'name': name, 'config': 'enabled'}
+            for name in ('sshd', 'crond', 'kdump', 'getty@')
+        }
+
+    def test_parse_service_states(self):
+        self.init.parse_service_states(
+            "sshd.service loaded active running OpenSSH server daemon\n"
+            "kdump.service loaded failed failed Crash recovery kernel arming\n"
+            "getty@tty1.service loaded active running Getty on tty1\n"
+            "sshd.socket loaded inactive dead OpenSSH Server Socket\n"
+        )
+        self.assertTrue(self.init.is_running('sshd'))
+        self.assertFalse(self.init.is_running('kdump'))
+        self.assertEquals(self.init.get_service_status('kdump')['status'],
+                          'failed')
+        self.assertEquals(self.init.get_service_status('crond')['status'],
+                          'inactive')
+        self.assertEquals(self.init.get_service_status('missing')['status'],
+                          'missing')
+
+
 class PackageManagerTests(unittest.TestCase):
 
     def setUp(self):
@@ -101,6 +134,136 @@ class PackageManagerTests(unittest.TestCase):
         self.assertEquals(self.pm.pkg_by_name('foo'), None)
 
 
+class IndexedPackageManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pm = PackageManager()
+        for name in ('python3-foo', 'kernel', 'python3', 'kernel-core',
+                     'python3-bar', 'pythonic'):
+            self.pm._packages[name] = {'name': name}
+
+    def test_all_pkgs_by_name(self):
+        self.assertEquals(self.pm.all_pkgs_by_name('kernel'), ['kernel'])
+        self.assertEquals(self.pm.all_pkgs_by_name('kern'), [])
+        self.assertEquals(self.pm.all_pkgs_by_name('python3-*'),
+                          ['python3-foo', 'python3-bar'])
+        self.assertEquals(self.pm.all_pkgs_by_name('*-core'),
+                          ['kernel-core'])
+        self.assertEquals(self.pm.all_pkgs_by_name('python[3i]*'),
+                          ['python3-foo', 'python3', 'python3-bar',
+                           'pythonic'])
+
+    def test_all_pkgs_by_name_regex(self):
+        self.assertEquals(self.pm.all_pkgs_by_name_regex('python3'),
+                          ['python3-foo', 'python3', 'python3-bar'])
+        self.assertEquals(self.pm.all_pkgs_by_name_regex('python3?-'),
+                          ['python3-foo', 'python3-bar'])
+        self.assertEquals(self.pm.all_pkgs_by_name_regex('pythonx?i'),
+                          ['pythonic'])
+        self.assertEquals(self.pm.all_pkgs_by_name_regex('kernel$|python3$'),
+                          ['kernel', 'python3'])
+        self.assertEquals(self.pm.all_pkgs_by_name_regex('KERNEL-', re.I),
+                          ['kernel-core'])
+
+    def test_packages_added_after_lookup(self):
+        self.assertEquals(self.pm.all_pkgs_by_name('sos*'), [])
+        self.pm._packages['sos'] = {'name': 'sos'}
+        self.assertEquals(self.pm.all_pkgs_by_name('sos*'), ['sos'])
+
+    def test_are_installed(self):
+        self.assertEquals(self.pm.are_installed(['kernel', 'sos', 'py*']),
+                          {'kernel': True, 'sos': False, 'py*': True})
+
+
+class FauxOwnersPackageManager(PackageManager):
+
+    query_path_command = 'query'
+    file_owners_command = 'owners'
+
+    def exec_cmd(self, command, **kwargs):
+        self.commands.append(command)
+        return ("/usr/bin/foo\tfoo-1.0-1.x86_64\n"
+                "/usr/share/doc\tfoo-1.0-1.x86_64\n"
+                "/usr/share/doc\tbar-2.0-1.noarch\n")
+
+
+class FileOwnersTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pm = FauxOwnersPackageManager()
+        self.pm.commands = []
+
+    def test_pkg_by_path(self):
+        self.assertEquals(self.pm.pkg_by_path('/usr/bin/foo'),
+                          ['foo-1.0-1.x86_64'])
+        self.assertEquals(self.pm.pkg_by_path('/usr/share/doc/'),
+                          ['foo-1.0-1.x86_64', 'bar-2.0-1.noarch'])
+        self.assertEquals(self.pm.pkgs_by_paths(['/usr/bin/foo',
+                                                 '/not/owned']),
+                          {'/usr/bin/foo': ['foo-1.0-1.x86_64'],
+                           '/not/owned': 'unknown'})
+        self.assertEquals(self.pm.commands, ['owners'])
+
+
+class DiscoveryCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmpdir, 'db')
+        with open(self.db, 'w') as db:
+            db.write('packages')
+        sos.policies.cache.enable_discovery_cache(
+            os.path.join(self.tmpdir, 'cache')
+        )
+
+    def tearDown(self):
+        sos.policies.cache._discovery_cache = None
+        shutil.rmtree(self.tmpdir)
+
+    def _get_pm(self):
+        pm = FauxOwnersPackageManager()
+        pm.commands = []
+        pm.db_paths = (self.db, )
+        return pm
+
+    def test_load_store(self):
+        cache = sos.policies.cache.get_discovery_cache()
+        self.assertEquals(cache.get('item', [1], lambda: {'a': 1}), {'a': 1})
+        self.assertEquals(cache.load('item', [1]), {'a': 1})
+        self.assertIsNone(cache.load('item', [2]))
+        self.assertIsNone(cache.load('missing', [1]))
+
+    def test_path_stamp_size_only(self):
+        wal = os.path.join(self.tmpdir, 'db-wal')
+        with open(wal, 'w') as db:
+            db.write('log')
+        stamp = sos.policies.cache.path_stamp([self.db], size_only=[wal])
+        os.utime(wal, ns=(0, 0))
+        self.assertEquals(
+            sos.policies.cache.path_stamp([self.db], size_only=[wal]), stamp
+        )
+        with open(wal, 'a') as db:
+            db.write(' changed')
+        self.assertNotEquals(
+            sos.policies.cache.path_stamp([self.db], size_only=[wal]), stamp
+        )
+
+    def test_file_owners_cached(self):
+        pm = self._get_pm()
+        self.assertEquals(pm.pkg_by_path('/usr/bin/foo'),
+                          ['foo-1.0-1.x86_64'])
+        self.assertEquals(pm.commands, ['owners'])
+        pm = self._get_pm()
+        self.assertEquals(pm.pkg_by_path('/usr/bin/foo'),
+                          ['foo-1.0-1.x86_64'])
+        self.assertEquals(pm.commands, [])
+        with open(self.db, 'a') as db:
+            db.write(' changed')
+        pm = self._get_pm()
+        pm.pkg_by_path('/usr/bin/foo')
+        self.assertEquals(pm.commands, ['owners'])
+
+
 class RpmPackageManagerTests(unittest.TestCase):
 
     def setUp(self):
@@ -5,8 +5,14 @@
 # version 2 of the GNU General Public License.
 #
 # See the LICENSE file in the source distribution for further information.
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 
+from concurrent.futures import ThreadPoolExecutor
+
 try:
     import json
 except ImportError:
@@ -14,6 +20,14 @@ except ImportError:
 
 from sos.report.reporting import (Report, Section, Command, CopiedFile,
                                   CreatedFile, Alert, PlainTextReport)
+from sos.report.scheduler import (PluginScheduler, load_plugin_run_times,
+                                  load_command_sizes, parse_run_time)
+from sos.report.plugin_index import PluginIndex
+from sos.policies.cache import DiscoveryCache
+from sos.report.profiler import Profiler
+from sos.report.plugins import (Plugin, RedHatPlugin, DebianPlugin,
+                                IndependentPlugin)
+import sos.report.plugins
 
 
 class ReportTest(unittest.TestCase):
@@ -149,6 +163,192 @@ class TestPlainReport(unittest.TestCase):
             PlainTextReport(self.report).unicode())
 
 
+class PluginSchedulerTest(unittest.TestCase):
+
+    plugins = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+
+    def test_load_order_without_costs(self):
+        self.assertEqual(PluginScheduler(self.plugins).order, self.plugins)
+
+    def test_longest_first(self):
+        sched = PluginScheduler(self.plugins, costs={'delta': 10, 'beta': 5})
+        self.assertEqual(sched.order,
+                         ['delta', 'beta', 'alpha', 'gamma', 'epsilon'])
+
+    def test_dependencies(self):
+        # gamma must wait for alpha, so alpha inherits the cost of gamma
+        sched = PluginScheduler(self.plugins,
+                                costs={'gamma': 10, 'beta': 5, 'alpha': 1},
+                                deps={'gamma': ['alpha', 'missing']})
+        self.assertEqual(sched.deps['gamma'], ['alpha'])
+        self.assertEqual(sched.order,
+                         ['alpha', 'gamma', 'beta', 'delta', 'epsilon'])
+
+    def test_dependency_cycle(self):
+        sched = PluginScheduler(self.plugins,
+                                deps={'alpha': ['beta'], 'beta': ['alpha']})
+        self.assertEqual(sorted(sched.order), sorted(self.plugins))
+
+    def test_run(self):
+        started = []
+        lock = threading.Lock()
+
+        def collect(plugin):
+            with lock:
+                started.append(plugin[1])
+            return plugin[1]
+
+        sched = PluginScheduler(self.plugins, costs={'epsilon': 10},
+                                deps={'alpha': ['delta']})
+        with ThreadPoolExecutor(2) as executor:
+            results = sched.run(executor, collect,
+                                list(enumerate(self.plugins, 1)), 2)
+        self.assertEqual(sorted(results), sorted(self.plugins))
+        self.assertEqual(started[0], 'epsilon')
+        self.assertLess(started.index('delta'), started.index('alpha'))
+
+    def test_parse_run_time(self):
+        self.assertEqual(parse_run_time('0:01:02.500000'), 62.5)
+        self.assertEqual(parse_run_time('1 day, 0:00:01'), 86401)
+        self.assertIsNone(parse_run_time(''))
+
+    def test_load_plugin_run_times(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for i, run_time in enumerate(['0:00:02', '0:00:04']):
+                os.makedirs(os.path.join(tmpdir, str(i), 'sos_reports'))
+                with open(os.path.join(tmpdir, str(i), 'sos_reports',
+                                       'manifest.json'), 'w') as mfile:
+                    json.dump({'components': {'report': {'plugins': {
+                        'alpha': {'run_time': run_time},
+                        'beta': {'run_time': ''}
+                    }}}}, mfile)
+            self.assertEqual(
+                load_plugin_run_times([os.path.join(tmpdir, '0'),
+                                       os.path.join(tmpdir, '1')]),
+                {'alpha': 3.0}
+            )
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_load_command_sizes(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmpdir, 'sos_reports'))
+            os.makedirs(os.path.join(tmpdir, 'sos_commands', 'alpha'))
+            with open(os.path.join(tmpdir, 'sos_commands', 'alpha', 'uname'),
+                      'w') as out:
+                out.write('x' * 42)
+            with open(os.path.join(tmpdir, 'sos_reports', 'manifest.json'),
+                      'w') as mfile:
+                json.dump({'components': {'report': {'plugins': {
+                    'alpha': {'commands': [
+                        {'exec': 'uname -a', 'return_code': 0,
+                         'filepath': 'sos_commands/alpha/uname'},
+                        {'exec': 'missing', 'return_code': 127,
+                         'filepath': None},
+                        {'exec': 'removed', 'return_code': 0,
+                         'filepath': 'sos_commands/alpha/removed'}
+                    ]}
+                }}}}, mfile)
+            self.assertEqual(load_command_sizes([tmpdir]),
+                             {'uname -a': 42, 'missing': 0})
+            # a manifest on its own records no sizes
+            self.assertEqual(
+                load_command_sizes([os.path.join(tmpdir, 'sos_reports',
+                                                 'manifest.json')]),
+                {'missing': 0}
+            )
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class PluginIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = DiscoveryCache(os.path.join(self.tmpdir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _get_index(self):
+        return PluginIndex(sos.report.plugins, Plugin, cache=self.cache)
+
+    def test_get_classes(self):
+        index = self._get_index()
+        self.assertEqual(index.get_classes('dnf', (DebianPlugin, )), [])
+        dnf = index.get_classes('dnf', (RedHatPlugin, IndependentPlugin))
+        self.assertEqual(len(dnf), 1)
+        self.assertEqual(dnf[0]['profiles'], ['system', 'packagemanager',
+                                              'sysmgmt'])
+        self.assertEqual(len(index.get_classes('kernel',
+                                               (IndependentPlugin, ))), 1)
+
+    def test_save(self):
+        index = self._get_index()
+        index.get('kernel')
+        index.save()
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.cache.path, 'sos.report.plugins-index.json')
+        ))
+        index = self._get_index()
+        self.assertIn('kernel', index._modules)
+        index.get('kernel')
+        self.assertFalse(index._changed)
+        index._modules['kernel']['stamp'] = [0, 0]
+        index.get('kernel')
+        self.assertTrue(index._changed)
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_disabled(self):
+        profiler = Profiler()
+        with profiler.span('kernel', 'collect'):
+            pass
+        profiler.add('kernel', 'queue', 0)
+        self.assertEqual(profiler.events, [])
+
+    def test_trace(self):
+        profiler = Profiler(enabled=True)
+        with profiler.span('uname -a', 'command', plugin='kernel'):
+            pass
+
+        def _collect():
+            profiler.add('kernel', 'collect', profiler._origin,
+                         profiler._origin + 2)
+        thread = threading.Thread(target=_collect, name='collector')
+        thread.start()
+        thread.join()
+
+        trace = json.loads(json.dumps(profiler.get_trace()))
+        names = [e['args']['name'] for e in trace['traceEvents']
+                 if e['ph'] == 'M']
+        self.assertEqual(sorted(names), ['MainThread', 'collector'])
+        events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual([e['name'] for e in events], ['uname -a', 'kernel'])
+        self.assertEqual(events[0]['args'], {'plugin': 'kernel'})
+        self.assertEqual(events[1]['ts'], 0)
+        self.assertEqual(events[1]['dur'], 2000000)
+        self.assertNotEqual(events[0]['tid'], events[1]['tid'])
+
+    def test_summary(self):
+        profiler = Profiler(enabled=True)
+        for name, dur in (('kernel', 3), ('host', 1), ('networking', 2)):
+            profiler.add(name, 'collect', 0, dur)
+        profiler.add('uname -a', 'command', 0, 0.5)
+        self.assertEqual(profiler.get_slowest(2),
+                         [(3, 'collect', 'kernel'),
+                          (2, 'collect', 'networking')])
+        self.assertEqual(profiler.get_totals(),
+                         {'collect': (6, 3), 'command': (0.5, 1)})
+        summary = profiler.get_summary(2)
+        self.assertIn("       3.000  collect    kernel", summary)
+        self.assertNotIn("       1.000  collect    host", summary)
+        self.assertIn("       6.000  collect    3", summary)
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -6,13 +6,23 @@
 #
 # See the LICENSE file in the source distribution for further information.
 import os.path
+import stat
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
 # PYCOMPAT
 from io import StringIO
 
-from sos.utilities import (grep, is_executable, sos_get_command_output,
-                           find, tail, shell_out)
+from sos.utilities import (grep, is_executable, are_executable,
+                           sos_get_command_output, find, tail, shell_out,
+                           SoSTimeoutError,
+                           AsyncReader, StatCache, PredicateCache,
+                           load_requests)
+import sos.utilities
 
 TEST_DIR = os.path.dirname(__file__)
 
@@ -64,6 +74,12 @@ class ExecutableTest(unittest.TestCase):
     def test_exe_file_abs_path(self):
         self.assertTrue(is_executable("/usr/bin/timeout"))
 
+    def test_are_executable(self):
+        path = os.path.join(TEST_DIR, 'utility_tests.py')
+        cmds = ['true', '/usr/bin/timeout', path, 'sos-no-such-command']
+        self.assertEqual(are_executable(cmds),
+                         {cmd: is_executable(cmd) for cmd in cmds})
+
     def test_output(self):
         result = sos_get_command_output("echo executed")
         self.assertEquals(result['status'], 0)
@@ -84,6 +100,149 @@ class ExecutableTest(unittest.TestCase):
     def test_shell_out(self):
         self.assertEquals("executed\n", shell_out('echo executed'))
 
+    def test_output_with_poller(self):
+        start = time.monotonic()
+        result = sos_get_command_output("echo executed",
+                                        poller=lambda: False)
+        self.assertEquals(result['output'], "executed\n")
+        # the command finishes without waiting out the poller's interval
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_poller_timeout(self):
+        with self.assertRaises(SoSTimeoutError):
+            sos_get_command_output("sleep 10", poller=lambda: True)
+
+    def test_cmd_timeout(self):
+        result = sos_get_command_output("sleep 10", timeout=1)
+        self.assertEquals(result['status'], 124)
+
+
+class AsyncReaderTest(unittest.TestCase):
+
+    class ChunkedChannel():
+        """Return the content in uneven reads, as a pipe might"""
+
+        def __init__(self, content):
+            self.content = content
+            self.reads = 0
+
+        def read(self, size):
+            self.reads += 1
+            _size = min(size, self.reads % 7 + 1)
+            data, self.content = self.content[:_size], self.content[_size:]
+            return data
+
+    def _read(self, content, sizelimit, binary=False):
+        reader = AsyncReader(self.ChunkedChannel(content), sizelimit, binary)
+        return reader.get_contents(), reader.is_full
+
+    def test_no_limit(self):
+        content = b'abcdefghij' * 100
+        self.assertEqual(self._read(content, None, True), (content, False))
+
+    def test_limit_exact(self):
+        content = b'0123456789' * 10
+        limit = 37 / 1048576
+        for size in range(0, 100):
+            self.assertEqual(self._read(content[:size], limit, True),
+                             (content[max(size - 37, 0):size], size > 37))
+
+    def test_text_output(self):
+        self.assertEqual(self._read(b'line one\nline two\n', 9 / 1048576),
+                         ('line two\n', True))
+
+    def test_command_output_limit(self):
+        result = sos_get_command_output("seq 1 100000", sizelimit=0.001)
+        self.assertTrue(result['truncated'])
+        self.assertEqual(len(result['output']), 1048)
+        self.assertTrue(result['output'].endswith('99999\n100000\n'))
+
+
+class StatCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.file = os.path.join(self.tmpdir, 'file')
+        with open(self.file, 'w') as fobj:
+            fobj.write('content')
+        self.link = os.path.join(self.tmpdir, 'link')
+        os.symlink('file', self.link)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_scandir(self):
+        cache = StatCache()
+        names = sorted(e.name for e in cache.scandir(self.tmpdir))
+        self.assertEqual(names, ['file', 'link'])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stat(self.link).st_size, 7)
+        self.assertTrue(stat.S_ISLNK(
+            cache.stat(self.link, follow_symlinks=False).st_mode
+        ))
+
+    def test_stat_cached_until_forgotten(self):
+        cache = StatCache()
+        self.assertEqual(cache.stat(self.file).st_size, 7)
+        with open(self.file, 'a') as fobj:
+            fobj.write('more')
+        self.assertEqual(cache.stat(self.file).st_size, 7)
+        cache.forget(self.file)
+        self.assertEqual(cache.stat(self.file).st_size, 11)
+
+    def test_stat_missing(self):
+        cache = StatCache()
+        self.assertIsNone(cache.stat(os.path.join(self.tmpdir, 'missing')))
+        os.unlink(self.file)
+        self.assertIsNone(cache.stat(self.link))
+        self.assertIsNotNone(cache.stat(self.link, follow_symlinks=False))
+
+
+class PredicateCacheTest(unittest.TestCase):
+
+    def test_check_made_once(self):
+        cache = PredicateCache()
+        calls = []
+
+        def _check(item):
+            calls.append(item)
+            time.sleep(0.1)
+            return item == 'running'
+
+        threads = [
+            threading.Thread(target=cache.get,
+                             args=(('services', 'running', '/'), _check,
+                                   'running'))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(cache.get(('services', 'running', '/'), _check,
+                                  'running'))
+        self.assertFalse(cache.get(('services', 'stopped', '/'), _check,
+                                   'stopped'))
+        self.assertEqual(calls, ['running', 'stopped'])
+
+    def test_update(self):
+        cache = PredicateCache()
+        cache.get(('kmods', 'foo', '/'), lambda: True)
+        cache.update({('kmods', 'foo', '/'): False,
+                      ('kmods', 'bar', '/'): True})
+        self.assertTrue(cache.get(('kmods', 'foo', '/'), lambda: False))
+        self.assertTrue(cache.get(('kmods', 'bar', '/'), lambda: False))
+
+    def test_exception_not_cached(self):
+        cache = PredicateCache()
+
+        def _fail():
+            raise OSError('failed')
+
+        self.assertRaises(OSError, cache.get, ('cmd', 'foo', '/'), _fail)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get(('cmd', 'foo', '/'), str, 'bar'), 'bar')
+
 
 class FindTest(unittest.TestCase):
 
@@ -99,4 +258,27 @@ class FindTest(unittest.TestCase):
         leaves = find("leaf", TEST_DIR, path_pattern="tests/path")
         self.assertFalse(any(name.endswith("leaf") for name in leaves))
 
+
+class LoadRequestsTest(unittest.TestCase):
+
+    def setUp(self):
+        sos.utilities._requests = None
+        self.requests = sys.modules.get('requests')
+        # a broken install, that is found but fails to import
+        sys.modules['requests'] = None
+
+    def tearDown(self):
+        sos.utilities._requests = None
+        if self.requests is None:
+            sys.modules.pop('requests', None)
+        else:
+            sys.modules['requests'] = self.requests
+
+    def test_import_failure(self):
+        self.assertFalse(load_requests())
+        # the result is cached for the rest of the run
+        del sys.modules['requests']
+        self.assertIs(sos.utilities._requests, False)
+        self.assertFalse(load_requests())
+
 # vim: set et ts=4 sw=4 :